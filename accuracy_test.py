@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+# Differential accuracy test of the f192 operations against mpmath:
+#
+#   python accuracy_test.py                      # 10^5 cases per op
+#   python accuracy_test.py --n 1000000 --out accuracy.json
+#
+# The operands are random f192 numbers with all 128 mantissa bits random,
+# random signs and exponents, mixed with harder cases: nearly equal
+# magnitudes (cancellation in add/sub), large exponent gaps, all-ones and
+# power of two mantissas and zeros. The conversions get random f32/f64 bit
+# patterns (subnormals included) and f192 numbers spanning the whole f64
+# range. Every op runs on a chunk of cases in one kernel, the references are
+# computed once per case with the raw mpf functions of mpmath at PREC bits
+# (the conversions to f32/f64 with exact integer rounding).
+#
+# The error of an f192 result is |result - reference| in units of the last
+# place of the 128 bit mantissa of the reference (2**(floor(log2|ref|) -
+# 127)), computed on whole arrays: the reference is split into its truncated
+# 128 bit mantissa limbs and the fraction of an ulp below them, the limbs
+# are subtracted exactly when the exponents are at most 2 bits apart, in
+# float64 otherwise. The f32/f64 results are compared by the distance of
+# their bit patterns (ulps of the target). The flag word (limb 4 without the
+# sign bit) is counted per bit, the comparisons are counted as mismatches.
+# The exit status is 1 if an op is above its tolerance in TOLERANCE.
+
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+import taichi as ti
+import float192 as ty
+from float192.codec import EXP_BIAS, ZERO_EXP, _unpack_ints, f192_array_to_str
+from mpmath.libmp import (from_man_exp, from_float, mpf_add, mpf_sub, mpf_mul, mpf_div, mpf_neg, mpf_abs,
+                          mpf_shift, mpf_sqrt, mpf_hypot, mpf_cmp, round_nearest, fnan, fone)
+
+PREC = 200
+
+def div(a, b):
+    return mpf_div(a, b, PREC, round_nearest) if b[1] else fnan
+
+def rsqrt(a):
+    return mpf_div(fone, mpf_sqrt(mpf_abs(a), PREC, round_nearest), PREC, round_nearest) if a[1] else fnan
+
+# name: (the operands, the reference on their raw mpf values, ints for u and
+# k), the sqrt of a negative number is the one of its magnitude
+F192_OPS = {'add': ('ab', lambda a, b: mpf_add(a, b, PREC, round_nearest)),
+            'sub': ('ab', lambda a, b: mpf_sub(a, b, PREC, round_nearest)),
+            'mul': ('ab', lambda a, b: mpf_mul(a, b, PREC, round_nearest)),
+            'mul_trunc': ('ab', lambda a, b: mpf_mul(a, b, PREC, round_nearest)),
+            'sqr': ('a', lambda a: mpf_mul(a, a, PREC, round_nearest)),
+            'fma': ('abc', lambda a, b, c: mpf_add(mpf_mul(a, b), c, PREC, round_nearest)),
+            'mul_u32': ('au', lambda a, u: mpf_mul(a, from_man_exp(u, 0), PREC, round_nearest)),
+            'mul_pow2': ('ak', lambda a, k: mpf_shift(a, k)),
+            'neg': ('a', mpf_neg),
+            'div': ('ab', div),
+            'div_f64': ('ab', div),
+            'div_long': ('ab', div),
+            'sqrt': ('a', lambda a: mpf_sqrt(mpf_abs(a), PREC, round_nearest)),
+            'rsqrt': ('a', rsqrt),
+            'hypot': ('ab', lambda a, b: mpf_hypot(a, b, PREC, round_nearest)),
+            'f64_to': ('d', from_float),
+            'f32_to': ('f', from_float)}
+
+# name: (mantissa bits, exponent of the smallest subnormal, largest finite) of the target
+FLOAT_OPS = {'to_f64': (53, -1074, 0x7ff << 52), 'to_f32': (24, -149, 0xff << 23)}
+
+CMP_OPS = {'lt': lambda c: c < 0, 'gt': lambda c: c > 0, 'eq': lambda c: c == 0,
+           'le': lambda c: c <= 0, 'ge': lambda c: c >= 0}
+
+# max error in ulps, for the comparisons the allowed mismatches
+TOLERANCE = {'add': 1, 'sub': 1, 'mul': 1, 'mul_trunc': 8, 'sqr': 1, 'fma': 1, 'mul_u32': 1,
+             'mul_pow2': 0, 'neg': 0, 'div': 4, 'div_f64': 4, 'div_long': 1,
+             'sqrt': 1, 'rsqrt': 1.5, 'hypot': 2.5, 'f64_to': 0, 'f32_to': 0, 'to_f64': 0, 'to_f32': 0,
+             'lt': 0, 'gt': 0, 'eq': 0, 'le': 0, 'ge': 0}
+
+CLASSES = ('random', 'close', 'gap', 'edge')
+
+
+@ti.kernel
+def run_ops(a: ti.types.ndarray(ty.f192_t, 1), b: ti.types.ndarray(ty.f192_t, 1),
+            c: ti.types.ndarray(ty.f192_t, 1), u: ti.types.ndarray(ti.u32, 1),
+            k: ti.types.ndarray(ti.i32, 1), d: ti.types.ndarray(ti.f64, 1),
+            f: ti.types.ndarray(ti.f32, 1), w: ti.types.ndarray(ty.f192_t, 1),
+            res: ti.types.ndarray(ty.f192_t, 2), to_f64: ti.types.ndarray(ti.f64, 1),
+            to_f32: ti.types.ndarray(ti.f32, 1), cmp: ti.types.ndarray(ti.i32, 2)):
+    # the order of F192_OPS and CMP_OPS
+    for i in a:
+        res[0, i] = ty.add_f192(a[i], b[i])
+        res[1, i] = ty.sub_f192(a[i], b[i])
+        res[2, i] = ty.mul_f192(a[i], b[i])
+        res[3, i] = ty.mul_f192_trunc(a[i], b[i])
+        res[4, i] = ty.sqr_f192(a[i])
+        res[5, i] = ty.fma_f192(a[i], b[i], c[i])
+        res[6, i] = ty.mul_f192_u32(a[i], u[i])
+        res[7, i] = ty.mul_f192_pow2(a[i], k[i])
+        res[8, i] = ty.neg_f192(a[i])
+        res[9, i] = ty.div_f192(a[i], b[i])
+        res[10, i] = ty.div_f192_f64(a[i], b[i])
+        res[11, i] = ty.div_f192_long(a[i], b[i])
+        res[12, i] = ty.sqrt_f192(a[i])
+        res[13, i] = ty.rsqrt_f192(a[i])
+        res[14, i] = ty.hypot_f192(a[i], b[i])
+        res[15, i] = ty.f64_to_f192(d[i])
+        res[16, i] = ty.f32_to_f192(f[i])
+        to_f64[i] = ty.f192_to_f64(w[i])
+        to_f32[i] = ty.f192_to_f32(w[i])
+        cmp[0, i] = ty.lt_f192(a[i], b[i])
+        cmp[1, i] = ty.gt_f192(a[i], b[i])
+        cmp[2, i] = ty.eq_f192(a[i], b[i])
+        cmp[3, i] = ty.le_f192(a[i], b[i])
+        cmp[4, i] = ty.ge_f192(a[i], b[i])
+
+
+def random_f192(rng, n, exp_range):
+    ret = np.zeros((n, 6), dtype=np.uint32)
+    ret[:, :4] = rng.integers(0, 2**32, (n, 4), dtype=np.uint64)
+    ret[:, 3] |= 0x80000000
+    ret[:, 4] = rng.integers(0, 2, n)
+    ret[:, 5] = ZERO_EXP + rng.integers(-exp_range, exp_range + 1, n)
+    return ret
+
+def random_float(rng, n, dtype):
+    # random bit patterns without inf and nan, some of them subnormal and zero
+    info = np.finfo(dtype)
+    uint = np.uint64 if info.bits == 64 else np.uint32
+    bits = rng.integers(0, 2**info.bits, n, dtype=np.uint64).astype(uint)
+    exp_mask = uint(((1 << (info.bits - 1)) - 1) & ~((1 << info.nmant) - 1))
+    special = (bits & exp_mask) == exp_mask
+    bits[special] &= ~exp_mask # inf and nan become subnormals
+    bits[::97] &= uint(1) << uint(info.bits - 1) # signed zeros
+    return bits.view(dtype)
+
+def operands(rng, n, exp_range):
+    # the operands of every op by name and the class of every case
+    a, b, c = (random_f192(rng, n, exp_range) for _ in range(3))
+    cls = rng.integers(0, len(CLASSES), n)
+
+    # close: b is a with some of the low bits changed and a random sign
+    close = cls == CLASSES.index('close')
+    low = rng.integers(0, 128, close.sum())
+    mask = np.zeros((close.sum(), 4), dtype=np.uint64)
+    for limb in range(4):
+        mask[:, limb] = np.where(low > 32*limb, (1 << np.clip(low - 32*limb, 0, 32).astype(np.uint64)) - 1, 0)
+    b[close, :4] = a[close, :4] ^ (rng.integers(0, 2**32, (close.sum(), 4), dtype=np.uint64) & mask).astype(np.uint32)
+    b[close, 5] = a[close, 5]
+
+    # gap: exponents 64 to 300 bits apart
+    gap = cls == CLASSES.index('gap')
+    b[gap, 5] = a[gap, 5] - rng.integers(64, 300, gap.sum()) * rng.choice([-1, 1], gap.sum())
+
+    # edge: all-ones and power of two mantissas, zeros
+    edge = np.flatnonzero(cls == CLASSES.index('edge'))
+    for x in (a, b, c):
+        kind = rng.integers(0, 4, edge.size)
+        x[edge[kind == 0], :4] = 0xffffffff
+        x[edge[kind == 1], :4] = [0, 0, 0, 0x80000000]
+        x[edge[kind == 2], :5] = 0
+        x[edge[kind == 2], 5] = ZERO_EXP
+
+    u = rng.integers(0, 2**32, n, dtype=np.uint64).astype(np.uint32)
+    u[edge[:edge.size//4]] = 0
+    k = rng.integers(-300, 301, n).astype(np.int32)
+
+    # the conversions: f64/f32 bit patterns and f192 numbers over the range
+    # of f64 (every other one over the range of f32), subnormals and
+    # overflows included
+    w = random_f192(rng, n, 1100)
+    w[1::2, 5] = ZERO_EXP + rng.integers(-160, 161, n//2)
+    w[edge, :4] = np.where(rng.integers(0, 2, (edge.size, 1)), 0xffffffff, [0, 0, 0, 0x80000000])
+    return dict(a=a, b=b, c=c, u=u, k=k, d=random_float(rng, n, np.float64), f=random_float(rng, n, np.float32), w=w), cls
+
+def to_raw(a):
+    sign, mant, exp = _unpack_ints(a)
+    return np.frompyfunc(lambda s, m, e: from_man_exp(-m if s else m, int(e)), 3, 1)(sign, mant, exp)
+
+def raw_operands(ops):
+    # the mpf arguments of the references: raw mpf for f192 and floats, ints for u and k
+    ret = {name: to_raw(ops[name]) for name in 'abc'}
+    ret.update(u=ops['u'].astype(object), k=ops['k'].astype(object),
+               d=ops['d'].astype(object), f=ops['f'].astype(np.float64).astype(object))
+    return ret
+
+def limbs_of(x, n):
+    # n u32 limbs of an object array of non negative ints as int64, little endian
+    return np.stack([np.asarray((x >> (32*i)) & 0xffffffff, dtype=object).astype(np.int64) for i in range(n)], axis=-1)
+
+def shift_limbs(x, s):
+    # x (int64 u32 limbs) shifted up by s in [0, 2] bits, one limb more
+    x = np.concatenate([x, np.zeros(x.shape[:-1] + (1,), np.int64)], axis=-1)
+    low = np.concatenate([np.zeros(x.shape[:-1] + (1,), np.int64), x[..., :-1]], axis=-1)
+    s = s[..., None]
+    return ((x << s) & 0xffffffff) | (low >> (32 - s))
+
+def to_float(limbs):
+    # value of signed limbs in float64, from the top so that an exact small difference stays exact
+    ret = np.zeros(limbs.shape[:-1])
+    for i in reversed(range(limbs.shape[-1])):
+        ret = ret*2.0**32 + limbs[..., i]
+    return ret
+
+def ulp_errors(res, refs):
+    # |res - refs| in ulps of the 128 bit mantissa of refs, nan where refs is nan or inf
+    rsign, rman, rexp, rbc = (np.array([r[i] for r in refs], dtype=object) for i in range(4))
+    special = (rman == 0) & (rexp != 0)
+    zero = (rman == 0) & ~special
+    bc = np.where(rman == 0, 1, rbc).astype(np.int64)
+
+    # the reference is (H + frac)*2**E with H of 128 bits
+    m256 = rman << (256 - bc).astype(object)
+    H = limbs_of(m256 >> 128, 4)
+    frac = np.asarray((m256 >> 75) & ((1 << 53) - 1), dtype=object).astype(np.float64)*2.0**-53
+    E = rexp.astype(np.int64) + bc - 128
+    sh = np.where(rsign.astype(np.int64) == 1, -1, 1)
+
+    R = res[:, :4].astype(np.int64)
+    e = res[:, 5].astype(np.int64) - EXP_BIAS
+    sr = np.where(res[:, 4] & 1, -1, 1)
+    rzero = ~res[:, :4].any(axis=1)
+
+    # exponents at most 2 bits apart: exact on the limbs aligned to the smaller one
+    d = e - E
+    near = (np.abs(d) <= 2) & ~rzero
+    dn = np.where(near, d, 0)
+    lo = np.minimum(dn, 0)
+    D = to_float(sr[:, None]*shift_limbs(R, dn - lo) - sh[:, None]*shift_limbs(H, -lo)) - sh*frac*2.0**-lo
+    err_near = np.abs(D)*2.0**lo
+
+    # otherwise the error is at least a few ulps and float64 is enough
+    with np.errstate(over='ignore'):
+        err_far = np.abs(sr*np.ldexp(to_float(R), np.clip(d, -2000, 2000)) - sh*(to_float(H) + frac))
+    err_far = np.where(rzero, to_float(H) + frac, err_far)
+
+    err = np.where(near, err_near, err_far)
+    err = np.where(zero, np.where(rzero, 0.0, np.inf), err)
+    return np.where(special, np.nan, err)
+
+def nearest_float(sign, mant, exp, bits, min_exp, inf):
+    # the bit pattern of mant*2**exp rounded to nearest even, in integers only: the process
+    # may run with flush to zero, so python floats would lose the subnormals
+    sign = int(sign) << inf.bit_length()
+    if mant == 0:
+        return sign
+    q = max(mant.bit_length() + exp - bits, min_exp) # exponent of the last place
+    n, s = mant, q - exp
+    if s > 0:
+        n, rem = mant >> s, mant & ((1 << s) - 1)
+        half = 1 << (s - 1)
+        n += rem > half or (rem == half and n & 1)
+    else:
+        n <<= -s
+    mag = ((q - min_exp) << (bits - 1)) + n # the carry of the rounding and the subnormals work out
+    return sign | min(mag, inf)
+
+def float_ulp_errors(res, ref):
+    # distance of the bit patterns, the same on both sides of zero
+    ints = {8: np.int64, 4: np.int32}[res.dtype.itemsize]
+    def key(x):
+        bits = x.view(ints).astype(np.int64)
+        mag = bits & np.int64(np.iinfo(ints).max)
+        return np.where(bits < 0, -mag, mag)
+    return np.abs(key(res) - key(ref)).astype(np.float64)
+
+def check_chunk(ops):
+    n = len(ops['a'])
+    res = np.zeros((len(F192_OPS), n, 6), dtype=np.uint32)
+    to_f64, to_f32 = np.zeros(n, np.float64), np.zeros(n, np.float32)
+    cmp = np.zeros((len(CMP_OPS), n), dtype=np.int32)
+    run_ops(*(ops[x] for x in 'abcukdfw'), res, to_f64, to_f32, cmp)
+
+    raw = raw_operands(ops)
+    errors, flags = {}, {}
+    for (name, (args, ref)), r in zip(F192_OPS.items(), res):
+        refs = np.frompyfunc(ref, len(args), 1)(*(raw[x] for x in args))
+        errors[name] = ulp_errors(r, refs)
+        flags[name] = r[:, 4] & ~np.uint32(1)
+
+    sign, mant, exp = _unpack_ints(ops['w'])
+    for (name, spec), r in zip(FLOAT_OPS.items(), (to_f64, to_f32)):
+        ref = np.frompyfunc(lambda s, m, e: nearest_float(s, m, int(e), *spec), 3, 1)(sign, mant, exp)
+        errors[name] = float_ulp_errors(r, ref.astype(np.uint64).astype(f'u{r.itemsize}').view(r.dtype))
+
+    ref_cmp = np.frompyfunc(mpf_cmp, 2, 1)(raw['a'], raw['b']).astype(np.int64)
+    for (name, ref), r in zip(CMP_OPS.items(), cmp):
+        errors[name] = (r.astype(bool) != ref(ref_cmp)).astype(np.float64)
+    return res, errors, flags
+
+def statistics(errors, flags, cls):
+    ret = {}
+    for name, err in errors.items():
+        valid = ~np.isnan(err) # the divisions by zero have no reference
+        e = err[valid]
+        if name in CMP_OPS:
+            stat = {'mismatches': int(e.sum())}
+        else:
+            stat = {'max ulp': float(e.max()) if e.size else 0.0, 'mean ulp': float(e.mean()) if e.size else 0.0,
+                    'exact': int((e == 0).sum()), '<= 0.5 ulp': int((e <= 0.5).sum()),
+                    '<= 1 ulp': int((e <= 1).sum()), '> 2 ulp': int((e > 2).sum())}
+            f = flags.get(name, np.zeros(0, np.uint32))
+            stat['flags'] = {f'1 << {bit}': int(((f >> np.uint32(bit)) & 1).sum())
+                             for bit in range(1, 32) if np.any((f >> np.uint32(bit)) & 1)}
+        stat['cases'] = int(valid.sum())
+        stat['worst class'] = CLASSES[cls[valid][np.argmax(e)]] if e.size and e.max() > 0 else ''
+        ret[name] = stat
+    return ret
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n', type=int, default=100000, help='cases per op')
+    parser.add_argument('--chunk', type=int, default=1 << 16)
+    parser.add_argument('--exp-range', type=int, default=100, help='spread of the random exponents')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--arch', default='cpu')
+    parser.add_argument('--out', help='save the statistics as JSON')
+    parser.add_argument('--show', type=int, default=0, help='print the operands of the worst cases of every op')
+    args = parser.parse_args()
+
+    ti.init(arch=getattr(ti, args.arch))
+    rng = np.random.default_rng(args.seed)
+    t = time.perf_counter()
+
+    errors = {name: [] for name in (*F192_OPS, *FLOAT_OPS, *CMP_OPS)}
+    flags = {name: [] for name in F192_OPS}
+    inputs, cls = [], []
+    for start in range(0, args.n, args.chunk):
+        ops, cl = operands(rng, min(args.chunk, args.n - start), args.exp_range)
+        _, err, fl = check_chunk(ops)
+        for name in errors:
+            errors[name].append(err[name])
+        for name in flags:
+            flags[name].append(fl[name])
+        cls.append(cl)
+        if args.show:
+            inputs.append(ops)
+
+    errors = {name: np.concatenate(e) for name, e in errors.items()}
+    flags = {name: np.concatenate(f) for name, f in flags.items()}
+    cls = np.concatenate(cls)
+    stats = statistics(errors, flags, cls)
+
+    failed = []
+    for name, s in stats.items():
+        bad = s['mismatches'] if name in CMP_OPS else s['max ulp']
+        if not bad <= TOLERANCE[name]:
+            failed.append(name)
+        if name in CMP_OPS:
+            print(f'{name:10s} {s["mismatches"]:8d} mismatches of {s["cases"]}  {s["worst class"]}')
+        else:
+            print(f'{name:10s} max {s["max ulp"]:10.4g} ulp  mean {s["mean ulp"]:8.4f} ulp  '
+                  f'> 2 ulp: {s["> 2 ulp"]:6d}  flags {s["flags"]}  {s["worst class"]}')
+
+        if args.show:
+            args_of = F192_OPS[name][0] if name in F192_OPS else 'w' if name in FLOAT_OPS else 'ab'
+            x = {arg: np.concatenate([ops[arg] for ops in inputs]) for arg in args_of}
+            e = np.nan_to_num(errors[name], nan=-1)
+            for i in np.argsort(-e)[:args.show]:
+                if e[i] > 0:
+                    print('   ', ', '.join(f192_array_to_str(x[arg][i:i + 1])[0] if arg in 'abcw' else repr(x[arg][i]) 
+                                         for arg in args_of), f'({e[i]:.4g})')
+
+    print(f'{args.n} cases per op in {time.perf_counter() - t:.1f} s')
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'n': args.n, 'seed': args.seed, 'exp_range': args.exp_range, 'prec': PREC,
+                       'tolerance': TOLERANCE, 'statistics': stats}, f, indent=1)
+    if failed:
+        print('above tolerance:', ', '.join(failed))
+        sys.exit(1)
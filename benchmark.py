@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+# CPU benchmarks of float192, the results are saved as JSON so that commits
+# can be compared:
+#
+#   python benchmark.py                               # writes benchmark.json
+#   python benchmark.py --threads 1,2,4 --out new.json
+#   python benchmark.py --compare old.json new.json
+#
+# Every thread count runs in a fresh process (ti.init with
+# cpu_max_num_threads and an empty offline cache, so the first calls measure
+# the compile time). Per thread count:
+#   ops:        M ops/s of the f192 arithmetic, comparisons and conversions,
+#               next to the same kernel in f32 and f64
+#   mandelbrot: M iterations/s of the kernel of mandelbrot_test.py (through
+#               supports_f192) and of the same iteration in f64
+#   compile:    first call time of every kernel in seconds
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+import taichi as ti
+import float192 as ty
+from float192 import supports_f192, f192_t, str_to_f192
+from float192 import i32_to_f192 as f192
+
+
+@ti.func
+def add_step(x, y):
+    return x + y
+
+@ti.func
+def sub_step(x, y):
+    return x - y
+
+@ti.func
+def mul_step(x, y):
+    return x*y
+
+@ti.func
+def div_step(x, y):
+    return x/y
+
+@ti.func
+def lt_step(x, y):
+    return ti.select(x < y, y, x)
+
+@ti.func
+def eq_step(x, y):
+    return ti.select(x == y, y, x)
+
+@ti.func
+def lt_step_f192(x, y):
+    ret = x
+    if ty.lt_f192(x, y):
+        ret = y
+    return ret
+
+@ti.func
+def eq_step_f192(x, y):
+    ret = x
+    if ty.eq_f192(x, y):
+        ret = y
+    return ret
+
+@ti.func
+def f64_step_f192(x, y):
+    return ty.f64_to_f192(ty.f192_to_f64(x) + 1.0)
+
+@ti.func
+def f32_step_f192(x, y):
+    return ty.f32_to_f192(ty.f192_to_f32(x) + 1.0)
+
+@ti.func
+def f64_step(x, y):
+    return ti.cast(ti.cast(x, ti.f32) + 1.0, ti.f64)
+
+@ti.func
+def f32_step(x, y):
+    return ti.cast(ti.cast(x, ti.f64) + 1.0, ti.f32)
+
+# name: (steps for f192, f64, f32, range of the operands), a step is one
+# operation on the running value x and the operand y. The conversion
+# baselines convert to the other float width and back.
+OPS = {'add': (ty.add_f192, add_step, add_step, (0.5, 2.0)),
+       'sub': (ty.sub_f192, sub_step, sub_step, (0.5, 2.0)),
+       'mul': (ty.mul_f192, mul_step, mul_step, (0.999, 1.001)),
+       'div': (ty.div_f192, div_step, div_step, (0.999, 1.001)),
+       'lt': (lt_step_f192, lt_step, lt_step, (0.5, 2.0)),
+       'eq': (eq_step_f192, eq_step, eq_step, (0.5, 2.0)),
+       'f192<->f64': (f64_step_f192, f64_step, f32_step, (0.5, 2.0)),
+       'f192<->f32': (f32_step_f192, f64_step, f32_step, (0.5, 2.0))}
+
+def make_op_kernel(dtype):
+    # reps dependent steps per element, so the compiler can not drop or hoist them
+    @ti.kernel
+    def bench(step: ti.template(), a: ti.types.ndarray(dtype, 1), b: ti.types.ndarray(dtype, 1), reps: ti.i32):
+        for i in a:
+            x = a[i]
+            y = b[i]
+            for _ in range(reps):
+                x = step(x, y)
+            a[i] = x
+    return bench
+
+def timed(f, *args):
+    t = time.perf_counter()
+    f(*args)
+    ti.sync()
+    return time.perf_counter() - t
+
+def bench_ops(n, reps, rng):
+    ops, compile_time, kernels = {}, {}, {}
+    for name, (*steps, (lo, hi)) in OPS.items():
+        ops[name] = {}
+        for dtype_name, dtype, step in zip(('f192', 'f64', 'f32'), (f192_t, ti.f64, ti.f32), steps):
+            a, b = rng.uniform(lo, hi, n), rng.uniform(lo, hi, n)
+            if dtype_name == 'f192':
+                a, b = ty.f64_to_f192_array(a), ty.f64_to_f192_array(b)
+            else:
+                np_dtype = np.float64 if dtype_name == 'f64' else np.float32
+                a, b = a.astype(np_dtype), b.astype(np_dtype)
+
+            kernel = kernels.setdefault(dtype_name, make_op_kernel(dtype))
+            compile_time[f'{name} {dtype_name}'] = timed(kernel, step, a[:1].copy(), b[:1].copy(), 1)
+            ops[name][dtype_name] = n*reps/timed(kernel, step, a, b, reps)/1e6
+        ops[name]['slowdown vs f64'] = ops[name]['f64']/ops[name]['f192']
+    return ops, compile_time
+
+def bench_mandelbrot(m, n, iter_depth):
+    # the kernel of mandelbrot_test.py, also counting the iterations
+    @ti.kernel
+    @supports_f192(globals(), cache=False)
+    def compute(x0: f192_t, y0: f192_t, x1: f192_t, y1: f192_t,
+                img: ti.types.ndarray(ti.i32, 2), iter_depth: ti.int32):
+        x = x1-x0
+        y = y1-y0
+        m, n = img.shape
+        for i, j in ti.ndrange(m, n):
+            cx = x0 + f192(j)/f192(n)*x
+            cy = y0 + f192(i)/f192(m)*y
+            iterations = 0
+            zx = f192(0)
+            zy = f192(0)
+            while zx*zx + zy*zy < f192(4) and iterations < iter_depth:
+                zx, zy = zx*zx - zy*zy + cx, f192(2)*zx*zy + cy
+                iterations += 1
+            img[i, j] = iterations
+
+    @ti.kernel
+    def compute_f64(x0: ti.f64, y0: ti.f64, x1: ti.f64, y1: ti.f64,
+                    img: ti.types.ndarray(ti.i32, 2), iter_depth: ti.int32):
+        m, n = img.shape
+        for i, j in ti.ndrange(m, n):
+            cx = x0 + j/n*(x1-x0)
+            cy = y0 + i/m*(y1-y0)
+            iterations = 0
+            zx, zy = 0.0, 0.0
+            while zx*zx + zy*zy < 4 and iterations < iter_depth:
+                zx, zy = zx*zx - zy*zy + cx, 2*zx*zy + cy
+                iterations += 1
+            img[i, j] = iterations
+
+    corners = ['-0.17032344376207073', '-1.0402289976592387', '-0.1703234437620603', '-1.0402289976592325']
+    ret, compile_time = {}, {}
+    for name, kernel, args in (('f192', compute, [str_to_f192(c) for c in corners]),
+                               ('f64', compute_f64, [float(c) for c in corners])):
+        compile_time[f'mandelbrot {name}'] = timed(kernel, *args, np.zeros((1, 1), np.int32), 1)
+        img = np.zeros((m, n), np.int32)
+        t = timed(kernel, *args, img, iter_depth)
+        ret[name] = {'M iterations/s': img.sum()/t/1e6, 'Mpixel/s': m*n/t/1e6, 'seconds': t}
+    return ret, compile_time
+
+def child(threads, n, reps, size, iter_depth):
+    # not offline_cache=False: with it Taichi 1.7 mixes up the ti.real_funcs of different kernels
+    ti.init(arch=ti.cpu, cpu_max_num_threads=threads, offline_cache_file_path=tempfile.mkdtemp())
+    rng = np.random.default_rng(0)
+    ops, compile_ops = bench_ops(n, reps, rng)
+    mandelbrot, compile_mandelbrot = bench_mandelbrot(*size, iter_depth)
+    return {'ops': ops, 'mandelbrot': mandelbrot, 'compile': {**compile_ops, **compile_mandelbrot}}
+
+def meta(args):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {'commit': commit, 'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'taichi': '.'.join(map(str, ti.__version__)),
+            'python': platform.python_version(), 'platform': platform.platform(), 'processor': platform.processor(),
+            'cpu_count': os.cpu_count(), 'n': args.n, 'reps': args.reps, 'mandelbrot_size': args.size,
+            'iter_depth': args.iter_depth}
+
+def flatten(d, prefix=''):
+    ret = {}
+    for k, v in d.items():
+        if isinstance(v, dict):
+            ret.update(flatten(v, f'{prefix}{k} / '))
+        else:
+            ret[prefix + k] = v
+    return ret
+
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = flatten(json.load(f)['results'])
+    with open(new_path) as f:
+        new = flatten(json.load(f)['results'])
+    print(f'{"":60s} {"old":>10s} {"new":>10s} {"new/old":>8s}')
+    for k in new:
+        if k in old and isinstance(new[k], (int, float)) and old[k]:
+            print(f'{k:60s} {old[k]:10.4g} {new[k]:10.4g} {new[k]/old[k]:8.3f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', default='1', help='comma separated cpu_max_num_threads values')
+    parser.add_argument('--n', type=int, default=100000, help='elements per op kernel')
+    parser.add_argument('--reps', type=int, default=16, help='dependent operations per element')
+    parser.add_argument('--size', type=int, nargs=2, default=[80, 120], help='mandelbrot image size')
+    parser.add_argument('--iter-depth', type=int, default=256)
+    parser.add_argument('--out', default='benchmark.json')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'))
+    parser.add_argument('--child', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+    elif args.child:
+        print(json.dumps(child(args.child, args.n, args.reps, args.size, args.iter_depth)))
+    else:
+        results = {}
+        for threads in map(int, args.threads.split(',')):
+            cmd = [sys.executable, os.path.abspath(__file__), '--child', str(threads), '--n', str(args.n),
+                   '--reps', str(args.reps), '--size', *map(str, args.size), '--iter-depth', str(args.iter_depth)]
+            out = subprocess.run(cmd, capture_output=True, text=True)
+            assert out.returncode == 0, out.stderr
+            results[f'{threads} threads'] = json.loads(out.stdout.strip().split('\n')[-1])
+
+            r = results[f'{threads} threads']
+            print(f'{threads} threads:')
+            for name, v in r['ops'].items():
+                print(f'  {name:12s} f192 {v["f192"]:8.2f}  f64 {v["f64"]:8.1f}  f32 {v["f32"]:8.1f} M ops/s  ({v["slowdown vs f64"]:.0f}x)')
+            for name, v in r['mandelbrot'].items():
+                print(f'  mandelbrot {name:4s} {v["M iterations/s"]:8.2f} M iterations/s')
+            print(f'  compile total {sum(r["compile"].values()):.1f} s')
+
+        with open(args.out, 'w') as f:
+            json.dump({'meta': meta(args), 'results': results}, f, indent=1)
+        print('saved', args.out)
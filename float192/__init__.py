@@ -6,8 +6,25 @@ Created on Sun Jul 20 00:56:46 2025
 """
 
 from .float192 import (f192_t, 
-                       add_f192, sub_f192, mul_f192, div_f192, 
-                       f192_to_f32, f32_to_f192, i32_to_f192, str_to_f192,
+                       add_f192, sub_f192, mul_f192, mul_f192_trunc, div_f192, div_f192_f64, div_f192_long, 
+                       neg_f192, fma_f192, sqr_f192, mul_f192_u32, mul_f192_pow2, sqrt_f192, rsqrt_f192, hypot_f192, 
+                       f192_to_f32, f32_to_f192, f192_to_f64, f64_to_f192, i32_to_f192, str_to_f192,
                        gt_f192, lt_f192, eq_f192, le_f192, ge_f192, 
                        normalize, equalize_exp)
-from .ast_transformer import supports_f192
\ No newline at end of file
+from .codec import (f64_to_f192_array, int_to_f192_array, mpf_to_f192_array, str_to_f192_array,
+                    f192_array_to_f64, f192_array_to_mpf, f192_array_to_str)
+from .soa import f192_field, f192_field_t, soa_ndarray, f192_soa_ndarray, to_soa, from_soa
+from .packed import f192p_t, pack_f192, unpack_f192, f192p_field, pack_f192_array, unpack_f192_array
+from .double_double import (dd_t, add_dd, sub_dd, mul_dd, div_dd, neg_dd, sqr_dd, fma_dd, mul_dd_u32, mul_dd_pow2,
+                            sqrt_dd, rsqrt_dd, hypot_dd,
+                            gt_dd, lt_dd, eq_dd, ge_dd, le_dd, i32_to_dd, f32_to_dd, f64_to_dd, dd_to_f32, dd_to_f64,
+                            f192_to_dd, dd_to_f192, str_to_dd, f192_array_to_dd_array, dd_array_to_f192_array,
+                            dd_array_to_f64, f64_to_dd_array)
+from .reduce import sum_f192, dot_f192, norm_f192, min_f192, max_f192
+from .mandelbrot import render_f192, render_perturbation, render_tiles
+from .ast_transformer import supports_f192
+from .float_n import float_type, supports_fN
+from .cache import clear_f192_cache
+from .flags import flag_counts, reset_flag_counts
+from .profiler import op_counts, reset_op_counts, print_op_profile
+from .inlining import inline_variant
\ No newline at end of file
@@ -9,20 +9,37 @@ import ast
 import inspect
 import textwrap
 import tempfile
-import importlib.util
 from typing import get_type_hints
+import taichi as ti
+import numpy as np
 import float192 as ty
+from .codec import mpf_to_f192_array, EXP_BIAS
+from .cache import cache_key, cache_path, lookup, store, load
+from .inlining import parse_layers
+from .soa import SoA, is_f192_field
+from .packed import f192p_t, is_f192p_field
+from . import flags
+from .profiler import OPERATIONS
+from . import profiler
+
+def annotation_type(t):
+    if t is ty.f192_field_t:
+        return ty.f192_t
+    if getattr(t, 'f192_soa_ndim', None) is not None:
+        return SoA(t.f192_soa_ndim)
+    return t
 
 def resolve_annotation(anotation_node, globals_dict):
     try:
         if isinstance(anotation_node, ast.Name): #example: f192_t
-            return eval(anotation_node.id, globals_dict)
+            return annotation_type(eval(anotation_node.id, globals_dict))
         elif isinstance(anotation_node, ast.Call): #example: ti.types.ndarray(dtype=f192_t, ndim = 3)
             src = ast.unparse(anotation_node)
-            return eval(src, globals_dict).dtype
+            t = annotation_type(eval(src, globals_dict))
+            return t if isinstance(t, SoA) else t.dtype
         elif isinstance(anotation_node, ast.Attribute): #example: float192.f192_t
             src = ast.unparse(anotation_node)
-            return eval(src, globals_dict)
+            return annotation_type(eval(src, globals_dict))
         # elif isinstance(anotation_node, ast.List): #example: [f192_t, f192_t]
         #     lst = [resolve_annotation(node, globals_dict) for node in anotation_node.elts]
         #     return lst
@@ -47,13 +64,15 @@ def replace_type_annotation(node, replacements):
 
 
 class TypeAnnotator(ast.NodeVisitor):
-    def __init__(self, globals_dict=None):
+    def __init__(self, globals_dict=None, known_return_types=None):
         self.env = {}  # variable name -> type descriptor
         self.globals_dict = globals_dict if globals_dict is not None else globals()
-        self.known_return_types = {
+        self.known_return_types = known_return_types if known_return_types is not None else {
             'f192': ty.f192_t,
-            'f32_to_f192': ty.f32_to_f192,
-            'i32_to_f192': ty.i32_to_f192
+            'f32_to_f192': ty.f192_t,
+            'f64_to_f192': ty.f192_t,
+            'i32_to_f192': ty.f192_t,
+            'str_to_f192': ty.f192_t
         }
 
     def visit_FunctionDef(self, node):
@@ -121,8 +140,16 @@ class TypeAnnotator(ast.NodeVisitor):
             node.inferred_type = self.known_return_types[func_id]
             return node
 
-        # Case 2: Use get_type_hints
         func_obj = eval(ast.unparse(node.func), self.globals_dict)
+        
+        # Case 2: math functions with an f192 implementation keep the type of their arguments
+        if math_func(func_obj) and node.args:
+            t = getattr(node.args[0], 'inferred_type', None)
+            if t is not None and all(getattr(arg, 'inferred_type', None) == t for arg in node.args):
+                node.inferred_type = t
+                return node
+
+        # Case 3: Use get_type_hints
         if func_obj is not None:
             try:
                 hints = get_type_hints(func_obj, globalns=self.globals_dict)
@@ -139,6 +166,12 @@ class TypeAnnotator(ast.NodeVisitor):
         if isinstance(node.value, ast.Name):
             base = node.value.id
             node.inferred_type = self.env.get(base)
+            if isinstance(node.inferred_type, SoA) or node.inferred_type is f192p_t:
+                node.inferred_type = ty.f192_t
+            elif base not in self.env and is_f192_field(self.globals_dict.get(base)):
+                node.inferred_type = ty.f192_t
+            elif base not in self.env and is_f192p_field(self.globals_dict.get(base)):
+                node.inferred_type = ty.f192_t
         elif isinstance(node.value, ast.Attribute):
             base = ast.unparse(node.value)
             node.inferred_type = self.env.get(base)
@@ -151,16 +184,251 @@ class TypeAnnotator(ast.NodeVisitor):
         if ltype == rtype and ltype is not None:
             node.inferred_type = ltype
 
+# the functions the fusions of Transformer emit and the ones replacing the 
+# math functions of MATH_FUNCS, None disables a fusion or replacement
+F192_NAMES = {'sqr': 'sqr_f192', 'fma': 'fma_f192', 'mul_pow2': 'mul_f192_pow2', 
+              'mul_u32': 'mul_f192_u32', 'neg': 'neg_f192', 'sqrt': 'sqrt_f192', 'rsqrt': 'rsqrt_f192'}
+
+# Taichi functions called on f192 operands -> their key in F192_NAMES
+MATH_FUNCS = [(ti.sqrt, 'sqrt'), (ti.rsqrt, 'rsqrt')]
+
+def math_func(obj):
+    return next((key for f, key in MATH_FUNCS if obj is f), None)
+
+def literal_vector(limbs):
+    # the f192_t literal the folded constants are emitted as
+    return ast.parse(f'ti.Vector([{", ".join(f"ti.u32({int(x)})" for x in limbs)}], ti.u32)', mode='eval').body
+
+def vector_literal(node):
+    # the elements of ti.Vector([...]) when each is an int literal or ti.u32 of one, else None
+    if not (isinstance(node, ast.Call) and ast.unparse(node.func) == 'ti.Vector' and node.args 
+            and isinstance(node.args[0], ast.List)):
+        return None
+    ret = []
+    for elt in node.args[0].elts:
+        if isinstance(elt, ast.Call) and ast.unparse(elt.func) == 'ti.u32' and len(elt.args) == 1:
+            elt = elt.args[0]
+        if not isinstance(elt, ast.Constant) or not isinstance(elt.value, int) or isinstance(elt.value, bool):
+            return None
+        ret.append(elt.value)
+    return ret
+
+def normalized_limbs(limbs):
+    # normalize() on the host: the top bit of the mantissa to bit 127, zero stays as it is
+    mant = sum(int(x) << (32*i) for i, x in enumerate(limbs[:4]))
+    if mant == 0:
+        return list(limbs)
+    shift = 128 - mant.bit_length()
+    mant <<= shift
+    return [(mant >> (32*i)) & 0xffffffff for i in range(4)] + [limbs[4], (limbs[5] - shift) % 2**32]
+
 class Transformer(ast.NodeTransformer):
-    def __init__(self, target_type, op_map, cmp_map):
+    def __init__(self, target_type, op_map, cmp_map, fuse_ops=False, globals_dict=None, names=None, constructors=None):
         """
         target_type: the type (like U256()) to match against.
         op_map: mapping of ast operator class → replacement function name.
         e.g., {ast.Add: 'add_u256'}
+        fuse_ops: replace x*x, a*b+c and products/quotients with integer 
+        constants by the fused f192 functions
+        names: the fused functions (F192_NAMES), constructors: the functions 
+        building the target type from i32, f32 and f64
         """
         self.target_type = target_type
         self.op_map = op_map
         self.cmp_map = cmp_map
+        self.fuse_ops = fuse_ops
+        self.globals_dict = globals_dict if globals_dict is not None else globals()
+        self.names = names if names is not None else F192_NAMES
+        self.constructors = constructors if constructors is not None else (ty.i32_to_f192, ty.f32_to_f192, ty.f64_to_f192)
+        self.soa = {} # SoA ndarray arguments: name -> number of element axes
+        self.packed = set() # packed ndarray arguments and global fields
+        self.count_flags = None # the name of the function with count_flags=True, see flags.py
+        self.fold_constants = False # replace the constructors with literal arguments by f192_t literals (f192 only)
+        self.literal_fp = ti.f32 # the type of float literals in the kernel (default_fp of ti.init)
+        self.counter = 0
+    
+    def call(self, func_name, args, counted=True):
+        func = ast.Attribute(value=ast.Name(id='ty', ctx=ast.Load()), attr=func_name, ctx=ast.Load())
+        new_node = ast.Call(func=func, args=args, keywords=[])
+        if counted and self.count_flags is not None:
+            # _f192_flags.countedN(ty.op, name, which arguments are f192, *args)
+            f192 = ast.Tuple(elts=[ast.Constant(getattr(arg, 'inferred_type', None) == self.target_type) for arg in args], 
+                             ctx=ast.Load())
+            new_node = ast.Call(
+                func=ast.Attribute(value=ast.Name(id='_f192_flags', ctx=ast.Load()), attr=flags.COUNTED[len(args)], ctx=ast.Load()),
+                args=[func, ast.Constant(self.count_flags), f192, *args],
+                keywords=[]
+            )
+        new_node.inferred_type = self.target_type
+        return new_node
+    
+    def is_pure(self, node):
+        # x*x -> sqr(x) evaluates x once, so x must not call anything but the f192 functions
+        for sub in ast.walk(node):
+            if isinstance(sub, ast.Call) and not (isinstance(sub.func, ast.Attribute) and ast.unparse(sub.func.value) in ('ty', '_f192_flags')):
+                return False
+        return True
+    
+    def int_constant(self, node):
+        # the value of f192 constructors with an integer literal argument e.g. i32_to_f192(4)
+        if getattr(node, 'f192_int', None) is not None:
+            return node.f192_int # already folded
+        if not isinstance(node, ast.Call) or len(node.args) != 1 or node.keywords:
+            return None
+        try:
+            func = eval(ast.unparse(node.func), self.globals_dict)
+            value = ast.literal_eval(node.args[0])
+        except Exception:
+            return None
+        if not any(func is c for c in self.constructors):
+            return None
+        value = self.param_value(func, value)
+        if value is None or value != int(value):
+            return None
+        return int(value)
+    
+    def param_value(self, func, value):
+        # the value the parameter of the constructor func receives for the 
+        # literal value: Taichi types an int as i32 and a float as 
+        # self.literal_fp, then casts it to the parameter. None if that is not 
+        # known when transforming
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return None
+        if isinstance(value, int) and not -2**31 < value < 2**31: # abs(-2**31) overflows in i32_to_f192
+            return None
+        if func is self.constructors[0]:
+            return value if isinstance(value, int) else None
+        with np.errstate(over='ignore'): # overflows to inf like an f32 would
+            if isinstance(value, float) and self.literal_fp != ti.f64:
+                value = np.float32(value)
+            return float(np.float32(value)) if func is self.constructors[1] else float(value)
+    
+    def scale(self, x, k, divide=False):
+        # x*k or x/k for an integer constant k
+        a = abs(k)
+        if a == 0 or (divide and a & (a - 1)):
+            return None
+        if a & (a - 1) == 0:
+            shift = a.bit_length() - 1
+            new_node = self.call(self.names['mul_pow2'], [x, ast.Constant(-shift if divide else shift)])
+        elif a < 2**31:
+            new_node = self.call(self.names['mul_u32'], [x, ast.Constant(a)])
+        else:
+            return None
+        if k < 0:
+            new_node = self.call(self.names['neg'], [new_node])
+        return new_node
+    
+    def fuse(self, node):
+        left, right = node.left, node.right
+        
+        if isinstance(node.op, ast.Mult):
+            if ast.dump(left) == ast.dump(right) and self.is_pure(left) and self.names['sqr']:
+                new_node = self.call(self.names['sqr'], [left])
+                new_node.f192_mul_args = (left, right)
+                return new_node
+            for x, c in ((left, right), (right, left)):
+                k = self.int_constant(c)
+                if k is not None:
+                    return self.scale(x, k)
+        
+        elif isinstance(node.op, ast.Div):
+            k = self.int_constant(right)
+            if k is not None:
+                return self.scale(left, k, divide=True)
+        
+        elif self.names['fma'] is None:
+            pass
+        
+        elif isinstance(node.op, ast.Add):
+            if hasattr(left, 'f192_mul_args'):
+                return self.call(self.names['fma'], [*left.f192_mul_args, right])
+            if hasattr(right, 'f192_mul_args'):
+                return self.call(self.names['fma'], [*right.f192_mul_args, left])
+        
+        elif isinstance(node.op, ast.Sub):
+            if hasattr(left, 'f192_mul_args'):
+                return self.call(self.names['fma'], [*left.f192_mul_args, self.call(self.names['neg'], [right])])
+            if hasattr(right, 'f192_mul_args'):
+                a, b = right.f192_mul_args
+                return self.call(self.names['fma'], [self.call(self.names['neg'], [a]), b, left])
+        
+        return None
+
+    def soa_name(self, node):
+        return node.id if isinstance(node, ast.Name) and node.id in self.soa else None
+    
+    def soa_index(self, node, limb):
+        # x[I] -> x[limb, I]
+        index = node.slice.elts if isinstance(node.slice, ast.Tuple) else [node.slice]
+        return ast.Subscript(value=ast.Name(id=node.value.id, ctx=ast.Load()),
+                             slice=ast.Tuple(elts=[ast.Constant(limb), *index], ctx=ast.Load()),
+                             ctx=node.ctx)
+    
+    def soa_shape(self, name):
+        # x.shape without the limb axis
+        return ast.Tuple(elts=[ast.parse(f'{name}.shape[{k + 1}]', mode='eval').body for k in range(self.soa[name])], 
+                         ctx=ast.Load())
+    
+    def visit_Subscript(self, node):
+        self.generic_visit(node)
+        if self.soa_name(node.value) and isinstance(node.ctx, ast.Load):
+            new_node = ast.Call(func=ast.parse('ti.Vector', mode='eval').body,
+                                args=[ast.List(elts=[self.soa_index(node, k) for k in range(6)], ctx=ast.Load()),
+                                      ast.parse('ti.u32', mode='eval').body],
+                                keywords=[])
+            new_node.inferred_type = self.target_type
+            return new_node
+        if self.packed_name(node.value) and isinstance(node.ctx, ast.Load):
+            return self.call('unpack_f192', [node], counted=False)
+        return node
+    
+    def visit_Attribute(self, node):
+        self.generic_visit(node)
+        name = self.soa_name(node.value)
+        if name and node.attr == 'shape' and isinstance(node.ctx, ast.Load):
+            return self.soa_shape(name)
+        return node
+    
+    def packed_name(self, node):
+        return node.id if isinstance(node, ast.Name) and node.id in self.packed else None
+    
+    def visit_Assign(self, node):
+        target = node.targets[0]
+        if isinstance(target, ast.Subscript) and self.packed_name(target.value):
+            # x[I] = v -> x[I] = pack_f192(v)
+            node = self.generic_visit(node)
+            node.value = self.call('pack_f192', [node.value], counted=False)
+            return node
+        if not (isinstance(target, ast.Subscript) and self.soa_name(target.value)):
+            return self.generic_visit(node)
+        
+        # x[I] = v -> t = v; for k in ti.static(range(6)): x[k, I] = t[k]
+        assert len(node.targets) == 1, 'chained assignment to an f192 SoA ndarray is not supported'
+        self.counter += 1
+        tmp = f'_f192_s{self.counter}'
+        target = self.visit(target)
+        value = self.visit(node.value)
+        store = ast.parse(f'for _f192_k in ti.static(range(6)):\n    x[0] = {tmp}[_f192_k]').body[0]
+        store.body[0].targets[0] = self.soa_index(target, 0)
+        store.body[0].targets[0].slice.elts[0] = ast.Name(id='_f192_k', ctx=ast.Load())
+        return [ast.Assign(targets=[ast.Name(id=tmp, ctx=ast.Store())], value=value), store]
+    
+    def visit_For(self, node):
+        # struct-for over an SoA ndarray: loop over its shape instead
+        node = self.generic_visit(node)
+        iter_node = node.iter
+        grouped = (isinstance(iter_node, ast.Call) and ast.unparse(iter_node.func) == 'ti.grouped' 
+                   and len(iter_node.args) == 1)
+        name = self.soa_name(iter_node.args[0] if grouped else iter_node)
+        if name:
+            ndrange = ast.Call(func=ast.parse('ti.ndrange', mode='eval').body, 
+                               args=self.soa_shape(name).elts, keywords=[])
+            if grouped:
+                iter_node.args[0] = ndrange
+            else:
+                node.iter = ndrange
+        return node
 
     def visit_BinOp(self, node):
         self.generic_visit(node)
@@ -170,21 +438,63 @@ class Transformer(ast.NodeTransformer):
         op_type = type(node.op)
 
         if ltype == self.target_type and rtype == self.target_type and op_type in self.op_map:
-            func_name = self.op_map[op_type].__name__
-
-            new_node = ast.Call(
-                func=ast.Attribute(
-                    value=ast.Name(id='ty', ctx=ast.Load()),
-                    attr=func_name,
-                    ctx=ast.Load()),
-                args=[node.left, node.right],
-                keywords=[]
-            )
-            new_node.inferred_type = self.target_type
-            return new_node
+            new_node = self.fuse(node) if self.fuse_ops else None
+            if new_node is None:
+                new_node = self.call(self.op_map[op_type].__name__, [node.left, node.right])
+                if op_type is ast.Mult:
+                    new_node.f192_mul_args = (node.left, node.right)
+            return ast.copy_location(new_node, node)
 
         return node
     
+    def literal(self, func, arg):
+        # the limbs of func(arg) for an f192 constructor or normalize and a 
+        # literal argument, None if it can not be folded. The argument is 
+        # typed like Taichi types the literal (an int as i32, a float as 
+        # self.literal_fp) and then cast to the parameter, so the bits are 
+        # the ones the unfolded call gives at runtime
+        if func is ty.normalize:
+            limbs = vector_literal(arg)
+            if limbs is None or len(limbs) != 6:
+                return None
+            return normalized_limbs([x % 2**32 for x in limbs])
+        if func is not ty.str_to_f192 and not any(func is c for c in self.constructors):
+            return None
+        try:
+            value = ast.literal_eval(arg)
+        except ValueError:
+            return None
+        if func is ty.str_to_f192: # a decimal, truncated to 128 bits like on the host
+            return [int(x) for x in ty.str_to_f192(value).to_numpy()] if isinstance(value, str) else None
+        value = self.param_value(func, value)
+        if value is None:
+            return None
+        value = float(value)
+        if not np.isfinite(value):
+            return None # the runtime sets the flags
+        if value == 0: # the runtime zero, the sign of -0.0 is kept
+            return [0, 0, 0, 0, int(np.signbit(value)), EXP_BIAS]
+        return [int(x) for x in mpf_to_f192_array([value])[0]]
+    
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        try:
+            func = eval(ast.unparse(node.func), self.globals_dict)
+        except Exception:
+            return node
+        if self.fold_constants and len(node.args) == 1 and not node.keywords:
+            limbs = self.literal(func, node.args[0])
+            if limbs is not None:
+                new_node = ast.copy_location(literal_vector(limbs), node)
+                new_node.inferred_type = self.target_type
+                new_node.f192_int = self.int_constant(node)
+                return new_node
+        name = self.names.get(math_func(func))
+        if (name and node.args and not node.keywords
+                and all(getattr(arg, 'inferred_type', None) == self.target_type for arg in node.args)):
+            return ast.copy_location(self.call(name, node.args), node)
+        return node
+    
     def visit_Compare(self, node):
         assert len(node.ops) == 1, "Chained comparisons not supported for f192"
         
@@ -208,61 +518,485 @@ class Transformer(ast.NodeTransformer):
                 keywords=[]
             )
             new_node.inferred_type = bool
-            return new_node
+            return ast.copy_location(new_node, node)
 
         return node
         
 
-def supports_f192(globals_dict, verbose=False):
+class Optimizer:
+    """
+    Common subexpression elimination and loop invariant hoisting for the 
+    calls emitted by Transformer. Every function of float192 is pure, so a 
+    ty.* call (or an f192 constructor) whose arguments are only names, 
+    constants and other such calls can be bound to a temporary and reused 
+    as long as none of the names it reads is assigned.
+    """
+    def __init__(self, globals_dict=None, constructors=None):
+        self.globals_dict = globals_dict if globals_dict is not None else globals()
+        self.constructors = constructors if constructors is not None else (ty.i32_to_f192, ty.f32_to_f192, ty.f64_to_f192)
+        self.counter = 0
+    
+    def optimize(self, body):
+        body[:] = self.hoist(body)
+        self.cse(body)
+    
+    def new_name(self):
+        self.counter += 1
+        return f'_f192_t{self.counter}'
+    
+    def is_f192_call(self, node):
+        if not isinstance(node, ast.Call) or node.keywords:
+            return False
+        if isinstance(node.func, ast.Attribute) and isinstance(node.func.value, ast.Name) and node.func.value.id in ('ty', '_f192_flags'):
+            return True
+        try:
+            func = eval(ast.unparse(node.func), self.globals_dict)
+        except Exception:
+            return False
+        return any(func is c for c in self.constructors)
+    
+    def is_pure(self, node):
+        if isinstance(node, (ast.Constant, ast.Name)):
+            return True
+        if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and node.value.id == 'ty':
+            return True # the operation passed to a flag counter
+        if isinstance(node, ast.Tuple):
+            return all(self.is_pure(elt) for elt in node.elts)
+        if vector_literal(node) is not None:
+            return True # e.g. a folded f192 constant
+        if isinstance(node, ast.UnaryOp):
+            return self.is_pure(node.operand)
+        if isinstance(node, ast.BinOp):
+            return self.is_pure(node.left) and self.is_pure(node.right)
+        return self.is_candidate(node)
+    
+    def is_candidate(self, node):
+        return self.is_f192_call(node) and all(self.is_pure(arg) for arg in node.args)
+    
+    @staticmethod
+    def read_names(node):
+        return {n.id for n in ast.walk(node) if isinstance(n, ast.Name)}
+    
+    @staticmethod
+    def stored_names(nodes):
+        # names that are (re)assigned, a[i] = ... and a.x = ... modify a too
+        ret = set()
+        for node in nodes:
+            for n in ast.walk(node):
+                if isinstance(getattr(n, 'ctx', None), ast.Store):
+                    while isinstance(n, (ast.Subscript, ast.Attribute)):
+                        n = n.value
+                    if isinstance(n, ast.Name):
+                        ret.add(n.id)
+        return ret
+    
+    def candidates(self, nodes, exclude=frozenset()):
+        # candidates not reading any excluded name, largest first
+        found = {}
+        for node in nodes:
+            for n in ast.walk(node):
+                if self.is_candidate(n) and not self.read_names(n) & exclude:
+                    found.setdefault(ast.dump(n), n)
+        return sorted(found.items(), key=lambda kv: -len(kv[0]))
+    
+    # the parts of the tree the passes look at are either statements or 
+    # (statement, field) pairs for the expressions of a compound statement
+    @staticmethod
+    def nodes(parts):
+        return [getattr(*p) if isinstance(p, tuple) else p for p in parts]
+    
+    def count(self, parts, key):
+        return sum(ast.dump(n) == key for node in self.nodes(parts) for n in ast.walk(node))
+    
+    @staticmethod
+    def replace(parts, key, name):
+        class Replacer(ast.NodeTransformer):
+            def visit(self, node):
+                if ast.dump(node) == key:
+                    return ast.Name(id=name, ctx=ast.Load())
+                return super().visit(node)
+        for p in parts:
+            if isinstance(p, tuple):
+                setattr(p[0], p[1], Replacer().visit(getattr(*p)))
+            else:
+                Replacer().visit(p)
+    
+    @staticmethod
+    def headers(stmt):
+        # the expressions of a compound statement evaluated once, before its body
+        if isinstance(stmt, ast.If):
+            return [(stmt, 'test')]
+        if isinstance(stmt, ast.For):
+            return [(stmt, 'iter')]
+        return []
+    
+    @staticmethod
+    def blocks(stmt):
+        return [getattr(stmt, f) for f in ('body', 'orelse', 'finalbody') if isinstance(getattr(stmt, f, None), list)]
+    
+    def window(self, block, start, names):
+        # the parts of block[start:] that see the same values of names as block[start]
+        for stmt in block[start:]:
+            stored = self.stored_names([stmt])
+            if self.blocks(stmt):
+                if stored & names:
+                    yield from self.headers(stmt)
+                    return
+                yield stmt
+            else:
+                yield stmt
+                if stored & names:
+                    return
+    
+    def bind(self, name, expr):
+        ret = ast.Assign(targets=[ast.Name(id=name, ctx=ast.Store())], value=ast.parse(ast.unparse(expr), mode='eval').body)
+        # the copy is parsed on line 1, moved to the line of expr for the profiler
+        line = next((n.lineno for n in ast.walk(expr) if hasattr(n, 'lineno')), None)
+        if line is not None:
+            for n in ast.walk(ret):
+                n.lineno = n.end_lineno = line
+        return ret
+    
+    def hoist(self, block):
+        ret = []
+        for stmt in block:
+            if isinstance(stmt, (ast.For, ast.While)):
+                assigned = self.stored_names([stmt])
+                parts = stmt.body + ([(stmt, 'test')] if isinstance(stmt, ast.While) else [])
+                # innermost first, so that the hoisted expressions share their parts
+                while (found := self.candidates(self.nodes(parts), assigned)):
+                    key, expr = found[-1]
+                    name = self.new_name()
+                    ret.append(self.bind(name, expr))
+                    self.replace(parts, key, name)
+            for b in self.blocks(stmt):
+                b[:] = self.hoist(b)
+            ret.append(stmt)
+        return ret
+    
+    def rotate(self, block, i):
+        # while f(E): body using E  ->  t = E; while f(t): body using t; t = E
+        # so that E is computed once per iteration
+        stmt = block[i]
+        if stmt.orelse or any(isinstance(n, ast.Continue) for n in ast.walk(stmt)):
+            return 0
+        inserted = 0
+        for key, expr in self.candidates([stmt.test]):
+            body = list(self.window(stmt.body, 0, self.read_names(expr)))
+            if not self.count([(stmt, 'test')], key) or not self.count(body, key):
+                continue
+            name = self.new_name()
+            block.insert(i + inserted, self.bind(name, expr))
+            inserted += 1
+            self.replace([(stmt, 'test')] + body, key, name)
+            stmt.body.append(self.bind(name, expr))
+        return inserted
+    
+    def cse(self, block):
+        i = 0
+        while i < len(block):
+            i += self.rotate(block, i) if isinstance(block[i], ast.While) else 0
+            stmt = block[i]
+            
+            parts = self.headers(stmt) if self.blocks(stmt) else [stmt]
+            for key, expr in self.candidates(self.nodes(parts)):
+                names = self.read_names(expr)
+                if isinstance(stmt, ast.Assign) and len(stmt.targets) == 1 and isinstance(stmt.targets[0], ast.Name) \
+                        and ast.dump(stmt.value) == key and stmt.targets[0].id not in names:
+                    # t = E already binds E, reuse t until t or a name of E changes
+                    t = stmt.targets[0].id
+                    self.replace(list(self.window(block, i + 1, names | {t})), key, t)
+                    continue
+                window = list(self.window(block, i, names))
+                if self.count(window, key) > 1:
+                    name = self.new_name()
+                    block.insert(i, self.bind(name, expr))
+                    i += 1
+                    self.replace(window, key, name)
+            
+            for b in self.blocks(stmt):
+                self.cse(b)
+            i += 1
+        
+
+class Profiler(ast.NodeTransformer):
+    """
+    Wraps the calls of the f192 operations, comparisons and conversions of 
+    the generated function into _f192_profile.tally(call, name, line, 
+    operation), see profiler.py. The lines are relative to the source of the 
+    function, nodes without a line count under the enclosing one.
+    """
+    def __init__(self, name, globals_dict):
+        self.name = name
+        self.globals_dict = globals_dict
+        self.line = 1
+        # the f192 functions by object, for conversions called through globals like f192 = i32_to_f192
+        self.operations = {id(getattr(ty, op)): op for op in OPERATIONS}
+    
+    def operation(self, node):
+        func = node.func
+        if isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name):
+            if func.value.id == 'ty':
+                return func.attr if func.attr in OPERATIONS else None
+            if func.value.id == '_f192_flags':
+                # _f192_flags.countedN(ty.op, ...)
+                return node.args[0].attr
+        try:
+            obj = eval(ast.unparse(func), self.globals_dict)
+        except Exception:
+            return None
+        return self.operations.get(id(obj))
+    
+    def visit(self, node):
+        line = self.line
+        self.line = getattr(node, 'lineno', line)
+        ret = super().visit(node)
+        self.line = line
+        return ret
+    
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        op = self.operation(node)
+        if op is None:
+            return node
+        return ast.Call(func=ast.Attribute(value=ast.Name(id='_f192_profile', ctx=ast.Load()), attr='tally', ctx=ast.Load()),
+                        args=[node, ast.Constant(self.name), ast.Constant(self.line), ast.Constant(op)], keywords=[])
+        
+
+class Renamer(ast.NodeTransformer):
+    """
+    Replaces the globals in renames (object -> name in ty) by ty.<name>, 
+    e.g. f192_t and the f192 constructors for another backend. Names bound 
+    inside the function are left alone.
+    """
+    def __init__(self, renames, globals_dict):
+        self.renames = {id(obj): name for obj, name in renames}
+        self.globals_dict = globals_dict
+        self.local = set()
+    
+    def visit_FunctionDef(self, node):
+        self.local = {arg.arg for arg in node.args.args}
+        self.local |= {sub.id for sub in ast.walk(node) if isinstance(sub, ast.Name) and isinstance(sub.ctx, ast.Store)}
+        self.generic_visit(node)
+        return node
+    
+    def renamed(self, node):
+        return ast.Attribute(value=ast.Name(id='ty', ctx=ast.Load()), 
+                             attr=self.renames[id(self.resolve(node))], ctx=ast.Load())
+    
+    def resolve(self, node):
+        # the global object an expression like name or module.name refers to
+        root = node
+        while isinstance(root, ast.Attribute):
+            root = root.value
+        if not isinstance(root, ast.Name) or root.id in self.local or root.id == 'ty' or root.id not in self.globals_dict:
+            return None
+        try:
+            return eval(ast.unparse(node), self.globals_dict)
+        except Exception:
+            return None
+    
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Load) and id(self.resolve(node)) in self.renames:
+            return self.renamed(node)
+        return node
+    
+    def visit_Attribute(self, node):
+        if isinstance(node.ctx, ast.Load) and id(self.resolve(node)) in self.renames:
+            return self.renamed(node)
+        return self.generic_visit(node)
+
+def f192_signature(fn, globals_dict, target_type=None, constructors=None):
+    # what the transformation depends on besides the source: which annotations
+    # and return types of the referenced globals are f192 (or target_type), 
+    # and which constructor (or folded function) a global is, since the 
+    # folding depends on it
+    target_type = target_type if target_type is not None else ty.f192_t
+    constructors = constructors if constructors is not None else (ty.i32_to_f192, ty.f32_to_f192, ty.f64_to_f192)
+    
+    def is_f192(t):
+        if isinstance(t, (list, tuple)):
+            return [is_f192(x) for x in t]
+        if getattr(t, 'f192_soa_ndim', None) is not None:
+            return f'soa {t.f192_soa_ndim}'
+        if t is f192p_t or getattr(t, 'dtype', None) is f192p_t:
+            return 'packed'
+        return t is target_type or t is ty.f192_field_t or getattr(t, 'dtype', None) is target_type
+    
+    folded = (*constructors, ty.str_to_f192, ty.normalize)
+    ret = {arg: is_f192(t) for arg, t in getattr(fn, '__annotations__', {}).items()}
+    for name in fn.__code__.co_names:
+        obj = globals_dict.get(name)
+        if is_f192_field(obj):
+            ret['global ' + name] = 'f192 field'
+        elif is_f192p_field(obj):
+            ret['global ' + name] = 'packed field'
+        if not callable(obj):
+            continue
+        try:
+            returns = is_f192(get_type_hints(obj, globalns=globals_dict).get('return'))
+        except Exception:
+            returns = None
+        ret['global ' + name] = (returns, next((i for i, c in enumerate(folded) if obj is c), None))
+    return ret
+
+def supports_f192(globals_dict, verbose=False, truncated_mul=False, division='newton', fuse_ops=True, optimize=True, cache=True, inline=None, 
+                  backend='f192', count_flags=False, profile=False, fold_constants=True):
+    '''
+    truncated_mul: use mul_f192_trunc for a*b, which skips the low partial 
+    products (at most 8 units in the last place below the exact product)
+    division: 'newton' (div_f192, f32 seed), 'newton_f64' (div_f192_f64, f64
+    seed, one Newton step less) or 'long' (div_f192_long, exact long division)
+    fuse_ops: emit sqr_f192 for x*x, fma_f192 for a*b+c and a*b-c, and 
+    mul_f192_pow2/mul_f192_u32 when multiplying or dividing by an integer 
+    constant like i32_to_f192(2)
+    optimize: bind repeated f192 subexpressions and loop invariant ones to 
+    temporaries (see Optimizer)
+    cache: keep the generated module in the on-disk cache (see cache.py) and 
+    reuse it when nothing it depends on has changed
+    inline: layers of float192 to inline as ti.func instead of calling them 
+    as ti.real_func, e.g. 'mantissa128', 'float192' or 'all' (see 
+    inlining.py), None uses the layers of the imported package
+    backend: 'f192' or 'dd', which runs the kernel in double-double 
+    arithmetic (see double_double.py) with f192_t, the constructors and the 
+    conversions renamed to their dd versions, truncated_mul, division, 
+    inline, count_flags, profile and fold_constants only apply to 'f192'
+    count_flags: count the operations of the function that raise an error 
+    flag in a device field, read with float192.flag_counts() (see flags.py)
+    profile: count the executed f192 operations per source line in a device 
+    field, float192.print_op_profile() prints the report (see profiler.py)
+    fold_constants: evaluate the constructors with a literal argument, e.g. 
+    i32_to_f192(2) or f64_to_f192(0.1), decimal strings like 
+    str_to_f192("0.1") and normalize(ti.Vector([...])) of int literals when 
+    transforming, and emit the f192_t literal instead of the conversion
+    '''
+    div_funcs = {'newton': ty.div_f192, 'newton_f64': ty.div_f192_f64, 'long': ty.div_f192_long}
+    assert division in div_funcs, f'unknown division {division}, use one of {list(div_funcs)}'
+    assert backend in ('f192', 'dd'), f'unknown backend {backend}, use f192 or dd'
+    if backend == 'dd':
+        return supports_dd(globals_dict, verbose, fuse_ops, optimize, cache)
+    if inline is not None:
+        inline = tuple(sorted(parse_layers(inline)))
+    
+    transformer_args = (ty.f192_t, 
+                        {ast.Add: ty.add_f192,
+                         ast.Sub: ty.sub_f192,
+                         ast.Mult: ty.mul_f192_trunc if truncated_mul else ty.mul_f192,
+                         ast.Div: div_funcs[division]},
+                        {ast.Gt: ty.gt_f192,
+                         ast.Lt: ty.lt_f192,
+                         ast.Eq: ty.eq_f192,
+                         ast.GtE: ty.ge_f192,
+                         ast.LtE: ty.le_f192},
+                        fuse_ops, globals_dict)
+    # the operators are emitted by their __name__, every option has to name its own function
+    assert all(getattr(ty, f.__name__) is f for ops in transformer_args[1:3] for f in ops.values())
+    imports = 'import float192 as ty\n\n'
+    if inline is not None:
+        imports += f'ty = ty.inline_variant({inline})\n\n'
+    if count_flags:
+        imports += 'import float192.flags as _f192_flags\n\n'
+    if profile:
+        imports += 'import float192.profiler as _f192_profile\n\n'
+    return transforming_decorator(globals_dict, transformer_args, imports, 
+                                  (truncated_mul, division, fuse_ops, optimize, inline, count_flags, profile, fold_constants),
+                                  verbose, optimize, cache, count_flags=count_flags, profile=profile, 
+                                  fold_constants=fold_constants)
+
+# f192 globals -> the dd functions replacing them with backend='dd'
+DD_RENAMES = [('f192_t', 'dd_t'), ('i32_to_f192', 'i32_to_dd'), ('f32_to_f192', 'f32_to_dd'), ('f64_to_f192', 'f64_to_dd'),
+              ('f192_to_f32', 'dd_to_f32'), ('f192_to_f64', 'dd_to_f64'), ('add_f192', 'add_dd'), ('sub_f192', 'sub_dd'),
+              ('mul_f192', 'mul_dd'), ('mul_f192_trunc', 'mul_dd'), ('div_f192', 'div_dd'), ('div_f192_f64', 'div_dd'), 
+              ('div_f192_long', 'div_dd'), ('neg_f192', 'neg_dd'), ('sqr_f192', 'sqr_dd'), ('fma_f192', 'fma_dd'),
+              ('mul_f192_u32', 'mul_dd_u32'), ('mul_f192_pow2', 'mul_dd_pow2'), ('gt_f192', 'gt_dd'), ('lt_f192', 'lt_dd'),
+              ('eq_f192', 'eq_dd'), ('ge_f192', 'ge_dd'), ('le_f192', 'le_dd'), ('sqrt_f192', 'sqrt_dd'), 
+              ('rsqrt_f192', 'rsqrt_dd'), ('hypot_f192', 'hypot_dd')]
+
+def supports_dd(globals_dict, verbose=False, fuse_ops=True, optimize=True, cache=True):
+    # supports_f192(..., backend='dd'): the kernel is typed as f192, the 
+    # operators become dd calls and the f192 names dd ones
+    transformer_args = (ty.f192_t, 
+                        {ast.Add: ty.add_dd, ast.Sub: ty.sub_dd, ast.Mult: ty.mul_dd, ast.Div: ty.div_dd},
+                        {ast.Gt: ty.gt_dd, ast.Lt: ty.lt_dd, ast.Eq: ty.eq_dd, ast.GtE: ty.ge_dd, ast.LtE: ty.le_dd},
+                        fuse_ops, globals_dict)
+    names = {'sqr': 'sqr_dd', 'fma': 'fma_dd', 'mul_pow2': 'mul_dd_pow2', 'mul_u32': 'mul_dd_u32', 'neg': 'neg_dd',
+             'sqrt': 'sqrt_dd', 'rsqrt': 'rsqrt_dd'}
+    renames = [(getattr(ty, f192_name), dd_name) for f192_name, dd_name in DD_RENAMES]
+    return transforming_decorator(globals_dict, transformer_args, 'import float192 as ty\n\n', ('dd', fuse_ops, optimize),
+                                  verbose, optimize, cache, names=names, renames=renames)
+
+def transforming_decorator(globals_dict, transformer_args, imports, options, verbose=False, optimize=True, cache=True, 
+                           names=None, constructors=None, known_return_types=None, renames=None, count_flags=False, 
+                           profile=False, fold_constants=False):
+    # the decorator of supports_f192 and supports_fN: transformer_args, names 
+    # and constructors go to Transformer, renames to Renamer, imports binds ty 
+    # in the generated module and options are everything else the generated 
+    # code depends on
+    target_type = transformer_args[0]
+    
     def supports_f192_base(fn):
-        transformer = Transformer(ty.f192_t, 
-                                  {ast.Add: ty.add_f192,
-                                   ast.Sub: ty.sub_f192,
-                                   ast.Mult: ty.mul_f192,
-                                   ast.Div: ty.div_f192},
-                                  {ast.Gt: ty.gt_f192,
-                                   ast.Lt: ty.lt_f192,
-                                   ast.Eq: ty.eq_f192,
-                                   ast.GtE: ty.ge_f192,
-                                   ast.LtE: ty.le_f192})
-        annotator = TypeAnnotator(globals_dict)
+        transformer = Transformer(*transformer_args, names=names, constructors=constructors)
+        transformer.fold_constants = fold_constants
+        # the folded and fused float literals depend on default_fp, so the cache key does as well
+        literal_fp = str(ti.lang.impl.get_runtime().default_fp)
+        transformer.literal_fp = ti.f64 if literal_fp == 'f64' else ti.f32
+        if count_flags:
+            # before any kernel compiles, even when the cache has the module
+            flags.register(fn.__name__)
+            transformer.count_flags = fn.__name__
+        if profile:
+            profiler.register(fn.__name__, inspect.getsourcefile(fn), fn.__code__.co_firstlineno)
+        annotator = TypeAnnotator(globals_dict, known_return_types)
         
         source = textwrap.dedent(inspect.getsource(fn))
+        if cache:
+            key = cache_key(source, f192_signature(fn, globals_dict, target_type, constructors), imports, *options, literal_fp)
+            path = cache_path(fn.__name__, key)
+            if lookup(path):
+                if verbose:
+                    with open(path) as f:
+                        print(f.read())
+                return load(path, fn.__name__)
+        
         tree = ast.parse(source)
         annotator.visit(tree)
+        transformer.soa = {name: t.ndim for name, t in annotator.env.items() if isinstance(t, SoA)}
+        transformer.packed = {name for name, t in annotator.env.items() if t is f192p_t}
+        transformer.packed |= {name for name in fn.__code__.co_names 
+                               if name not in annotator.env and is_f192p_field(globals_dict.get(name))}
         
         tree.body[0].decorator_list = []
 
         # Transform function (annotations, ops, etc.)
         tree = transformer.visit(tree)
+        if optimize:
+            Optimizer(globals_dict, constructors).optimize(tree.body[0].body)
+        if profile:
+            tree = Profiler(fn.__name__, globals_dict).visit(tree)
+        if renames:
+            tree = Renamer(renames, globals_dict).visit(tree)
         ast.fix_missing_locations(tree)
 
         # Get unparsed Python code
         transformed_source = ast.unparse(tree)
         
         file_path = '\\'.join(__file__.split('\\')[:-1])
-        imports = f'''
+        header = f'''
 from __main__ import *
 import sys
 sys.path.append(r'{file_path}')
-import float192 as ty
-
-'''
-
-        # Write to a temporary .py file
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as f:
-            f.write(imports + transformed_source)
-            temp_path = f.name
-            
-            if verbose:
-                print(imports + transformed_source)
+''' + imports
+        if verbose:
+            print(header + transformed_source)
+        
+        if cache:
+            store(path, header + transformed_source)
+        else:
+            # Write to a temporary .py file
+            with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as f:
+                f.write(header + transformed_source)
+                path = f.name
 
         # Load as Python module
-        spec = importlib.util.spec_from_file_location("temp_module", temp_path)
-        module = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(module)
-        
-        ret_fnc = getattr(module, fn.__name__)
-        
-        return ret_fnc
+        return load(path, fn.__name__)
     return supports_f192_base
\ No newline at end of file
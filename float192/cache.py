@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+import os
+import hashlib
+import importlib.util
+
+# On-disk cache of the modules supports_f192 generates.
+#
+# A generated module is stored as <function name>_<key>.py, where the key is
+# a hash of everything the transformation depends on (the function source,
+# the options, which annotations/return types are f192) and of the sources
+# of this package, so a changed float192 never reuses stale code. A warm
+# start only hashes and imports the file, and the path of a function stays
+# the same between runs.
+#
+# The directory is FLOAT192_CACHE_DIR if set, ~/.cache/float192 otherwise.
+# Above max_size bytes the least recently used files are removed.
+
+max_size = 64*2**20
+
+_version = None
+_used = set() # loaded by this process, these are never evicted (Taichi reads the source when compiling)
+
+def cache_dir():
+    return os.environ.get('FLOAT192_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'float192'))
+
+def package_version():
+    global _version
+    if _version is None:
+        h = hashlib.sha256()
+        package = os.path.dirname(os.path.abspath(__file__))
+        for name in sorted(os.listdir(package)):
+            if name.endswith('.py'):
+                with open(os.path.join(package, name), 'rb') as f:
+                    h.update(name.encode() + b'\0' + f.read())
+        _version = h.hexdigest()
+    return _version
+
+def cache_key(*parts):
+    h = hashlib.sha256(package_version().encode())
+    for part in parts:
+        h.update(repr(part).encode() + b'\0')
+    return h.hexdigest()[:32]
+
+def cache_path(name, key):
+    return os.path.join(cache_dir(), f'{name}_{key}.py')
+
+def lookup(path):
+    if not os.path.isfile(path):
+        return False
+    os.utime(path) # the mtime is the last use for the eviction
+    return True
+
+def store(path, source):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        f.write(source)
+    os.replace(tmp, path) # atomic, concurrent processes see either nothing or the whole file
+    evict()
+
+def load(path, name):
+    module_name = 'float192_cache_' + os.path.basename(path)[:-3]
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    _used.add(os.path.abspath(path))
+    return getattr(module, name)
+
+def _cached_files():
+    directory = cache_dir()
+    if not os.path.isdir(directory):
+        return []
+    ret = []
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name.endswith('.py') and os.path.isfile(path):
+            st = os.stat(path)
+            ret.append((st.st_mtime, st.st_size, path))
+    return ret
+
+def _remove(path):
+    for p in (path, importlib.util.cache_from_source(path)):
+        try:
+            os.remove(p)
+        except OSError:
+            pass
+
+def evict(limit=None):
+    limit = max_size if limit is None else limit
+    files = sorted(_cached_files())
+    total = sum(size for _, size, _ in files)
+    for _, size, path in files:
+        if total <= limit:
+            break
+        if os.path.abspath(path) not in _used:
+            _remove(path)
+            total -= size
+
+def clear_f192_cache():
+    """Removes every cached supports_f192 module, returns the number of removed files."""
+    files = _cached_files()
+    for _, _, path in files:
+        _remove(path)
+    return len(files)
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from mpmath import mp, mpf
+
+# Bulk host-side conversions between numpy/python values and f192 arrays.
+#
+# An f192 array is an np.uint32 array of shape (..., 6) with the same layout
+# as f192_t: limbs 0-3 hold the mantissa (little endian, normalized so that
+# the top bit of limb 3 is set), limb 4 the sign (bit 0) and flags, limb 5
+# the exponent with a bias of 0x80000000. The value of an element is
+# mantissa * 2**(exponent - 0x80000000).
+#
+# Everything that can be done on the limbs is done with numpy integer ops on
+# whole arrays, python integers are only used where the input is a python
+# object anyway (strings, ints, mpf).
+
+EXP_BIAS = 0x80000000
+ZERO_EXP = EXP_BIAS - 128 # exponent str_to_f192 uses for 0
+
+_U32 = np.uint64(0xffffffff)
+_bit_length = np.frompyfunc(int.bit_length, 1, 1)
+
+
+def _bit_length_u64(x):
+    # exact for every uint64: split in two exactly representable halves
+    hi = (x >> np.uint64(32)).astype(np.float64)
+    lo = (x & _U32).astype(np.float64)
+    return np.where(hi > 0, np.frexp(hi)[1] + 32, np.frexp(lo)[1]).astype(np.int64)
+
+def _shl_u128(hi, lo, s):
+    # 128 bit shift up of (hi, lo) by s in [0, 127], numpy gives 0 for shifts >= 64
+    s = s.astype(np.uint64)
+    hi_new = np.where(s >= 64, lo << (s - np.uint64(64)), (hi << s) | (lo >> (np.uint64(64) - s)))
+    lo_new = np.where(s >= 64, np.uint64(0), lo << s)
+    hi_new = np.where(s == 0, hi, hi_new)
+    return hi_new, lo_new
+
+def _pack(sign, hi, lo, exp):
+    # (hi, lo) is the 128 bit mantissa, normalizes it and builds the f192 array
+    sign = np.asarray(sign)
+    zero = (hi == 0) & (lo == 0)
+    bits = np.where(hi > 0, _bit_length_u64(hi) + 64, _bit_length_u64(lo))
+    shift = np.where(zero, 0, 128 - bits)
+    hi, lo = _shl_u128(hi, lo, shift)
+
+    exp = np.where(zero, ZERO_EXP - EXP_BIAS, exp - shift)
+    if np.any((exp < -EXP_BIAS) | (exp >= EXP_BIAS)):
+        raise OverflowError('exponent out of the range of f192')
+
+    ret = np.empty(hi.shape + (6,), dtype=np.uint32)
+    ret[..., 0] = lo & _U32
+    ret[..., 1] = lo >> np.uint64(32)
+    ret[..., 2] = hi & _U32
+    ret[..., 3] = hi >> np.uint64(32)
+    ret[..., 4] = sign
+    ret[..., 5] = exp + EXP_BIAS
+    return ret
+
+def _pack_ints(sign, mant, exp, rounding='nearest'):
+    # mant is an object array of non negative python ints, the value is mant*2**exp
+    assert rounding in ('nearest', 'truncate'), f'unknown rounding {rounding}, use nearest or truncate'
+    mant = np.asarray(mant, dtype=object)
+    exp = np.asarray(exp, dtype=np.int64)
+    bits = _bit_length(mant).astype(np.int64)
+
+    # keep the top 128 bits, rounding to nearest so that decimal strings with
+    # 40 significant digits survive a round trip (or truncating)
+    shift = bits - 128
+    down = np.maximum(shift, 0).astype(object)
+    mant = mant << np.maximum(-shift, 0).astype(object)
+    half = np.where((shift > 0) & (rounding == 'nearest'), 1 << (down - 1).clip(0), 0)
+    mant = (mant + half) >> down
+    carry = _bit_length(mant).astype(np.int64) > 128
+    mant = np.where(carry, mant >> 1, mant)
+    exp = exp + shift + carry
+
+    hi = np.asarray(mant >> 64, dtype=object).astype(np.uint64)
+    lo = np.asarray(mant & ((1 << 64) - 1), dtype=object).astype(np.uint64)
+    return _pack(sign, hi, lo, exp)
+
+def _flat_objects(values):
+    arr = np.asarray(values, dtype=object)
+    return arr.reshape(-1), arr.shape
+
+def _unpack(a):
+    a = np.asarray(a, dtype=np.uint32)
+    assert a.shape[-1] == 6, 'f192 arrays must have a trailing axis of length 6'
+    limbs = a[..., :4].astype(np.uint64)
+    hi = (limbs[..., 3] << np.uint64(32)) | limbs[..., 2]
+    lo = (limbs[..., 1] << np.uint64(32)) | limbs[..., 0]
+    sign = a[..., 4] & 1
+    exp = a[..., 5].astype(np.int64) - EXP_BIAS
+    return sign, hi, lo, exp
+
+def _unpack_ints(a):
+    sign, hi, lo, exp = _unpack(a)
+    mant = (hi.astype(object) << 64) | lo.astype(object)
+    return sign, mant, exp
+
+
+def f64_to_f192_array(x):
+    """Converts a float64 array (or anything np.asarray accepts) exactly."""
+    x = np.asarray(x, dtype=np.float64)
+    if not np.all(np.isfinite(x)):
+        raise ValueError('cannot convert inf or nan to f192')
+
+    m, e = np.frexp(np.abs(x))
+    mant = (m * 2.0**53).astype(np.uint64) # exact, also for subnormals
+    return _pack(np.signbit(x).astype(np.uint32), np.zeros_like(mant), mant, e.astype(np.int64) - 53)
+
+def int_to_f192_array(values):
+    """Converts integers (numpy integer arrays or python ints of any size)."""
+    arr = np.asarray(values)
+    if arr.dtype.kind == 'u':
+        mag = arr.astype(np.uint64)
+        return _pack(np.zeros(arr.shape, np.uint32), np.zeros_like(mag), mag, np.zeros(arr.shape, np.int64))
+    if arr.dtype.kind == 'i':
+        sign = (arr < 0).astype(np.uint32)
+        mag = np.abs(arr.astype(np.int64)).astype(np.uint64) # also right for the int64 minimum
+        return _pack(sign, np.zeros_like(mag), mag, np.zeros(arr.shape, np.int64))
+
+    arr, shape = _flat_objects(values)
+    sign = (arr < 0).astype(np.uint32)
+    return _pack_ints(sign, np.abs(arr), np.zeros(arr.shape, np.int64)).reshape(shape + (6,))
+
+def mpf_to_f192_array(values):
+    """Converts mpf values (or anything mpf accepts) without going through strings."""
+    arr, shape = _flat_objects(values)
+    raw = np.frompyfunc(lambda v: (v if isinstance(v, mpf) else mpf(v))._mpf_, 1, 1)(arr)
+    sign, man, exp, bc = (np.array([r[i] for r in raw], dtype=object) for i in range(4))
+    if np.any((man == 0) & (exp != 0)):
+        raise ValueError('cannot convert inf or nan to f192')
+
+    return _pack_ints(sign.astype(np.uint32), man, exp.astype(np.int64)).reshape(shape + (6,))
+
+def _parse_decimal(s):
+    s = s.strip().lower()
+    exp10 = 0
+    if 'e' in s:
+        s, e = s.split('e')
+        exp10 = int(e)
+    neg = s.startswith('-')
+    s = s.lstrip('+-')
+    int_part, _, frac_part = s.partition('.')
+    digits = int(int_part + frac_part or '0')
+    return int(neg), digits, exp10 - len(frac_part)
+
+def str_to_f192_array(strings, rounding='nearest'):
+    """Converts decimal strings, rounding to the nearest f192 (rounding='truncate' gives the bits of str_to_f192)."""
+    arr, shape = _flat_objects(strings)
+    sign, digits, exp10 = np.frompyfunc(_parse_decimal, 1, 3)(arr)
+    exp10 = exp10.astype(np.int64)
+
+    # digits * 10**exp10 = digits * 5**exp10 * 2**exp10, so only a division
+    # by 5**-exp10 has to be carried out, with enough extra bits for 128 bits
+    mant = np.empty(arr.shape, dtype=object)
+    exp = exp10.copy()
+    for e in np.unique(exp10):
+        sel = exp10 == e
+        pow5 = 5**abs(int(e))
+        if e >= 0:
+            mant[sel] = digits[sel]*pow5
+        else:
+            extra = np.maximum(130 + pow5.bit_length() - _bit_length(digits[sel]).astype(np.int64), 0)
+            mant[sel] = (digits[sel] << extra.astype(object))//pow5
+            exp[sel] -= extra
+    return _pack_ints(sign.astype(np.uint32), mant, exp, rounding).reshape(shape + (6,))
+
+
+def f192_array_to_f64(a):
+    """Converts an f192 array to float64, rounding to nearest."""
+    sign, hi, lo, exp = _unpack(a)
+
+    # fold the discarded bits into a sticky bit so that the conversion of hi
+    # rounds correctly
+    hi = hi | (lo != 0).astype(np.uint64)
+    with np.errstate(over='ignore'):
+        ret = np.ldexp(hi.astype(np.float64), np.clip(exp + 64, -1 << 30, 1 << 30).astype(np.int32))
+    return np.where(sign == 1, -ret, ret)
+
+def f192_array_to_mpf(a):
+    """Converts an f192 array to an object array of mpf values (exact at mp.prec >= 128)."""
+    sign, mant, exp = _unpack_ints(a)
+    signed = np.where(sign == 1, -mant, mant)
+    return np.asarray(np.frompyfunc(lambda m, e: mpf((int(m), int(e))), 2, 1)(signed, exp), dtype=object)
+
+def _to_str(sign, mant, exp, digits):
+    if mant == 0:
+        return '0.0'
+    if abs(exp) > 4096: # the exact integer route would need huge integers
+        return mp.nstr(mpf((-mant if sign else mant, exp)), digits)
+
+    bits = mant.bit_length() + exp
+    p = int(np.floor((bits - 1)*0.30102999566398120)) - digits + 1
+    while True:
+        num = (mant << max(exp, 0))*10**max(-p, 0)
+        den = (1 << max(-exp, 0))*10**max(p, 0)
+        s = (2*num + den)//(2*den)
+        if s >= 10**digits:
+            p += 1
+        elif s < 10**(digits - 1):
+            p -= 1
+        else:
+            break
+
+    s = str(s)
+    frac = s[1:].rstrip('0') or '0'
+    e10 = p + digits - 1
+    return ('-' if sign else '') + s[0] + '.' + frac + (f'e{e10:+d}' if e10 else '')
+
+def f192_array_to_str(a, digits=40):
+    """Converts an f192 array to decimal strings with the given significant digits."""
+    sign, mant, exp = _unpack_ints(a)
+    to_str = np.frompyfunc(lambda s, m, e: _to_str(int(s), int(m), int(e), digits), 3, 1)
+    return np.asarray(to_str(sign, mant, exp), dtype=object)
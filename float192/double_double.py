@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import taichi as ti
+from taichi.lang import impl
+from mpmath import mp, mpf
+from .float192 import f192_t, add_f192, sub_f192, f64_to_f192, f192_to_f64
+from .codec import mpf_to_f192_array, EXP_BIAS
+
+# Double-double arithmetic, the floating point backend of supports_f192.
+#
+# A dd_t is an unevaluated sum hi + lo of two f64 with |lo| <= ulp(hi)/2,
+# about 106 bits of mantissa (32 digits) in the exponent range of f64. The
+# operations are built from the error-free transformations TwoSum and
+# TwoProd (Dekker's product with Veltkamp splitting, Taichi has no fma), so
+# they run on the FPU instead of the u32 carry chains of float192.py and
+# need f64 support (CPU, CUDA), not u64.
+#
+# The error-free transformations only hold with IEEE rounding of every
+# operation, Taichi must be initialized with ti.init(fast_math=False)
+# (checked when a kernel using them is compiled). There are no error flags,
+# a division by zero gives inf/nan like f64.
+#
+# supports_f192(globals(), backend='dd') runs an f192 kernel on dd_t: the
+# operators become the functions below and f192_t, the f192 constructors
+# and conversions are renamed to their dd versions, so the kernel arguments
+# are dd arrays. f192_to_dd/dd_to_f192 convert inside kernels, the *_array
+# functions on the host.
+
+dd_t = ti.types.vector(2, ti.f64)
+
+SPLITTER = 134217729.0 # 2**27 + 1
+LO_MIN = 2.0**-130 # lo/hi below the f192 mantissa
+
+@ti.func
+def two_sum(a, b):
+    ti.static_assert(not impl.current_cfg().fast_math, 'double-double needs ti.init(fast_math=False)')
+    s = a + b
+    bb = s - a
+    return s, (a - (s - bb)) + (b - bb)
+
+@ti.func
+def quick_two_sum(a, b):
+    # |a| >= |b|
+    s = a + b
+    return s, b - (s - a)
+
+@ti.func
+def split(a):
+    t = SPLITTER*a
+    hi = t - (t - a)
+    return hi, a - hi
+
+@ti.func
+def two_prod(a, b):
+    ti.static_assert(not impl.current_cfg().fast_math, 'double-double needs ti.init(fast_math=False)')
+    p = a*b
+    ah, al = split(a)
+    bh, bl = split(b)
+    return p, ((ah*bh - p) + ah*bl + al*bh) + al*bl
+
+@ti.func
+def dd(hi, lo) -> dd_t:
+    return ti.Vector([hi, lo], ti.f64)
+
+@ti.func
+def neg_dd(a: dd_t) -> dd_t:
+    return -a
+
+@ti.func
+def add_dd(a: dd_t, b: dd_t) -> dd_t:
+    s, e = two_sum(a[0], b[0])
+    t, f = two_sum(a[1], b[1])
+    s, e = quick_two_sum(s, e + t)
+    s, e = quick_two_sum(s, e + f)
+    return dd(s, e)
+
+@ti.func
+def sub_dd(a: dd_t, b: dd_t) -> dd_t:
+    return add_dd(a, -b)
+
+@ti.func
+def mul_dd(a: dd_t, b: dd_t) -> dd_t:
+    p, e = two_prod(a[0], b[0])
+    p, e = quick_two_sum(p, e + (a[0]*b[1] + a[1]*b[0]))
+    return dd(p, e)
+
+@ti.func
+def mul_dd_f64(a: dd_t, b: ti.f64) -> dd_t:
+    p, e = two_prod(a[0], b)
+    p, e = quick_two_sum(p, e + a[1]*b)
+    return dd(p, e)
+
+@ti.func
+def sqr_dd(a: dd_t) -> dd_t:
+    p, e = two_prod(a[0], a[0])
+    p, e = quick_two_sum(p, e + 2*a[0]*a[1])
+    return dd(p, e)
+
+@ti.func
+def mul_dd_u32(a: dd_t, k: ti.u32) -> dd_t:
+    return mul_dd_f64(a, ti.f64(k))
+
+@ti.func
+def mul_dd_pow2(a: dd_t, k: ti.i32) -> dd_t:
+    # exact for |k| <= 1022 without over- or underflow
+    return a*ti.bit_cast(ti.u64(k + 1023) << 52, ti.f64)
+
+@ti.func
+def div_dd(a: dd_t, b: dd_t) -> dd_t:
+    # three quotient digits, each correcting the remainder of the previous ones
+    q1 = a[0]/b[0]
+    r = sub_dd(a, mul_dd_f64(b, q1))
+    q2 = r[0]/b[0]
+    r = sub_dd(r, mul_dd_f64(b, q2))
+    q3 = r[0]/b[0]
+    q1, q2 = quick_two_sum(q1, q2)
+    return add_dd(dd(q1, q2), dd(q3, 0.0))
+
+@ti.func
+def sqrt_dd(a: dd_t) -> dd_t:
+    # one Newton step on the f64 square root: s + (a - s*s)/(2*s), nan below zero like f64
+    ret = dd(ti.sqrt(a[0]), 0.0)
+    if a[0] > 0:
+        x = 1/ti.sqrt(a[0])
+        s = a[0]*x
+        p, e = two_prod(s, s)
+        r = sub_dd(a, dd(p, e))
+        hi, lo = two_sum(s, r[0]*x*0.5)
+        ret = dd(hi, lo)
+    return ret
+
+@ti.func
+def rsqrt_dd(a: dd_t) -> dd_t:
+    return div_dd(dd(1.0, 0.0), sqrt_dd(a))
+
+@ti.func
+def hypot_dd(a: dd_t, b: dd_t) -> dd_t:
+    return sqrt_dd(add_dd(sqr_dd(a), sqr_dd(b)))
+
+@ti.func
+def fma_dd(a: dd_t, b: dd_t, c: dd_t) -> dd_t:
+    return add_dd(mul_dd(a, b), c)
+
+@ti.func
+def gt_dd(a: dd_t, b: dd_t) -> ti.i32:
+    return (a[0] > b[0]) | ((a[0] == b[0]) & (a[1] > b[1]))
+@ti.func
+def eq_dd(a: dd_t, b: dd_t) -> ti.i32:
+    return (a[0] == b[0]) & (a[1] == b[1])
+@ti.func
+def lt_dd(a: dd_t, b: dd_t) -> ti.i32:
+    return (a[0] < b[0]) | ((a[0] == b[0]) & (a[1] < b[1]))
+@ti.func
+def ge_dd(a: dd_t, b: dd_t) -> ti.i32:
+    return (a[0] > b[0]) | ((a[0] == b[0]) & (a[1] >= b[1]))
+@ti.func
+def le_dd(a: dd_t, b: dd_t) -> ti.i32:
+    return (a[0] < b[0]) | ((a[0] == b[0]) & (a[1] <= b[1]))
+
+@ti.func
+def i32_to_dd(val: ti.i32) -> dd_t:
+    return dd(ti.f64(val), 0.0)
+
+@ti.func
+def f32_to_dd(f: ti.f32) -> dd_t:
+    return dd(ti.f64(f), 0.0)
+
+@ti.func
+def f64_to_dd(f: ti.f64) -> dd_t:
+    return dd(f, 0.0)
+
+@ti.func
+def dd_to_f32(a: dd_t) -> ti.f32:
+    return ti.f32(a[0] + a[1])
+
+@ti.func
+def dd_to_f64(a: dd_t) -> ti.f64:
+    return a[0] + a[1]
+
+@ti.real_func
+def f192_to_dd(a: f192_t) -> dd_t:
+    hi = f192_to_f64(a)
+    lo = ti.f64(0.0)
+    if hi != 0 and ti.abs(hi) < ti.math.inf:
+        lo = f192_to_f64(sub_f192(a, f64_to_f192(hi)))
+    return dd(hi, lo)
+
+@ti.real_func
+def dd_to_f192(a: dd_t) -> f192_t:
+    ret = f64_to_f192(a[0])
+    if ti.abs(a[1]) > ti.abs(a[0])*LO_MIN:
+        ret = add_f192(ret, f64_to_f192(a[1]))
+    return ret
+
+def str_to_dd(val: str):
+    with mp.workprec(200):
+        x = mpf(val)
+        hi = float(x)
+        return ti.Vector([hi, float(x - hi)], ti.f64)
+
+def f192_array_to_dd_array(a):
+    """f192 array (..., 6) -> dd array (..., 2) of hi, lo (rounded to 106 bits)."""
+    a = np.asarray(a, dtype=np.uint32)
+    # the mantissa in exact 53, 53 and 22 bit pieces
+    hi = (a[..., 3].astype(np.uint64) << np.uint64(32)) | a[..., 2]
+    lo = (a[..., 1].astype(np.uint64) << np.uint64(32)) | a[..., 0]
+    exp = np.clip(a[..., 5].astype(np.int64) - EXP_BIAS, -4000, 4000)
+    p1 = np.ldexp((hi >> np.uint64(11)).astype(np.float64), exp + 75)
+    p2 = np.ldexp((((hi & np.uint64(0x7ff)) << np.uint64(42)) | (lo >> np.uint64(22))).astype(np.float64), exp + 22)
+    p3 = np.ldexp((lo & np.uint64(0x3fffff)).astype(np.float64), exp)
+    # p1 + p2 + p3 -> hi + lo with TwoSum in numpy (IEEE)
+    s = p1 + p2
+    e = p2 - (s - p1)
+    e = e + p3
+    ret = np.empty(a.shape[:-1] + (2,))
+    ret[..., 0] = s + e
+    ret[..., 1] = e - (ret[..., 0] - s)
+    ret[(a[..., 4] & 1) == 1] *= -1
+    ret[a[..., 3] == 0] = 0
+    return ret
+
+def dd_array_to_f192_array(a):
+    """dd array (..., 2) -> f192 array (..., 6), exact up to the 128 bit mantissa."""
+    a = np.asarray(a, dtype=np.float64)
+    with mp.workprec(2200):
+        values = np.frompyfunc(lambda hi, lo: mpf(hi) + mpf(lo), 2, 1)(a[..., 0], a[..., 1])
+    return mpf_to_f192_array(values)
+
+def dd_array_to_f64(a):
+    a = np.asarray(a, dtype=np.float64)
+    return a[..., 0] + a[..., 1]
+
+def f64_to_dd_array(x):
+    x = np.asarray(x, dtype=np.float64)
+    return np.stack([x, np.zeros_like(x)], axis=-1)
+
+
+if __name__ == '__main__':
+    # python -m float192.double_double
+    # accuracy of the dd operations against mpmath and the same f192 kernel 
+    # with both backends
+    import time
+    import tempfile
+    # the names of the package, not the ones of this __main__ module
+    from float192 import supports_f192, f192_t, i32_to_f192, f64_to_f192_array, f192_array_to_mpf
+    from float192 import dd_t, add_dd, sub_dd, mul_dd, div_dd, hypot_dd, f192_array_to_dd_array, dd_array_to_f192_array
+
+    ti.init(arch=ti.cpu, fast_math=False, offline_cache_file_path=tempfile.mkdtemp())
+    n = 20000
+    rng = np.random.default_rng(0)
+    x = f64_to_f192_array(rng.uniform(-1, 1, n)*2.0**rng.integers(-40, 40, n))
+    x[:, :2] = rng.integers(0, 2**32, (n, 2), dtype=np.uint32) # the low mantissa limbs
+    y = f64_to_f192_array(rng.uniform(-1, 1, n)*2.0**rng.integers(-40, 40, n))
+    a, b = f192_array_to_dd_array(x), f192_array_to_dd_array(y)
+
+    @ti.kernel
+    def ops(a: ti.types.ndarray(dd_t, 1), b: ti.types.ndarray(dd_t, 1), out: ti.types.ndarray(dd_t, 2)):
+        for i in a:
+            out[i, 0] = add_dd(a[i], b[i])
+            out[i, 1] = sub_dd(a[i], b[i])
+            out[i, 2] = mul_dd(a[i], b[i])
+            out[i, 3] = div_dd(a[i], b[i])
+            out[i, 4] = hypot_dd(a[i], b[i])
+
+    out = np.zeros((n, 5, 2))
+    ops(a, b, out)
+    with mp.workprec(400):
+        am, bm = f192_array_to_mpf(dd_array_to_f192_array(a)), f192_array_to_mpf(dd_array_to_f192_array(b))
+        res = f192_array_to_mpf(dd_array_to_f192_array(out))
+        for k, (name, op) in enumerate((('add', lambda u, v: u + v), ('sub', lambda u, v: u - v),
+                                        ('mul', lambda u, v: u*v), ('div', lambda u, v: u/v),
+                                        ('hypot', lambda u, v: mp.sqrt(u*u + v*v)))):
+            err = max(float(abs(res[i, k] - op(am[i], bm[i]))/abs(op(am[i], bm[i])))*2.0**104 for i in range(n))
+            print(f'{name} max relative error {err:.2f} * 2**-104')
+    err = max(float(abs(u - v)/abs(v)) for u, v in zip(f192_array_to_mpf(dd_array_to_f192_array(a)), f192_array_to_mpf(x)))
+    print(f'f192 -> dd max relative error 2**{np.log2(err):.1f}')
+
+    def iterate(x: ti.types.ndarray(f192_t, 1), c: ti.types.ndarray(f192_t, 1)):
+        for i in x:
+            z = x[i]
+            for _ in range(64):
+                z = z*z - c[i]/i32_to_f192(4)
+            x[i] = z
+
+    for backend in ('f192', 'dd'):
+        kernel = ti.kernel(supports_f192(globals(), backend=backend)(iterate))
+        z = np.zeros((n, 6), np.uint32) if backend == 'f192' else np.zeros((n, 2))
+        c = x if backend == 'f192' else a
+        kernel(z[:1].copy(), c[:1].copy())
+        t = time.perf_counter()
+        kernel(z, c)
+        t = time.perf_counter() - t
+        print(f'{backend:4s} {64*2*n/t/1e6:7.2f} M ops/s')
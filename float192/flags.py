@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import taichi as ti
+
+# Device-side counters of the error flags (limb 4 of f192_t without the sign
+# bit) for supports_f192(..., count_flags=True).
+#
+# The flags are sticky: a result carries the flags of its operands, so a
+# single zero division taints everything computed from it. The counters
+# therefore count the operations that raise a flag, not the flagged values:
+# every f192 operation of a decorated function is wrapped by counted1/2/3,
+# which compare the flags of the result with the ones of the f192 operands
+# and atomically add 1 to counts[row, bit] for every new bit. The row
+# belongs to the decorated function (by name), so each kernel or ti.func
+# has its own counters. Operations that raise nothing cost an OR and a
+# branch, the atomics only run on the rare flagged results.
+#
+# The field is allocated by the first decorated function that counts (fields
+# cannot be created while a kernel compiles), the host reads it with
+# flag_counts() and clears it with reset_flag_counts(). The generated code
+# imports this module from the float192 package itself, the inline variants
+# (see inlining.py) are copies of the package and would have their own
+# counters. Only the low FLAG_BITS bits are counted, a static branch per bit
+# is compiled into every wrapped operation.
+
+FLAG_NAMES = {1: 'impossible outcome', 2: 'zero division', 3: 'f32 underflow in division'}
+MAX_FUNCTIONS = 256 # rows of the counter field
+FLAG_BITS = 8
+
+counts = None # ti.field(ti.i64, (MAX_FUNCTIONS, FLAG_BITS)) once allocated
+rows = {} # name of the decorated function -> its row of counts
+
+def register(name):
+    # the row of counts for name, allocates the field on the first call
+    global counts
+    if counts is None:
+        counts = ti.field(ti.i64, (MAX_FUNCTIONS, FLAG_BITS))
+    if name not in rows:
+        assert len(rows) < MAX_FUNCTIONS, f'more than {MAX_FUNCTIONS} functions count flags'
+        rows[name] = len(rows)
+    return rows[name]
+
+@ti.func
+def flag_word(x, f192: ti.template()):
+    # the flags of an operand, 0 for the ones that are not f192 (e.g. the u32 of mul_f192_u32)
+    ret = ti.u32(0)
+    if ti.static(f192):
+        ret = x[4]
+    return ret
+
+@ti.func
+def count_new(ret, before, name: ti.template()):
+    new = ret[4] & ~before & ti.u32(0xfffffffe)
+    if new != 0:
+        for bit in ti.static(range(1, FLAG_BITS)):
+            if new & ti.u32(1 << bit):
+                ti.atomic_add(counts[ti.static(rows[name]), bit], 1)
+
+@ti.func
+def counted1(op: ti.template(), name: ti.template(), f192: ti.template(), a):
+    ret = op(a)
+    count_new(ret, flag_word(a, f192[0]), name)
+    return ret
+
+@ti.func
+def counted2(op: ti.template(), name: ti.template(), f192: ti.template(), a, b):
+    ret = op(a, b)
+    count_new(ret, flag_word(a, f192[0]) | flag_word(b, f192[1]), name)
+    return ret
+
+@ti.func
+def counted3(op: ti.template(), name: ti.template(), f192: ti.template(), a, b, c):
+    ret = op(a, b, c)
+    count_new(ret, flag_word(a, f192[0]) | flag_word(b, f192[1]) | flag_word(c, f192[2]), name)
+    return ret
+
+COUNTED = {1: 'counted1', 2: 'counted2', 3: 'counted3'} # the wrapper by the number of arguments
+
+def flag_counts(name=None):
+    """
+    The number of operations that raised each flag since the last reset, as
+    {function name: {flag name: count}} (only the nonzero ones), or the
+    {flag name: count} of one function.
+    """
+    table = counts.to_numpy() if counts is not None else np.zeros((0, FLAG_BITS), np.int64)
+    ret = {}
+    for fn, row in rows.items():
+        ret[fn] = {FLAG_NAMES.get(bit, f'1 << {bit}'): int(n) for bit, n in enumerate(table[row]) if n}
+    if name is not None:
+        return ret.get(name, {})
+    return {fn: c for fn, c in ret.items() if c}
+
+def reset_flag_counts(name=None):
+    """Sets the counters of all functions (or of one) to zero."""
+    if counts is None:
+        return
+    if name is None:
+        counts.fill(0)
+    elif name in rows:
+        table = counts.to_numpy()
+        table[rows[name]] = 0
+        counts.from_numpy(table)
+
+
+if __name__ == '__main__':
+    # python -m float192.flags [n]
+    # cost of count_flags=True on a division heavy kernel, 1 in 16 of the
+    # divisors is zero
+    import sys
+    import time
+    # the names of the package, not the ones of this __main__ module
+    from float192 import supports_f192, f192_t, f64_to_f192_array, flag_counts, reset_flag_counts
+    
+    ti.init(arch=ti.cpu)
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    
+    def kernel(count_flags):
+        @ti.kernel
+        @supports_f192(globals(), count_flags=count_flags)
+        def iterate(a: ti.types.ndarray(f192_t, 1), b: ti.types.ndarray(f192_t, 1), out: ti.types.ndarray(f192_t, 1)):
+            for i in a:
+                x = a[i]
+                for _ in range(8):
+                    x = x/b[i] + x*b[i] - a[i]
+                out[i] = x
+        return iterate
+    
+    rng = np.random.default_rng(0)
+    a = f64_to_f192_array(rng.uniform(-1, 1, n))
+    b = f64_to_f192_array(np.where(np.arange(n) % 16 == 0, 0.0, rng.uniform(0.5, 2, n)))
+    out = np.zeros_like(a)
+    for count_flags in (False, True):
+        iterate = kernel(count_flags)
+        iterate(a, b, out)
+        reset_flag_counts()
+        t = time.perf_counter()
+        iterate(a, b, out)
+        t = time.perf_counter() - t
+        print(f'count_flags={count_flags!s:5s} {4*8*n/t/1e6:6.2f} M ops/s  {flag_counts()}')
@@ -6,6 +6,7 @@ Created on Sat Jun 28 20:45:13 2025
 """
 import taichi as ti
 from . import mantissa128 as m 
+from .inlining import layer_func
 from mpmath import mp, mpf
 
 mp.prec = 200
@@ -14,21 +15,21 @@ mp.prec = 200
 # error flags:
     # 1 << 1: impossible outcome
     # 1 << 2: zero division
-    # 1 << 3: unhandled case of f32 underflow in division
+    # 1 << 3: unhandled case of f32 underflow in division (no longer raised,
+    #         the division seed only depends on the mantissa)
     
 
 f192_t = ti.types.vector(6, ti.u32)
 
-@ti.real_func
+func = layer_func('float192', __package__) # ti.real_func or ti.func, see inlining.py
+
+@func
 def neg_f192(a: ti.types.vector(6, ti.u32)) -> f192_t:
     ret = a
-    if a[4] == 0:
-        ret[4] = ti.u32(1) | a[4]
-    else:
-        ret[4] = ti.u32(0) | (a[4] & ti.u32(0xfffffffe))
+    ret[4] = a[4] ^ ti.u32(1)
     return ret
 
-@ti.real_func
+@func
 def equalize_exp(v10: ti.types.vector(6, ti.u32), 
                  v20: ti.types.vector(6, ti.u32)) -> [f192_t, f192_t]:
     ret1 = ti.Vector([0]*6, ti.u32)
@@ -69,166 +70,369 @@ def equalize_exp(v10: ti.types.vector(6, ti.u32),
         ret1[5] = exp
     return [ret1, ret2]
 
-@ti.real_func 
+@func
 def normalize(a: ti.types.vector(6, ti.u32)) -> f192_t:
-    shift_limb = m.leading_zero_limbs(a)
-    ret = a
-    
-    if shift_limb < 4:
-        shift_bit = 31-m.log2_u32(a[3-shift_limb])
-        # print(a[3-shift_limb], log2_u32(a[3-shift_limb]))
-        
-        if shift_bit != 0:
-            ret = m.bit_shift_up_simple(ret, shift_bit)
-        
-        if shift_limb != 0:
-            ret = m.limb_shift_up(ret, shift_limb)
-        ret[5] = a[5] - shift_limb*32 - shift_bit 
-    
+    # the top bit of the mantissa to bit 127, zero stays as it is
+    shift = m.clz_u128(a)
+    ret = m.bit_shift_up_u128(a, shift)
     ret[4] = a[4]
-    
+    ret[5] = ti.select(shift < 128, a[5] - ti.u32(shift), a[5])
     return ret
 
-@ti.real_func
-def add_f192(self0: f192_t, other0: f192_t) -> f192_t:
-    self, other = equalize_exp(self0, other0)
-    ret = ti.Vector([0]*6, ti.u32)
-    
-    if self[4]%2 == other[4]%2:
-        ret, of = m.add_u128_hi(self, other)
-        ret[4] = self[4] | other[4]
-        ret[5] = self[5]
-        if of:
-            ret[5] += 32
-
-    elif self[4]%2 == 1 and other[4]%2 == 0:
-        ret = m.sub_u128(other, self)
+def make_add_f192(subtract):
+    # add_f192 and sub_f192 (which adds the negated other). The exponent words
+    # and the zero tests pick the path:
+    #   - a zero operand or an exponent gap of 128 bits or more: the result is
+    #     the larger operand as it is, the smaller one is below its last place
+    #     (for a difference the gap has to be above 128: at 128 a power of two
+    #     minus the smaller one is 2 ulp of the binade below under it),
+    #   - the same signs: the smaller mantissa shifted to the larger exponent
+    #     is added, a carry shifts the sum down by a bit,
+    #   - opposite signs: the mantissas are subtracted, with a gap the bits
+    #     shifted out of the smaller one are subtracted too (256 bits), so a
+    #     cancellation does not shift zeros into the result.
+    # The result is truncated, the flags of both operands are kept.
+    def add_f192(self: f192_t, other0: f192_t) -> f192_t:
+        other = other0
+        if ti.static(subtract):
+            other[4] ^= ti.u32(1)
         
-        ret[5] = self[5]
+        zero_a = (self[0] | self[1] | self[2] | self[3]) == 0
+        zero_b = (other[0] | other[1] | other[2] | other[3]) == 0
+        # x is the operand with the larger exponent, a zero is never x unless both are
+        swap = zero_a or (not zero_b and other[5] > self[5])
+        x, y = self, other
+        if swap:
+            x, y = other, self
+        flags = (self[4] | other[4]) & ti.u32(0xfffffffe)
+        gap = x[5] - y[5]
+        ret = x
         
-        if m.gt_u128(self, other):
-            ret[4] = ti.u32(1) | self[4] | other[4]
+        same_sign = (x[4] & ti.u32(1)) == (y[4] & ti.u32(1))
+        if zero_a and zero_b:
+            ret[4] = self[4] & other[4] # -0 only for -0 + -0
+        elif zero_a or zero_b or gap > 128 or (gap == 128 and same_sign):
+            pass
+        elif same_sign:
+            s = m.bit_shift_down_u128(y, ti.i32(gap))
+            ret, of = m.add_u128_hi(x, s)
+            ret[4] = x[4]
+            ret[5] = x[5] + ti.u32(of)
+        elif gap == 0:
+            d = m.sub_u128(x, y)
+            d[5] = x[5]
+            ret = normalize(d)
+            ret[4] = ti.select(m.gt_u128(y, x), y[4], x[4])
+            if m.eq_u128(ret, m.u128()):
+                ret[4] = ti.u32(0)
         else:
-            ret[4] = ti.u32(0) | (self[4] & ti.u32(0xfffffffe)) | (other[4] & ti.u32(0xfffffffe))
-    
-    elif other[4]%2 == 1 and self[4]%2 == 0:
-        ret = m.sub_u128(self, other)
-        
-        ret[5] = self[5]
+            zero = m.u128()
+            p = m.sub_u256(m.join_u256(x, zero), m.bit_shift_down_u256(m.join_u256(y, zero), ti.i32(gap)))
+            hi, lo = m.split_u256(p)
+            ret, of = m.normalize_u256(hi, lo)
+            ret[4] = x[4]
+            ret[5] = x[5] - ti.u32(128) + ti.u32(of)
         
-        if m.gt_u128(other, self):
-            ret[4] = ti.u32(1) | self[4] | other[4]
-        else:
-            ret[4] = ti.u32(0) | (self[4] & ti.u32(0xfffffffe)) | (other[4] & ti.u32(0xfffffffe))
-    else:
-        ret[4] = ti.u32(1 << 1)
-    
-    
-    # print(ret)
-    ret = normalize(ret)
+        ret[4] |= flags
+        return ret
+    # supports_f192 calls the operators by their __name__
+    add_f192.__name__ = add_f192.__qualname__ = 'sub_f192' if subtract else 'add_f192'
+    return func(add_f192)
+
+add_f192 = make_add_f192(False)
+sub_f192 = make_add_f192(True)
+
+@func
+def mul_sign_exp(self: f192_t, other: f192_t, mant: f192_t, of: ti.i32) -> f192_t:
+    # fills in sign, flags and exponent of a product with the mantissa 
+    # mant ~ mant(self)*mant(other)*2**-of
+    ret = mant
+    ret[5] = (self[5] & ti.u32(0x7fffffff)) + (other[5] & ti.u32(0x7fffffff))
+    if (self[5] & ti.u32(0x80000000)) == (other[5] & ti.u32(0x80000000)):
+        ret[5] ^= ti.u32(0x80000000)
+    ret[5] += of
+    ret[4] = ((self[4] ^ other[4]) & ti.u32(1)) | ((self[4] | other[4]) & ti.u32(0xfffffffe))
     return ret
 
-@ti.real_func 
-def sub_f192(self0: f192_t, other0: f192_t) -> f192_t:
-    self, other = equalize_exp(self0, other0)
-    # print(self, other)
+@func
+def mul_f192(self: f192_t, other: f192_t) -> f192_t:
+    # a zero or power of two operand (the mantissa 2**127) skips the product,
+    # the shifts are the ones mul_u128_hi gives for them
     ret = ti.Vector([0]*6, ti.u32)
+    of = -128
+    low_a = self[0] | self[1] | self[2]
+    low_b = other[0] | other[1] | other[2]
+    if (low_a | self[3]) == 0 or (low_b | other[3]) == 0:
+        pass
+    elif low_a == 0 and self[3] == ti.u32(0x80000000):
+        ret = other
+        of = 127
+    elif low_b == 0 and other[3] == ti.u32(0x80000000):
+        ret = self
+        of = 127
+    else:
+        ret, of = m.mul_u128_hi(self, other)
+    return mul_sign_exp(self, other, ret, of)
+
+@func
+def mul_f192_trunc(self: f192_t, other: f192_t) -> f192_t:
+    # same as mul_f192 but skips the partial products that only reach the
+    # result through carries, at most 8 units in the last place below it
+    ret, of = m.mul_u128_hi_trunc(self, other)
+    return mul_sign_exp(self, other, ret, of)
+
+@func
+def sqr_f192(self: f192_t) -> f192_t:
+    ret, of = m.sqr_u128_hi(self)
+    return mul_sign_exp(self, self, ret, of)
+
+@func
+def mul_f192_u32(self: f192_t, other: ti.u32) -> f192_t:
+    ret = ti.Vector([0, 0, 0, 0, self[4], ti.u32(0x80000000)], ti.u32)
+    if other != 0:
+        ret, shift = m.mul_u128_u32_hi(self, other)
+        ret[4] = self[4]
+        ret[5] = self[5] + ti.u32(shift)
+    return ret
+
+@func
+def mul_f192_pow2(self: f192_t, k: ti.i32) -> f192_t:
+    # self*2**k, only touches the exponent
+    ret = self
+    if not m.eq_u128(self, ti.Vector([0]*6, ti.u32)):
+        ret[5] = self[5] + ti.u32(k)
+    return ret
+
+@func
+def fma_f192(a: f192_t, b: f192_t, c: f192_t) -> f192_t:
+    # a*b + c, the sum is formed with the exact 256 bit product and 
+    # normalized (truncated) only once
+    zero = ti.Vector([0]*6, ti.u32)
+    ret = c
+    flags = (a[4] | b[4] | c[4]) & ti.u32(0xfffffffe)
     
-    if self[4]%2 != other[4]%2:
-        ret, of = m.add_u128_hi(self, other)
-        ret[4] = self[4] | (other[4] & ti.u32(0xfffffffe))
-        ret[5] = self[5]
-        if of:
-            ret[5] += 32 
+    if m.eq_u128(a, zero) or m.eq_u128(b, zero):
+        ret = normalize(c)
     else:
-        ret = m.sub_u128(self, other)
+        hi, lo = m.mul_full_u128(a, b)
+        p = m.join_u256(hi, lo)
+        exp = a[5] + b[5] - ti.u32(0x80000000) # the exponent of p as a 256 bit mantissa
+        sign = (a[4] ^ b[4]) & ti.u32(1)
         
-        if m.gt_u128(other, self):
-            ret[4] = ti.u32(1)
-        else:
-            ret[4] = ti.u32(0)
-        
-        ret[4] ^= self[4]%2
-        ret[4] |= (self[4] & ti.u32(0xfffffffe)) | (other[4] & ti.u32(0xfffffffe))
-        ret[5] = self[5]
+        if not m.eq_u128(c, zero):
+            q = m.join_u256(c, zero)
+            exp_c = c[5] - ti.u32(128)
+            diff = ti.i32(exp - exp_c)
+            if diff >= 0:
+                q = m.bit_shift_down_u256(q, diff)
+            else:
+                p = m.bit_shift_down_u256(p, -diff)
+                exp = exp_c
+            
+            if sign == c[4] & ti.u32(1):
+                p, carry = m.add_full_u256(p, q)
+                if carry:
+                    p = m.bit_shift_down_u256(p, 1)
+                    p[7] |= ti.u32(0x80000000)
+                    exp += 1
+            elif m.lt_u256(p, q):
+                p = m.sub_u256(q, p)
+                sign = c[4] & ti.u32(1)
+            else:
+                p = m.sub_u256(p, q)
         
-        # print(ret)
-        # print(normalize(ret))
+        hi, lo = m.split_u256(p)
+        ret, of = m.normalize_u256(hi, lo)
+        ret[4] = sign
+        ret[5] = exp + ti.u32(of)
+        if m.eq_u128(ret, zero):
+            ret[5] = ti.u32(0x80000000)
     
-    ret = normalize(ret)
+    ret[4] |= flags
     return ret
 
-@ti.real_func 
-def mul_f192(self: f192_t, other: f192_t) -> f192_t:
-    ret, of = m.mul_u128_hi(self, other)
-    # print(ret, of)
-    ret[5] = (self[5] & ti.u32(0x7fffffff)) + (other[5] & ti.u32(0x7fffffff))
-    if (self[5] & ti.u32(0x80000000)) == (other[5] & ti.u32(0x80000000)):
-        ret[5] ^= ti.u32(0x80000000)
-    ret[5] += of
-    ret[4] = ti.u32(self[4] != other[4]) | ((self[4] | other[4]) & ti.u32(0xfffffffe))
+def make_mul_f192_top(n):
+    # mul_f192 on the top n limbs of the mantissas
+    mul_u128_hi = m.mul_u128_hi_top[n]
     
-    return ret
+    @func
+    def mul_f192_top(self: f192_t, other: f192_t) -> f192_t:
+        ret, of = mul_u128_hi(self, other)
+        return mul_sign_exp(self, other, ret, of)
+    return mul_f192_top
 
-@ti.real_func
+# indexed by the number of limbs used
+mul_f192_top = [None] + [make_mul_f192_top(n) for n in range(1, 4)] + [mul_f192]
+
+@func
 def f32_to_f192(f: ti.f32) -> f192_t:
-    exp = ti.u32(0)
-    exp0 = -ti.i32(ti.math.log2((2**24-1)/abs(f)))
-    mant = ti.u32(abs(f) / ti.pow(ti.f32(2.0), exp0))
-    sgn = ti.u32(f != abs(f))
+    bits = ti.bit_cast(f, ti.u32)
+    exp = (bits >> 23) & ti.u32(0xff)
+    frac = bits & ti.u32(0x7fffff)
     
     ret = m.u128()
-    ret[0] = mant
-    ret[4] = sgn
-    if exp0 >= 0:
-        exp = ti.u32(exp0)
-        ret[5] = ti.u32(0x80000000) | ti.u32(exp)
+    if exp == 0: # zero and subnormals
+        ret[0] = frac
+        ret[5] = ti.u32(0x80000000 - 149)
+        if frac == 0:
+            ret[5] = ti.u32(0x80000000)
+        ret = normalize(ret)
     else:
-        exp = ti.u32(-exp0)
-        ret[5] = ti.u32(0x80000000) - exp 
-    return normalize(ret)
+        ret[3] = (frac | ti.u32(0x800000)) << 8
+        ret[5] = ti.u32(0x80000000 - 254) + exp
+    
+    ret[4] = bits >> 31
+    if exp == 0xff: # inf and nan
+        ret[4] |= ti.u32(1 << 1)
+    return ret
 
-@ti.real_func
+@func
 def f192_to_f32(a: ti.types.vector(6, ti.u32)) -> ti.f32:
-    mant = a[3] >> 8
-    exp = ti.i32(0)
-    if a[5] > ti.u32(0x80000000):
-        exp = ti.i32(a[5] - ti.u32(0x80000000)) + 104
-    else:
-        exp = -ti.i32(ti.u32(0x80000000) - a[5]) + 104
-    sgn = a[4]%2
+    # rounds to nearest even, the mantissa is assumed to be normalized
+    exp = ti.i32(a[5] - ti.u32(0x80000000)) + 254
+    shift = 8
+    if exp <= 0:
+        shift += 1 - exp
     
-    ret = ti.f32(mant * ti.pow(ti.f32(2.0), exp))
-    if sgn:
-        ret *= -1
+    bits = ti.u32(0)
+    if shift <= 32 and a[3] != 0:
+        mant = ti.u32(0)
+        if shift < 32:
+            mant = a[3] >> shift
+        rnd = (a[3] >> (shift - 1)) & 1
+        rest = (a[3] & ((ti.u32(1) << (shift - 1)) - 1)) | a[2] | a[1] | a[0]
+        if rnd and (rest or mant & 1):
+            mant += 1
+        
+        # the implicit bit of mant carries into the exponent field
+        bits = (ti.u32(max(exp, 1) - 1) << 23) + mant
+        if exp >= 0xff or bits >= ti.u32(0x7f800000):
+            bits = ti.u32(0x7f800000)
+    
+    bits |= (a[4] & 1) << 31
+    return ti.bit_cast(bits, ti.f32)
+
+@func
+def f64_to_f192(f: ti.f64) -> f192_t:
+    bits = ti.bit_cast(f, ti.u64)
+    hi = ti.u32(bits >> 32)
+    lo = ti.u32(bits & ti.u64(0xffffffff))
+    exp = (hi >> 20) & ti.u32(0x7ff)
+    frac = hi & ti.u32(0xfffff)
     
+    ret = m.u128()
+    if exp == 0: # zero and subnormals
+        ret[0] = lo
+        ret[1] = frac
+        ret[5] = ti.u32(0x80000000 - 1074)
+        if frac == 0 and lo == 0:
+            ret[5] = ti.u32(0x80000000)
+        ret = normalize(ret)
+    else:
+        ret[3] = ((frac | ti.u32(0x100000)) << 11) | (lo >> 21)
+        ret[2] = lo << 11
+        ret[5] = ti.u32(0x80000000 - 1150) + exp
+    
+    ret[4] = hi >> 31
+    if exp == 0x7ff: # inf and nan
+        ret[4] |= ti.u32(1 << 1)
     return ret
 
-@ti.real_func 
-def div_f192(self:f192_t, other:f192_t) -> f192_t:
+@func
+def f192_to_f64(a: ti.types.vector(6, ti.u32)) -> ti.f64:
+    # rounds to nearest even, the mantissa is assumed to be normalized
+    exp = ti.i32(a[5] - ti.u32(0x80000000)) + 1150
+    shift = 11
+    if exp <= 0:
+        shift += 1 - exp
+    
+    bits = ti.u64(0)
+    if shift <= 64 and a[3] != 0:
+        top = (ti.u64(a[3]) << 32) | ti.u64(a[2])
+        mant = ti.u64(0)
+        if shift < 64:
+            mant = top >> shift
+        rnd = (top >> (shift - 1)) & 1
+        rest = ti.u32((top & ((ti.u64(1) << (shift - 1)) - 1)) != 0) | a[1] | a[0]
+        if rnd and (rest or mant & 1):
+            mant += 1
+        
+        bits = (ti.u64(max(exp, 1) - 1) << 52) + mant
+        if exp >= 0x7ff or bits >= ti.u64(0x7ff0000000000000):
+            bits = ti.u64(0x7ff0000000000000)
+    
+    bits |= ti.u64(a[4] & 1) << 63
+    return ti.bit_cast(bits, ti.f64)
+
+def newton_schedule(seed_bits, bits=128):
+    # Newton steps y += y*(1 - d*y) for 1/d starting from a seed correct to 
+    # seed_bits bits, every step doubles the correct bits. A step from p to 
+    # t bits needs d*y to t bits (the 1 - d*y cancels), but y*(1 - d*y) only
+    # to t - p bits, returns the limbs used for both products in each step
+    schedule = []
+    while seed_bits < bits:
+        target = min(2*seed_bits, bits)
+        schedule.append((min(4, -(-(target + 2)//32)), min(4, -(-(target - seed_bits + 2)//32))))
+        seed_bits = target
+    return schedule
+
+def make_div_f192(name, seed_bits, to_float, from_float):
+    # Newton division seeded by the reciprocal of the mantissa computed in 
+    # the float type of to_float/from_float (exact to about seed_bits bits)
+    schedule = newton_schedule(seed_bits)
+    
+    def div_f192(self: f192_t, other: f192_t) -> f192_t:
+        zero = ti.Vector([0]*6, ti.u32)
+        ret = ti.Vector([0]*6, ti.u32)
+        
+        if not m.eq_u128(other, zero):
+            one = ti.Vector([0, 0, 0, ti.u32(0x80000000), 0, ti.u32(0x80000000 - 127)], ti.u32)
+            
+            # d in [0.5, 1) so the seed can not over- or underflow
+            d = other
+            d[4] = ti.u32(0)
+            d[5] = ti.u32(0x80000000 - 128)
+            y = from_float(1/to_float(d))
+            
+            for k in ti.static(range(len(schedule))):
+                e = sub_f192(one, ti.static(mul_f192_top[schedule[k][0]])(d, y))
+                y = add_f192(y, ti.static(mul_f192_top[schedule[k][1]])(y, e))
+            
+            # self/other = self*y*2**-(exp(other) - exp(d))
+            ret = mul_f192(self, y)
+            ret[5] = ret[5] - other[5] + ti.u32(0x80000000 - 128)
+            ret[4] ^= other[4] & ti.u32(1)
+            ret[4] |= other[4] & ti.u32(0xfffffffe)
+        else:
+            ret = ti.Vector([ti.u32(0xffffffff)]*6, ti.u32)
+            ret[4] = ti.u32(1) if self[4]%2 != other[4]%2 else ti.u32(0)
+            ret[4] |= (self[4] & ti.u32(0xfffffffe)) | (other[4] & ti.u32(0xfffffffe))
+            ret[4] |= 1 << 2
+            ret[5] = ti.u32(0xfffeffff)
+        
+        return ret
+    # supports_f192 calls the operators by their __name__
+    div_f192.__name__ = div_f192.__qualname__ = name
+    return func(div_f192)
+
+# f32 seed: 23 bits, 3 steps on 2, 3 and 4 limbs
+div_f192 = make_div_f192('div_f192', 23, f192_to_f32, f32_to_f192)
+# f64 seed: 52 bits, 2 steps (needs f64 support on the backend)
+div_f192_f64 = make_div_f192('div_f192_f64', 52, f192_to_f64, f64_to_f192)
+
+@func
+def div_f192_long(self: f192_t, other: f192_t) -> f192_t:
+    # bit by bit long division, slow but the quotient is exactly truncated
     zero = ti.Vector([0]*6, ti.u32)
     ret = ti.Vector([0]*6, ti.u32)
-    # tmp1 = ti.Vector([0]*6, ti.u32)
-    # tmp2 = ti.Vector([0]*6, ti.u32)
-    # tmp3 = ti.Vector([0]*6, ti.u32)
     
     if not m.eq_u128(other, zero):
-        o_f32 = f192_to_f32(other)
-        o_inv = normalize(ti.Vector([0,0,0,0,0,ti.u32(0x80000000)], ti.u32))
-        if o_f32 != 0:
-            o_inv = f32_to_f192(1/f192_to_f32(other))
-        else:
-            o_inv[4] |= 1 << 3
-        two = normalize(ti.Vector([2,0,0,0,0,ti.u32(0x80000000)], ti.u32))
-        # print(f192_to_f32(two))
-        # print(two)
-        
-        ti.loop_config(serialize=True)
-        for i in range(7):
-            # print(f192_to_f32(o_inv), f192_to_f32(mul_f192(other, o_inv)), f192_to_f32(sub_f192(two, mul_f192(other, o_inv))), f192_to_f32(mul_f192(o_inv, sub_f192(two, mul_f192(other, o_inv)))))
-            o_inv = mul_f192(o_inv, sub_f192(two, mul_f192(other, o_inv)))
-        
-        ret = mul_f192(self, o_inv)
+        q, shift = m.div_u128_hi(self, other)
+        ret = q
+        ret[5] = self[5] - other[5] + ti.u32(0x80000000) + ti.u32(shift)
+        ret[4] = ((self[4] ^ other[4]) & ti.u32(1)) | ((self[4] | other[4]) & ti.u32(0xfffffffe))
+        if m.eq_u128(self, zero):
+            ret[5] = ti.u32(0x80000000)
     else:
         ret = ti.Vector([ti.u32(0xffffffff)]*6, ti.u32)
         ret[4] = ti.u32(1) if self[4]%2 != other[4]%2 else ti.u32(0)
@@ -238,30 +442,113 @@ def div_f192(self:f192_t, other:f192_t) -> f192_t:
     
     return ret
 
-@ti.real_func 
+def make_sqrt_f192(seed_bits, to_float, from_float):
+    # x = d*2**p with d in [0.25, 1) and p even, y = 1/sqrt(d) is seeded in 
+    # the float type of to_float/from_float and refined by the Newton steps
+    # y += y*(1 - d*y*y)/2 (no division, the schedule of newton_schedule), 
+    # rsqrt(x) = y*2**(-p/2). sqrt(x) = s*2**(p/2) takes the last step on 
+    # s = d*y instead: s += y*(d - s*s)/2 (Karp's trick)
+    schedule = newton_schedule(seed_bits)
+    steps = len(schedule)
+    
+    @ti.func
+    def reduce_sqrt(x):
+        # d and p/2, select only (inlined into the real_funcs)
+        p = ti.i32(x[5] - ti.u32(0x80000000)) + 128
+        d = x
+        d[4] = ti.u32(0)
+        d[5] = ti.u32(0x80000000 - 128) - ti.u32(p & 1)
+        return d, (p + (p & 1)) >> 1
+    
+    @ti.func
+    def rsqrt_mant(d, steps: ti.template()):
+        # y after the first steps of the schedule
+        one = ti.Vector([0, 0, 0, ti.u32(0x80000000), 0, ti.u32(0x80000000 - 127)], ti.u32)
+        y = from_float(1/ti.sqrt(to_float(d)))
+        for k in ti.static(range(steps)):
+            mul_a = ti.static(mul_f192_top[schedule[k][0]])
+            e = sub_f192(one, mul_a(d, mul_a(y, y)))
+            y = add_f192(y, mul_f192_pow2(ti.static(mul_f192_top[schedule[k][1]])(y, e), -1))
+        return y
+    
+    @func
+    def rsqrt_f192(self: f192_t) -> f192_t:
+        ret = ti.Vector([ti.u32(0xffffffff)]*6, ti.u32)
+        ret[4] = self[4] | ti.u32(1 << 2)
+        ret[5] = ti.u32(0xfffeffff)
+        if self[3] != 0:
+            d, half = reduce_sqrt(self)
+            ret = rsqrt_mant(d, steps)
+            ret[5] -= ti.u32(half)
+            ret[4] = self[4] & ti.u32(0xfffffffe)
+            if self[4] & 1:
+                ret[4] |= ti.u32(1 << 1)
+        return ret
+    
+    @func
+    def sqrt_f192(self: f192_t) -> f192_t:
+        ret = self
+        if self[3] != 0:
+            d, half = reduce_sqrt(self)
+            y = rsqrt_mant(d, ti.static(steps - 1))
+            s = mul_f192(d, y)
+            r = sub_f192(d, sqr_f192(s))
+            ret = add_f192(s, mul_f192_pow2(ti.static(mul_f192_top[schedule[-1][1]])(y, r), -1))
+            ret[5] += ti.u32(half)
+            ret[4] = self[4] & ti.u32(0xfffffffe)
+            if self[4] & 1:
+                ret[4] |= ti.u32(1 << 1)
+        return ret
+    return rsqrt_f192, sqrt_f192
+
+# f32 seed: 22 bits, 3 steps on 2, 3 and 4 limbs, the square root of a 
+# negative number is the one of its magnitude with the 1 << 1 flag
+rsqrt_f192, sqrt_f192 = make_sqrt_f192(22, f192_to_f32, f32_to_f192)
+
+@func
+def hypot_f192(self: f192_t, other: f192_t) -> f192_t:
+    # no over- or underflow to care about with 32 bit exponents, fma_f192 
+    # rounds self**2 + other**2 once
+    return sqrt_f192(fma_f192(self, self, sqr_f192(other)))
+
+@func
 def cmp_f192(self: f192_t, other: f192_t) -> ti.i32:
-    v1, v2 = equalize_exp(self, other)
-    return m.cmp_u128(v1, v2)
+    # -1, 0 or 1 ordered by the sign, then the exponent, then the mantissa
+    # limbs, no alignment is needed since the mantissas are normalized, 
+    # zeros (any exponent, any sign) are equal and between the signs
+    zero1 = (self[0] | self[1] | self[2] | self[3]) == 0
+    zero2 = (other[0] | other[1] | other[2] | other[3]) == 0
+    
+    # the magnitudes, the highest differing word decides
+    mag = 0
+    for i in ti.static(range(4)):
+        mag = ti.select(self[i] != other[i], ti.select(self[i] > other[i], 1, -1), mag)
+    mag = ti.select(self[5] != other[5], ti.select(self[5] > other[5], 1, -1), mag)
+    mag = ti.select(zero1, ti.select(zero2, 0, -1), ti.select(zero2, 1, mag))
+    
+    neg1 = (self[4] & 1) == 1 and not zero1
+    neg2 = (other[4] & 1) == 1 and not zero2
+    return ti.select(neg1 != neg2, ti.select(neg1, -1, 1), ti.select(neg1, -mag, mag))
 
-@ti.real_func 
+@func
 def gt_f192(self: f192_t, other: f192_t) -> ti.i32:
     return cmp_f192(self, other) == 1
-@ti.real_func 
+@func
 def eq_f192(self: f192_t, other: f192_t) -> ti.i32:
     return cmp_f192(self, other) == 0
-@ti.real_func 
+@func
 def lt_f192(self: f192_t, other: f192_t) -> ti.i32:
     return cmp_f192(self, other) == -1
-@ti.real_func 
+@func
 def ge_f192(self: f192_t, other: f192_t) -> ti.i32:
     v = cmp_f192(self, other) 
     return v == 1 or v == 0
-@ti.real_func 
+@func
 def le_f192(self: f192_t, other: f192_t) -> ti.i32:
     v = cmp_f192(self, other) 
     return v == -1 or v == 0
 
-@ti.real_func 
+@func
 def i32_to_f192(val: ti.i32) -> f192_t:
     ret = ti.Vector([0]*6, ti.u32)
     ret[0] = ti.u32(abs(val))
@@ -289,36 +576,87 @@ def str_to_f192(val: str):
     
 #%% test
 if __name__ == '__main__':
-    ti.init(arch=ti.cpu, fast_math=False, advanced_optimization = False)
+    # python -m float192.float192
+    import numpy as np
+    from .codec import f192_array_to_mpf
+    
+    ti.init(arch=ti.cpu)
     
     @ti.kernel
-    def test_f192():
-        two = normalize(ti.Vector([2,0,0,0,0,ti.u32(0x80000000)], ti.u32))
-        print(two)
-        # one = ti.Vector([0, 0, ti.u32(2021654528), ti.u32(4294967182), 0, ti.u32(2147483520)], ti.u32)
-        # two, one = equalize_exp(two, one)
-        # print(two, one, m.neg_u128(one))
-        # print(f192_to_f32(sub_f192(two, one)))
-        # a = f32_to_f192(-289.80362)
-        # b = f32_to_f192(-64.00007)
-        # # o_inv = ti.Vector([ti.u32(4294966532), ti.u32(2617298183), 10616820, ti.u32(2147481344), 1, ti.u32(2147483515)], ti.u32)
-        # # print(b, o_inv, f192_to_f32(mul_f192(b, o_inv)))
-        # # print(mul_f192(b, o_inv))
-        # # print(m.mul_full_u128(b, o_inv))
-        
-        # # s = sub_f192(a, b)
-        # p = div_f192(a, b)
-        # # print(s)
-        # print(p)
-        
-        # # fs = f192_to_f32(s)
-        # fp = f192_to_f32(p)
-        
-        # # print(fs)  # Expected ≈ -0.75
-        # print(fp)  # Expected ≈ -3.375
-        
-        # Optional: Check error flags
-        # print("Add flags:", s[4])
-        # print("Mul flags:", p[4])
+    def test_ops(a: ti.types.ndarray(f192_t, 1), 
+                 b: ti.types.ndarray(f192_t, 1), 
+                 res: ti.types.ndarray(f192_t, 2)):
+        for i in a:
+            res[0, i] = mul_f192(a[i], b[i])
+            res[1, i] = mul_f192_trunc(a[i], b[i])
+            res[2, i] = div_f192(a[i], b[i])
+            res[3, i] = div_f192_f64(a[i], b[i])
+            res[4, i] = div_f192_long(a[i], b[i])
+            res[5, i] = sqr_f192(a[i])
+            res[6, i] = fma_f192(a[i], b[i], a[i])
+            res[7, i] = mul_f192_u32(a[i], b[i][0])
+            res[8, i] = sqrt_f192(b[i])
+            res[9, i] = rsqrt_f192(b[i])
+            res[10, i] = hypot_f192(a[i], b[i])
+            res[11, i] = add_f192(a[i], b[i])
+            res[12, i] = sub_f192(a[i], b[i])
+    
+    n = 100000
+    rng = np.random.default_rng(0)
+    a, b = (np.zeros((n, 6), dtype=np.uint32) for _ in range(2))
+    for x in (a, b):
+        x[:, :4] = rng.integers(0, 2**32, (n, 4), dtype=np.uint64)
+        x[:, 3] |= 0x80000000
+        x[:, 4] = rng.integers(0, 2, n)
+        x[:, 5] = 0x80000000 - 128 + rng.integers(-100, 100, n)
+    a[:100, :4] = b[:100, :4] = 0xffffffff
+    a[100:200, :4] = b[100:200, :4] = [0, 0, 0, 0x80000000]
+    res = np.zeros((13, n, 6), dtype=np.uint32)
+    test_ops(a, b, res)
+    
+    a_mp, b_mp = f192_array_to_mpf(a), f192_array_to_mpf(b)
+    k_mp = b[:, 0].astype(object)
+    refs = {'mul_f192': a_mp*b_mp, 'mul_f192_trunc': a_mp*b_mp, 
+            'div_f192': a_mp/b_mp, 'div_f192_f64': a_mp/b_mp, 'div_f192_long': a_mp/b_mp, 
+            'sqr_f192': a_mp*a_mp, 'fma_f192': a_mp*b_mp + a_mp, 'mul_f192_u32': a_mp*k_mp,
+            'sqrt_f192': [mp.sqrt(abs(x)) for x in b_mp], 'rsqrt_f192': [1/mp.sqrt(abs(x)) for x in b_mp],
+            'hypot_f192': [mp.sqrt(x*x + y*y) for x, y in zip(a_mp, b_mp)],
+            'add_f192': a_mp + b_mp, 'sub_f192': a_mp - b_mp}
+    for (name, ref), r in zip(refs.items(), res):
+        ulp = np.array([mp.ldexp(1, int(e) - 0x80000000) for e in r[:, 5]])
+        err = np.abs((f192_array_to_mpf(r) - ref)/ulp).astype(float)
+        print(f'{name}: max error {err.max():.3f} ulp, mean {err.mean():.3f} ulp')
+    
+    # throughput of the general paths and the fast paths of add, sub and mul
+    import time
+    
+    @ti.kernel
+    def chain(op: ti.template(), a: ti.types.ndarray(f192_t, 1), b: ti.types.ndarray(f192_t, 1), 
+              out: ti.types.ndarray(f192_t, 1)):
+        for i in a:
+            r = a[i]
+            for _ in ti.static(range(8)):
+                r = op(r, b[i])
+            out[i] = r
     
-    test_f192()
+    n = 1_000_000
+    x = np.zeros((n, 6), dtype=np.uint32)
+    x[:, :4] = rng.integers(0, 2**32, (n, 4), dtype=np.uint64)
+    x[:, 3] |= 0x80000000
+    x[:, 4] = rng.integers(0, 2, n)
+    x[:, 5] = 0x80000000 + rng.integers(-30, 30, n)
+    zero = x.copy()
+    zero[:, :4] = 0
+    gap = x.copy()
+    gap[:, 5] -= 200
+    pow2 = x.copy()
+    pow2[:, :4] = [0, 0, 0, 0x80000000]
+    out = np.zeros_like(x)
+    for name, op in (('add', add_f192), ('sub', sub_f192), ('mul', mul_f192)):
+        for case, y in (('general', x[::-1].copy()), ('zero', zero), ('gap >= 128', gap), ('power of two', pow2)):
+            if name != 'mul' and case == 'power of two' or name == 'mul' and case == 'gap >= 128':
+                continue
+            chain(op, x, y, out)
+            t = time.perf_counter()
+            chain(op, x, y, out)
+            print(f'{name} {case:12s} {8*n/(time.perf_counter() - t)/1e6:6.1f} M ops/s')
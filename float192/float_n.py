@@ -0,0 +1,574 @@
+# -*- coding: utf-8 -*-
+import ast
+from types import SimpleNamespace
+import numpy as np
+import taichi as ti
+from mpmath import mp, mpf
+from .float192 import f192_t
+from . import mantissa128 as m
+
+# Float types with any number of 32 bit mantissa limbs, generated at runtime.
+#
+# float_type(limbs) builds f{32*(limbs + 2)} (f128, f160, f192, f256, ...) in
+# the layout of f192_t: a vector of limbs + 2 u32, limbs 0 to limbs-1 hold
+# the mantissa (little endian, normalized so that the top bit is set), limb
+# `limbs` the sign (bit 0) and the error flags, the last one the exponent
+# with a bias of 0x80000000. float_type(4) has the layout of f192_t, arrays
+# are interchangeable with the ones of float192.py.
+#
+# Every operation is a static loop over the limbs, so the cost scales with
+# the precision. Only the operations are ti.real_func, the limb helpers are
+# straight-line ti.func (selects instead of branches) that can be inlined
+# into them. The rounding is truncating: add and sub keep one guard limb,
+# mul truncates the full product and div is a bit by bit long division.
+#
+# Like mantissa128.py the limb arithmetic only uses u32: the carries and
+# borrows are compares, the products come from mul_u32 (16 bit halves) and
+# mul truncates a product scanning sum with mul_acc. Only the f64
+# conversions use u64, for the bits of the f64.
+#
+# At least 2 limbs are needed, the conversions from f64 assume that the 53
+# bits of an f64 mantissa fit.
+#
+#   T = float_type(6)
+#   T.f256_t, T.add_f256, T.mul_f256, T.lt_f256, T.f64_to_f256, ...
+#
+# supports_fN(globals(), limbs) is supports_f192 for these types.
+
+BIAS = 0x80000000
+
+def named(name):
+    # the real_funcs of different types must not share names
+    def decorator(fn):
+        fn.__name__ = fn.__qualname__ = name
+        return fn
+    return decorator
+
+def make_limb_ops(M):
+    # helpers on mantissas of M limbs, s are bit counts. The shifts by 32 - bs
+    # are only selected for bs > 0, writing them as (x >> 1) >> (31 - bs)
+    # instead lets LLVM fold a constant bs = 0 into an undefined x >> 32
+    word_bits = (M - 1).bit_length() # word shifts by 1, 2, 4, ... limbs
+
+    @ti.func
+    def shr(a, s):
+        # a >> s, 0 if s >= 32*M
+        ws = ti.i32(s) >> 5
+        bs = ti.i32(s) & 31
+        ret = a
+        for b in ti.static(range(word_bits)):
+            k = ti.static(1 << b)
+            move = (ws >> b) & 1
+            for i in ti.static(range(M - k)):
+                ret[i] = ti.select(move, ret[i + k], ret[i])
+            for i in ti.static(range(M - k, M)):
+                ret[i] = ti.select(move, ti.u32(0), ret[i])
+        for i in ti.static(range(M - 1)):
+            ret[i] = (ret[i] >> bs) | ti.select(bs == 0, ti.u32(0), ret[i + 1] << (32 - bs))
+        ret[M - 1] = ret[M - 1] >> bs
+        for i in ti.static(range(M)):
+            ret[i] = ti.select(ws >= M, ti.u32(0), ret[i])
+        return ret
+
+    @ti.func
+    def shl(a, s):
+        # a << s for s < 32*M
+        ws = ti.i32(s) >> 5
+        bs = ti.i32(s) & 31
+        ret = a
+        for b in ti.static(range(word_bits)):
+            k = ti.static(1 << b)
+            move = (ws >> b) & 1
+            for i in ti.static(range(M - 1, k - 1, -1)):
+                ret[i] = ti.select(move, ret[i - k], ret[i])
+            for i in ti.static(range(k)):
+                ret[i] = ti.select(move, ti.u32(0), ret[i])
+        for i in ti.static(range(M - 1, 0, -1)):
+            ret[i] = (ret[i] << bs) | ti.select(bs == 0, ti.u32(0), ret[i - 1] >> (32 - bs))
+        ret[0] = ret[0] << bs
+        return ret
+
+    @ti.func
+    def clz(a):
+        lz = 32*M
+        for i in ti.static(range(M)):
+            lz = ti.select(a[i] != 0, 32*(M - 1 - i) + m.clz32(a[i]), lz)
+        return lz
+
+    @ti.func
+    def add(a, b):
+        # a + b and the carry out
+        ret = a
+        carry = ti.u32(0)
+        for i in ti.static(range(M)):
+            s = a[i] + b[i]
+            ret[i] = s + carry
+            carry = ti.u32(s < a[i]) | ti.u32(ret[i] < s)
+        return ret, carry
+
+    @ti.func
+    def sub(a, b):
+        # a - b for a >= b
+        ret = a
+        borrow = ti.u32(0)
+        for i in ti.static(range(M)):
+            d = a[i] - b[i]
+            ret[i] = d - borrow
+            borrow = ti.u32(a[i] < b[i]) | ti.u32(d < borrow)
+        return ret
+
+    @ti.func
+    def cmp(a, b):
+        # -1, 0 or 1 comparing the first M limbs of a and b
+        ret = 0
+        for i in ti.static(range(M)):
+            ret = ti.select(a[i] > b[i], 1, ti.select(a[i] < b[i], -1, ret))
+        return ret
+
+    return SimpleNamespace(shr=shr, shl=shl, clz=clz, add=add, sub=sub, cmp=cmp)
+
+def make_float_type(L):
+    assert L >= 2, 'at least 2 mantissa limbs are needed'
+    N = 32*(L + 2)
+    M = L + 1 # mantissa with a guard limb
+    name = f'f{N}'
+    t = f192_t if L == 4 else ti.types.vector(L + 2, ti.u32)
+    ZERO_EXP = BIAS - 32*L
+    ops = make_limb_ops(M)
+    cmp_mant = make_limb_ops(L).cmp
+
+    @ti.func
+    def zero_of(a):
+        # zero with the flags of a
+        ret = ti.Vector([0]*(L + 2), ti.u32)
+        ret[L] = a[L] & ti.u32(0xfffffffe)
+        ret[L + 1] = ti.u32(ZERO_EXP)
+        return ret
+
+    @ti.func
+    def ext(a):
+        # the mantissa of a with a zero guard limb below
+        ret = ti.Vector([0]*M, ti.u32)
+        for i in ti.static(range(L)):
+            ret[i + 1] = a[i]
+        return ret
+
+    @ti.func
+    def pack(X, sign, exp, flags):
+        # mantissa X of M limbs (normalized or zero) without the guard limb
+        ret = ti.Vector([0]*(L + 2), ti.u32)
+        for i in ti.static(range(L)):
+            ret[i] = X[i + 1]
+        zero = X[M - 1] == 0
+        ret[L] = ti.select(zero, flags, sign | flags)
+        ret[L + 1] = ti.select(zero, ti.u32(ZERO_EXP), exp)
+        return ret
+
+    @ti.func
+    def mag_lt(a, b):
+        # |a| < |b|, zero is the smallest
+        za = ti.select(a[L - 1] == 0, 1, 0)
+        zb = ti.select(b[L - 1] == 0, 1, 0)
+        c = ti.select(a[L + 1] < b[L + 1], -1, ti.select(a[L + 1] > b[L + 1], 1, cmp_mant(a, b)))
+        return ti.select(zb == 1, 0, ti.select(za == 1, 1, ti.select(c < 0, 1, 0)))
+
+    @ti.real_func
+    @named(f'neg_{name}')
+    def neg(a: t) -> t:
+        ret = a
+        ret[L] = a[L] ^ ti.u32(1)
+        return ret
+
+    @ti.real_func
+    @named(f'add_{name}')
+    def add(a: t, b: t) -> t:
+        swap = mag_lt(a, b)
+        x, y = a, b
+        for i in ti.static(range(L + 2)):
+            x[i] = ti.select(swap, b[i], a[i])
+            y[i] = ti.select(swap, a[i], b[i])
+
+        X = ext(x)
+        Y = ops.shr(ext(y), ti.i32(ti.min(x[L + 1] - y[L + 1], ti.u32(32*M))))
+        e = x[L + 1]
+        if ((x[L] ^ y[L]) & 1) == 0:
+            S, carry = ops.add(X, Y)
+            if carry:
+                S = ops.shr(S, 1)
+                S[M - 1] |= ti.u32(0x80000000)
+                e += 1
+            X = S
+        else:
+            X = ops.sub(X, Y)
+            lz = ops.clz(X)
+            X = ops.shl(X, ti.min(lz, 32*M - 1))
+            e -= ti.u32(lz)
+        return pack(X, x[L] & 1, e, (a[L] | b[L]) & ti.u32(0xfffffffe))
+
+    @ti.real_func
+    @named(f'sub_{name}')
+    def sub(a: t, b: t) -> t:
+        nb = b
+        nb[L] = b[L] ^ ti.u32(1)
+        return add(a, nb)
+
+    @ti.real_func
+    @named(f'mul_{name}')
+    def mul(a: t, b: t) -> t:
+        # product scanning, a column of at most L products fits the 96 bits of (c2, c1, c0)
+        p = ti.Vector([0]*(2*L), ti.u32)
+        c0, c1, c2 = ti.u32(0), ti.u32(0), ti.u32(0)
+        for k in ti.static(range(2*L - 1)):
+            for i in ti.static(range(max(0, k - L + 1), min(k, L - 1) + 1)):
+                c0, c1, c2 = m.mul_acc(c0, c1, c2, a[i], b[k - i])
+            p[k] = c0
+            c0, c1, c2 = c1, c2, ti.u32(0)
+        p[2*L - 1] = c0
+
+        shift = ti.select(p[2*L - 1] < ti.u32(0x80000000), 1, 0)
+        X = ti.Vector([0]*M, ti.u32)
+        for i in ti.static(range(L)):
+            X[i + 1] = ti.select(shift, (p[L + i] << 1) | (p[L + i - 1] >> 31), p[L + i])
+        e = a[L + 1] + b[L + 1] - ti.u32(BIAS) + ti.u32(32*L) - ti.u32(shift)
+        return pack(X, (a[L] ^ b[L]) & 1, e, (a[L] | b[L]) & ti.u32(0xfffffffe))
+
+    @ti.real_func
+    @named(f'sqr_{name}')
+    def sqr(a: t) -> t:
+        return mul(a, a)
+
+    @ti.real_func
+    @named(f'mul_{name}_u32')
+    def mul_u32(a: t, k: ti.u32) -> t:
+        p = ti.Vector([0]*M, ti.u32)
+        carry = ti.u32(0)
+        for i in ti.static(range(L)):
+            hi, lo = m.mul_u32(a[i], k)
+            p[i] = lo + carry
+            carry = hi + ti.u32(p[i] < lo) # a[i]*k + carry < 2**64
+        p[L] = carry
+
+        lz = ops.clz(p)
+        p = ops.shl(p, ti.min(lz, 32*M - 1))
+        # the product has 32 bits more than the mantissa
+        return pack(p, a[L] & 1, a[L + 1] + ti.u32(32) - ti.u32(lz), a[L] & ti.u32(0xfffffffe))
+
+    @ti.real_func
+    @named(f'mul_{name}_pow2')
+    def mul_pow2(a: t, k: ti.i32) -> t:
+        ret = a
+        if a[L - 1] != 0:
+            ret[L + 1] = a[L + 1] + ti.u32(k)
+        return ret
+
+    @ti.real_func
+    @named(f'div_{name}')
+    def div(a: t, b: t) -> t:
+        # bit by bit long division, the quotient is truncated
+        ret = ti.Vector([ti.u32(0xffffffff)]*(L + 2), ti.u32)
+        flags = (a[L] | b[L]) & ti.u32(0xfffffffe)
+        if b[L - 1] == 0:
+            ret[L] = ((a[L] ^ b[L]) & 1) | flags | ti.u32(1 << 2)
+            ret[L + 1] = ti.u32(0xfffeffff)
+        elif a[L - 1] == 0:
+            ret = zero_of(a)
+            ret[L] = flags
+        else:
+            # the mantissas with a zero limb on top, the remainder stays below 2*B
+            R = ti.Vector([0]*M, ti.u32)
+            B = ti.Vector([0]*M, ti.u32)
+            for i in ti.static(range(L)):
+                R[i] = a[i]
+                B[i] = b[i]
+            e = a[L + 1] - b[L + 1] + ti.u32(BIAS) - ti.u32(32*L) + ti.u32(1)
+            if ops.cmp(R, B) < 0:
+                R = ops.shl(R, 1)
+                e -= 1
+
+            Q = ti.Vector([0]*M, ti.u32)
+            ti.loop_config(serialize=True)
+            for _ in range(32*L):
+                Q = ops.shl(Q, 1)
+                if ops.cmp(R, B) >= 0:
+                    R = ops.sub(R, B)
+                    Q[0] |= ti.u32(1)
+                R = ops.shl(R, 1)
+            ret = pack(ops.shl(Q, 32), (a[L] ^ b[L]) & 1, e, flags)
+        return ret
+
+    @ti.real_func
+    @named(f'cmp_{name}')
+    def cmp(a: t, b: t) -> ti.i32:
+        # -1, 0 or 1, zero has no sign
+        sa = ti.select(a[L - 1] == 0, ti.u32(0), a[L] & 1)
+        sb = ti.select(b[L - 1] == 0, ti.u32(0), b[L] & 1)
+        mag = mag_lt(b, a) - mag_lt(a, b)
+        return ti.select(sa != sb, ti.i32(sb) - ti.i32(sa), ti.select(sa == 1, -mag, mag))
+
+    @ti.func
+    @named(f'gt_{name}')
+    def gt(a: t, b: t) -> ti.i32:
+        c = cmp(a, b)
+        return c == 1
+    @ti.func
+    @named(f'eq_{name}')
+    def eq(a: t, b: t) -> ti.i32:
+        c = cmp(a, b)
+        return c == 0
+    @ti.func
+    @named(f'lt_{name}')
+    def lt(a: t, b: t) -> ti.i32:
+        c = cmp(a, b)
+        return c == -1
+    @ti.func
+    @named(f'ge_{name}')
+    def ge(a: t, b: t) -> ti.i32:
+        c = cmp(a, b)
+        return c != -1
+    @ti.func
+    @named(f'le_{name}')
+    def le(a: t, b: t) -> ti.i32:
+        c = cmp(a, b)
+        return c != 1
+
+    @ti.func
+    def from_u32x2(hi, lo, sign, exp, flags):
+        # (hi*2**32 + lo)*2**exp
+        X = ti.Vector([0]*M, ti.u32)
+        X[M - 1] = hi
+        X[M - 2] = lo
+        lz = ops.clz(X)
+        X = ops.shl(X, ti.min(lz, 32*M - 1))
+        return pack(X, sign, ti.u32(BIAS - 32*(L - 2)) + ti.u32(exp) - ti.u32(lz), flags)
+
+    @ti.real_func
+    @named(f'i32_to_{name}')
+    def i32_to(val: ti.i32) -> t:
+        mag = ti.select(val < 0, ti.u32(0) - ti.u32(val), ti.u32(val)) # exact for -2**31 as well
+        return from_u32x2(ti.u32(0), mag, ti.select(val < 0, ti.u32(1), ti.u32(0)), 0, ti.u32(0))
+
+    @ti.real_func
+    @named(f'f32_to_{name}')
+    def f32_to(f: ti.f32) -> t:
+        bits = ti.bit_cast(f, ti.u32)
+        exp = ti.i32((bits >> 23) & ti.u32(0xff))
+        frac = bits & ti.u32(0x7fffff)
+        mant = ti.select(exp == 0, frac, frac | ti.u32(0x800000))
+        flags = ti.select(exp == 0xff, ti.u32(1 << 1), ti.u32(0))
+        return from_u32x2(ti.u32(0), mant, bits >> 31, ti.select(exp == 0, -149, exp - 150), flags)
+
+    @ti.real_func
+    @named(f'f64_to_{name}')
+    def f64_to(f: ti.f64) -> t:
+        bits = ti.bit_cast(f, ti.u64)
+        exp = ti.i32((bits >> 52) & ti.u64(0x7ff))
+        frac = bits & ti.u64(0xfffffffffffff)
+        mant = ti.select(exp == 0, frac, frac | ti.u64(0x10000000000000))
+        flags = ti.select(exp == 0x7ff, ti.u32(1 << 1), ti.u32(0))
+        return from_u32x2(ti.u32(mant >> 32), ti.u32(mant & ti.u64(0xffffffff)), ti.u32(bits >> 63), 
+                          ti.select(exp == 0, -1074, exp - 1075), flags)
+
+    @ti.real_func
+    @named(f'{name}_to_f32')
+    def to_f32(a: t) -> ti.f32:
+        # rounds to nearest even like f192_to_f32
+        exp = ti.i32(a[L + 1] - ti.u32(BIAS)) + 32*L + 126
+        shift = 8
+        if exp <= 0:
+            shift += 1 - exp
+
+        bits = ti.u32(0)
+        if shift <= 32 and a[L - 1] != 0:
+            mant = ti.u32(0)
+            if shift < 32:
+                mant = a[L - 1] >> shift
+            rnd = (a[L - 1] >> (shift - 1)) & 1
+            rest = a[L - 1] & ((ti.u32(1) << (shift - 1)) - 1)
+            for i in ti.static(range(L - 1)):
+                rest |= a[i]
+            if rnd and (rest or mant & 1):
+                mant += 1
+
+            bits = (ti.u32(max(exp, 1) - 1) << 23) + mant
+            if exp >= 0xff or bits >= ti.u32(0x7f800000):
+                bits = ti.u32(0x7f800000)
+
+        bits |= (a[L] & 1) << 31
+        return ti.bit_cast(bits, ti.f32)
+
+    @ti.real_func
+    @named(f'{name}_to_f64')
+    def to_f64(a: t) -> ti.f64:
+        # rounds to nearest even like f192_to_f64
+        exp = ti.i32(a[L + 1] - ti.u32(BIAS)) + 32*L + 1022
+        shift = 11
+        if exp <= 0:
+            shift += 1 - exp
+
+        bits = ti.u64(0)
+        if shift <= 64 and a[L - 1] != 0:
+            top = (ti.u64(a[L - 1]) << 32) | ti.u64(a[L - 2])
+            mant = ti.u64(0)
+            if shift < 64:
+                mant = top >> shift
+            rnd = (top >> (shift - 1)) & 1
+            rest = ti.u32((top & ((ti.u64(1) << (shift - 1)) - 1)) != 0)
+            for i in ti.static(range(L - 2)):
+                rest |= a[i]
+            if rnd and (rest or mant & 1):
+                mant += 1
+
+            bits = (ti.u64(max(exp, 1) - 1) << 52) + mant
+            if exp >= 0x7ff or bits >= ti.u64(0x7ff0000000000000):
+                bits = ti.u64(0x7ff0000000000000)
+
+        bits |= ti.u64(a[L] & 1) << 63
+        return ti.bit_cast(bits, ti.f64)
+
+    def mpf_to_array(values):
+        """Iterable of numbers/strings -> array of shape (..., L + 2), rounded to nearest."""
+        values = np.asarray(values, dtype=object)
+        ret = np.empty(values.shape + (L + 2,), dtype=np.uint32)
+        flat = ret.reshape(-1, L + 2)
+        with mp.workprec(32*L + 32):
+            for k, v in enumerate(values.flat):
+                sign, man, exp, bc = mpf(v)._mpf_
+                if not man:
+                    flat[k] = [0]*L + [0, ZERO_EXP]
+                    continue
+                shift = bc - 32*L
+                if shift > 0:
+                    man = (man + (1 << (shift - 1))) >> shift
+                    if man >> (32*L):
+                        man >>= 1
+                        shift += 1
+                else:
+                    man <<= -shift
+                flat[k] = [(man >> (32*i)) & 0xffffffff for i in range(L)] + [sign, BIAS + exp + shift]
+        return ret
+
+    def array_to_mpf(a):
+        """Array of shape (..., L + 2) -> object array of mpf, exact."""
+        a = np.asarray(a, dtype=np.uint32)
+        ret = np.empty(a.shape[:-1], dtype=object)
+        flat = ret.reshape(-1)
+        for k, x in enumerate(a.reshape(-1, L + 2)):
+            man = sum(int(x[i]) << (32*i) for i in range(L))
+            v = mpf((man, int(x[L + 1]) - BIAS)) if man else mpf(0)
+            flat[k] = -v if x[L] & 1 else v
+        return ret
+
+    def f64_to_array(x):
+        """f64 values -> array of shape (..., L + 2), exact."""
+        x = np.asarray(x, dtype=np.float64)
+        m, e = np.frexp(np.abs(x))
+        top = (m*2.0**53).astype(np.uint64) << np.uint64(11)
+        ret = np.zeros(x.shape + (L + 2,), dtype=np.uint32)
+        ret[..., L - 1] = top >> np.uint64(32)
+        ret[..., L - 2] = top & np.uint64(0xffffffff)
+        ret[..., L] = np.signbit(x)
+        ret[..., L + 1] = np.where(x == 0, ZERO_EXP, BIAS + e.astype(np.int64) - 32*L)
+        ret[..., L] = np.where(x == 0, 0, ret[..., L])
+        return ret
+
+    def array_to_f64(a):
+        """Array of shape (..., L + 2) -> f64, truncated to the top 64 bits of the mantissa first."""
+        a = np.asarray(a, dtype=np.uint32)
+        top = (a[..., L - 1].astype(np.uint64) << np.uint64(32)) | a[..., L - 2]
+        exp = a[..., L + 1].astype(np.int64) - BIAS + 32*(L - 2)
+        ret = np.ldexp(top.astype(np.float64), exp)
+        return np.where(a[..., L] & 1, -ret, ret)
+
+    def str_to(val: str):
+        return ti.Vector(list(mpf_to_array([val])[0]), ti.u32)
+
+    ns = {f'{name}_t': t,
+          f'add_{name}': add, f'sub_{name}': sub, f'mul_{name}': mul, f'div_{name}': div,
+          f'neg_{name}': neg, f'sqr_{name}': sqr, f'mul_{name}_u32': mul_u32, f'mul_{name}_pow2': mul_pow2,
+          f'cmp_{name}': cmp, f'gt_{name}': gt, f'lt_{name}': lt, f'eq_{name}': eq, f'ge_{name}': ge, f'le_{name}': le,
+          f'i32_to_{name}': i32_to, f'f32_to_{name}': f32_to, f'f64_to_{name}': f64_to,
+          f'{name}_to_f32': to_f32, f'{name}_to_f64': to_f64, f'str_to_{name}': str_to,
+          f'mpf_to_{name}_array': mpf_to_array, f'{name}_array_to_mpf': array_to_mpf,
+          f'f64_to_{name}_array': f64_to_array, f'{name}_array_to_f64': array_to_f64}
+    return SimpleNamespace(limbs=L, bits=N, name=name, **ns)
+
+float_types = {}
+
+def float_type(limbs):
+    """The namespace of the float type with `limbs` 32 bit mantissa limbs (f{32*(limbs + 2)})."""
+    if limbs not in float_types:
+        float_types[limbs] = make_float_type(limbs)
+    return float_types[limbs]
+
+def supports_fN(globals_dict, limbs, verbose=False, fuse_ops=True, optimize=True, cache=True):
+    '''
+    supports_f192 for float_type(limbs): the operators and comparisons of its
+    type become calls of its functions
+    fuse_ops: emit sqr for x*x and mul_pow2/mul_u32 when multiplying or
+    dividing by an integer constant (there is no fma)
+    optimize, cache: as in supports_f192
+    '''
+    from .ast_transformer import transforming_decorator
+    T = float_type(limbs)
+    n = T.name
+    get = lambda fmt: getattr(T, fmt.format(n))
+    transformer_args = (get('{}_t'),
+                        {ast.Add: get('add_{}'), ast.Sub: get('sub_{}'),
+                         ast.Mult: get('mul_{}'), ast.Div: get('div_{}')},
+                        {ast.Gt: get('gt_{}'), ast.Lt: get('lt_{}'), ast.Eq: get('eq_{}'),
+                         ast.GtE: get('ge_{}'), ast.LtE: get('le_{}')},
+                        fuse_ops, globals_dict)
+    names = {'sqr': f'sqr_{n}', 'fma': None, 'mul_pow2': f'mul_{n}_pow2', 'mul_u32': f'mul_{n}_u32', 'neg': f'neg_{n}'}
+    constructors = (get('i32_to_{}'), get('f32_to_{}'), get('f64_to_{}'))
+    known = {c.__name__: T.__dict__[f'{n}_t'] for c in constructors}
+    imports = f'import float192 as ty\n\nty = ty.float_type({limbs})\n\n'
+    return transforming_decorator(globals_dict, transformer_args, imports, (fuse_ops, optimize), verbose, optimize, cache,
+                                  names=names, constructors=constructors, known_return_types=known)
+
+
+if __name__ == '__main__':
+    # python -m float192.float_n [limbs ...]
+    # a Mandelbrot escape time kernel through supports_fN for several limb 
+    # counts, the time per iteration grows with the precision
+    import sys
+    import time
+    import tempfile
+    # the names of the package, not the ones of this __main__ module
+    from float192 import float_type, supports_fN
+
+    # the offline cache keeps real_funcs with the same signature apart
+    ti.init(arch=ti.cpu, offline_cache_file_path=tempfile.mkdtemp())
+    limbs = [int(x) for x in sys.argv[1:]] or [2, 3, 4, 6, 8]
+    w, h, max_iter = 96, 64, 256
+    ref = None
+    for L in limbs:
+        T = float_type(L)
+        n = T.name
+        ft, i32_to, f64_to = T.__dict__[f'{n}_t'], T.__dict__[f'i32_to_{n}'], T.__dict__[f'f64_to_{n}']
+
+        @ti.kernel
+        @supports_fN(globals(), L)
+        def mandelbrot(out: ti.types.ndarray(ti.i32, 2), x0: ft, y0: ft, step: ft):
+            for i, j in out:
+                cx = x0 + step*i32_to(i)
+                cy = y0 + step*i32_to(j)
+                x = i32_to(0)
+                y = i32_to(0)
+                k = 0
+                while k < max_iter and x*x + y*y < i32_to(4):
+                    x, y = x*x - y*y + cx, i32_to(2)*x*y + cy
+                    k += 1
+                out[i, j] = k
+
+        args = (np.zeros((w, h), np.int32), T.__dict__[f'str_to_{n}']('-0.7453'), 
+                T.__dict__[f'str_to_{n}']('0.1127'), T.__dict__[f'str_to_{n}']('0.0000625'))
+        t = time.perf_counter()
+        mandelbrot(*args)
+        t_compile = time.perf_counter() - t
+        t = time.perf_counter()
+        mandelbrot(*args)
+        t = time.perf_counter() - t
+        out = args[0]
+        ref = out if ref is None else ref
+        print(f'{n:5s} compile {t_compile:5.1f} s, {out.sum()/t/1e6:6.2f} M iterations/s, '
+              f'{(out != ref).sum()} pixels differ from the first type')
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import importlib.util
+import taichi as ti
+
+# Choosing between ti.real_func and ti.func per layer.
+#
+# By default every function of mantissa128.py and float192.py is a
+# ti.real_func: compiled once and called, which keeps the compile time of big
+# kernels low, but every operation pays a call and the copies of its vector
+# arguments. An inlined layer uses ti.func instead.
+#
+# Taichi 1.7 crashes when a ti.func with runtime control flow (an if or a
+# non-static loop) is inlined into a ti.real_func. So in mantissa128 only the
+# straight-line functions follow the 'mantissa128' layer alone, the others
+# are inlined only if 'float192', which calls them, is inlined as well. For
+# the same reason an inlined 'float192' layer must only be called from
+# kernels and ti.funcs, not from user ti.real_funcs.
+#
+# The layers of the float192 package come from the FLOAT192_INLINE
+# environment variable (e.g. 'mantissa128' or 'all', read at import),
+# inline_variant builds a separate copy of the package with other layers
+# inlined, this is what supports_f192(inline=...) uses.
+
+LAYERS = ('mantissa128', 'float192') # innermost first
+
+def parse_layers(inline):
+    if inline is None or inline == 'none':
+        return frozenset()
+    if inline == 'all':
+        return frozenset(LAYERS)
+    if isinstance(inline, str):
+        inline = [layer.strip() for layer in inline.split(',') if layer.strip()]
+    ret = frozenset(inline)
+    assert ret <= set(LAYERS), f'unknown layers {set(ret) - set(LAYERS)}, use some of {LAYERS}'
+    return ret
+
+def inline_layers(package):
+    layers = getattr(sys.modules.get(package), '_inline_layers', None) # set by inline_variant
+    if layers is None:
+        layers = parse_layers(os.environ.get('FLOAT192_INLINE'))
+    return layers
+
+def layer_func(layer, package, straight_line=False):
+    # ti.func or ti.real_func for the functions of layer in package
+    layers = inline_layers(package)
+    outer = set(LAYERS[LAYERS.index(layer) + 1:])
+    inlined = layer in layers and (straight_line or outer <= layers)
+    return ti.func if inlined else ti.real_func
+
+_variants = {}
+
+def inline_variant(inline):
+    """The float192 package with the given layers inlined, e.g. inline_variant('mantissa128').add_f192."""
+    layers = parse_layers(inline)
+    if layers == inline_layers(__package__):
+        return sys.modules[__package__]
+
+    if layers not in _variants:
+        name = f'{__package__}_inline_' + ('_'.join(sorted(layers)) or 'none')
+        path = os.path.dirname(os.path.abspath(__file__))
+        spec = importlib.util.spec_from_file_location(name, os.path.join(path, '__init__.py'),
+                                                      submodule_search_locations=[path])
+        module = importlib.util.module_from_spec(spec)
+        module._inline_layers = layers
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+        _variants[layers] = module
+    return _variants[layers]
+
+
+if __name__ == '__main__':
+    # python -m float192.inlining [n]
+    # compile time (first call) and run time of the same kernels for every
+    # layer selection, each in a fresh process with an empty offline cache
+    # (with offline_cache=False Taichi 1.7 mixes up the ti.real_funcs of
+    # different kernels)
+    import json
+    import subprocess
+    
+    if len(sys.argv) > 2 and sys.argv[1] == '--child':
+        import time
+        import tempfile
+        import numpy as np
+        import float192 as ty
+        
+        n = int(sys.argv[2])
+        ti.init(arch=ti.cpu, offline_cache_file_path=tempfile.mkdtemp())
+        
+        @ti.kernel
+        def iterate(cx: ti.types.ndarray(ty.f192_t, 1), cy: ti.types.ndarray(ty.f192_t, 1), steps: ti.i32):
+            for i in cx:
+                zx, zy = cx[i], cy[i]
+                for _ in range(steps):
+                    zx, zy = (ty.add_f192(ty.sub_f192(ty.mul_f192(zx, zx), ty.mul_f192(zy, zy)), cx[i]), 
+                              ty.add_f192(ty.mul_f192_pow2(ty.mul_f192(zx, zy), 1), cy[i]))
+                cx[i], cy[i] = zx, zy
+        
+        @ti.kernel
+        def divide(a: ti.types.ndarray(ty.f192_t, 1), b: ti.types.ndarray(ty.f192_t, 1), steps: ti.i32):
+            for i in a:
+                x = a[i]
+                for _ in range(steps):
+                    x = ty.div_f192(b[i], ty.add_f192(x, b[i]))
+                a[i] = x
+        
+        rng = np.random.default_rng(0)
+        ret = {}
+        for name, kernel, lo, hi in (('iterate', iterate, -0.1, 0.1), ('divide', divide, 0.5, 2.0)):
+            a = ty.f64_to_f192_array(rng.uniform(lo, hi, n))
+            b = ty.f64_to_f192_array(rng.uniform(lo, hi, n))
+            t = time.perf_counter()
+            kernel(a[:1].copy(), b[:1].copy(), 1)
+            ret[name + ' compile s'] = time.perf_counter() - t
+            t = time.perf_counter()
+            kernel(a, b, 16)
+            ret[name + ' M ops/s'] = n*16*(5 if name == 'iterate' else 2)/(time.perf_counter() - t)/1e6
+        print(json.dumps(ret))
+    
+    else:
+        n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+        results = {}
+        for layers in ('none', 'mantissa128', 'float192', 'all'):
+            env = dict(os.environ, FLOAT192_INLINE=layers)
+            out = subprocess.run([sys.executable, '-m', 'float192.inlining', '--child', str(n)], 
+                                 env=env, capture_output=True, text=True)
+            results[layers] = json.loads(out.stdout.strip().split('\n')[-1]) if out.returncode == 0 else None
+            print(layers, results[layers] if out.returncode == 0 else out.stderr.strip().split('\n')[-1], flush=True)
@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import taichi as ti
+from mpmath import mp, mpf
+from .float192 import (f192_t, add_f192, sub_f192, mul_f192, sqr_f192, mul_f192_u32, mul_f192_pow2, div_f192, gt_f192,
+                       lt_f192, le_f192, i32_to_f192, f192_to_f64)
+from .codec import f192_array_to_mpf, mpf_to_f192_array
+from .float_n import float_type
+
+# Mandelbrot renderers for deep zooms.
+#
+# render_f192 is the kernel of mandelbrot_test.py: every pixel iterates
+# z = z**2 + c in f192. render_perturbation computes one reference orbit Z_k
+# at the center of the window in f192 (or in float_type(limbs) for zooms
+# beyond its 128 bits) and iterates only the difference of every pixel from
+# it in f64 (or f32):
+#
+#   d_{k+1} = 2*Z_k*d_k + d_k**2 + dc,   z_k = Z_k + d_k
+#
+# where dc = c - C is small, so f64 is enough for it. A pixel orbit whose
+# |z_k| falls below |d_k| has lost the precision of d_k relative to z_k (a
+# glitch), and so has one that runs past the end of the reference orbit
+# (the reference escaped first). Both are rebased: d = z_k and the
+# reference restarts at Z_0 = 0, after which the pixel continues exactly.
+#
+# The windows are given as today: x0, y0, x1, y1 as f192 values (e.g.
+# str_to_f192('-0.17032344376207073')) or strings, the image has m rows
+# (y) and n columns (x), pixel (i, j) is at c = (x0 + j/n*(x1 - x0),
+# y0 + i/m*(y1 - y0)), and holds iterations/iter_depth. The width of a
+# pixel must stay in the range of the delta type (about 1e-300 for f64).
+#
+# render_tiles is the f192 kernel for images of any size: the image is
+# rendered in tiles of tile x tile pixels, every finished tile is written to
+# a .npy file (a numpy memmap) right away, so only one tile is in memory.
+# Interior pixels do not iterate to iter_depth: the ones in the main
+# cardioid or the period 2 bulb are found by their closed forms (in f192,
+# the tests are exact near the boundary), the others by Brent's periodicity
+# check, the orbit is compared to a saved z whose index is doubled every
+# time, a cycle of any length is found within twice its preperiod plus
+# length. Since the orbit of an interior point only converges to its cycle,
+# "equal" means closer than eps (a fraction of the pixel spacing), checked
+# only when the top limbs and exponents are equal already.
+
+@ti.kernel
+def compute_f192(x0: f192_t, y0: f192_t, x1: f192_t, y1: f192_t, i0: ti.i32, j0: ti.i32, m: ti.i32, n: ti.i32,
+                 img: ti.types.ndarray(ti.f32, 2), iter_depth: ti.i32):
+    # pixels (i0 + i, j0 + j) of an m x n image into img[i, j]
+    x = sub_f192(x1, x0)
+    y = sub_f192(y1, y0)
+    four = i32_to_f192(4)
+    for i, j in img:
+        cx = add_f192(x0, mul_f192(div_f192(i32_to_f192(j0 + j), i32_to_f192(n)), x))
+        cy = add_f192(y0, mul_f192(div_f192(i32_to_f192(i0 + i), i32_to_f192(m)), y))
+        iterations = 0
+        zx = i32_to_f192(0)
+        zy = i32_to_f192(0)
+        while lt_f192(add_f192(sqr_f192(zx), sqr_f192(zy)), four) and iterations < iter_depth:
+            zx, zy = add_f192(sub_f192(sqr_f192(zx), sqr_f192(zy)), cx), add_f192(mul_f192_u32(mul_f192(zx, zy), 2), cy)
+            iterations += 1
+        img[i, j] = iterations/iter_depth
+
+def to_mpf(v):
+    # f192 value, string or mpf -> mpf
+    if isinstance(v, (str, mpf)):
+        return mpf(v)
+    v = np.asarray(v.to_numpy() if hasattr(v, 'to_numpy') else v, dtype=np.uint32)
+    return f192_array_to_mpf(v[None])[0]
+
+def to_f192(v):
+    return ti.Vector(list(mpf_to_f192_array([to_mpf(v)])[0]), ti.u32)
+
+def render_f192(x0, y0, x1, y1, m, n, iter_depth, img=None):
+    """The window in f192 for every pixel, returns img (m x n, f32)."""
+    img = np.zeros((m, n), np.float32) if img is None else img
+    compute_f192(to_f192(x0), to_f192(y0), to_f192(x1), to_f192(y1), 0, 0, m, n, img, iter_depth)
+    return img
+
+@ti.func
+def interior(cx, cy):
+    # in the main cardioid or the period 2 bulb, on the boundary included
+    quarter = mul_f192_pow2(i32_to_f192(1), -2)
+    x = sub_f192(cx, quarter)
+    y2 = sqr_f192(cy)
+    q = add_f192(sqr_f192(x), y2)
+    cardioid = le_f192(mul_f192(q, add_f192(q, x)), mul_f192_pow2(y2, -2))
+    x = add_f192(cx, i32_to_f192(1))
+    bulb = le_f192(add_f192(sqr_f192(x), y2), mul_f192_pow2(quarter, -2))
+    return cardioid or bulb
+
+@ti.kernel
+def compute_tile(x0: f192_t, y0: f192_t, x1: f192_t, y1: f192_t, i0: ti.i32, j0: ti.i32, m: ti.i32, n: ti.i32,
+                 img: ti.types.ndarray(ti.f32, 2), iter_depth: ti.i32, eps: ti.f64):
+    # compute_f192 with the interior checks
+    x = sub_f192(x1, x0)
+    y = sub_f192(y1, y0)
+    four = i32_to_f192(4)
+    for i, j in img:
+        cx = add_f192(x0, mul_f192(div_f192(i32_to_f192(j0 + j), i32_to_f192(n)), x))
+        cy = add_f192(y0, mul_f192(div_f192(i32_to_f192(i0 + i), i32_to_f192(m)), y))
+        iterations = 0
+        if interior(cx, cy):
+            iterations = iter_depth
+        zx = i32_to_f192(0)
+        zy = i32_to_f192(0)
+        sx = zx
+        sy = zy
+        power = 1
+        steps = 0
+        while lt_f192(add_f192(sqr_f192(zx), sqr_f192(zy)), four) and iterations < iter_depth:
+            zx, zy = add_f192(sub_f192(sqr_f192(zx), sqr_f192(zy)), cx), add_f192(mul_f192_u32(mul_f192(zx, zy), 2), cy)
+            iterations += 1
+            # the top limbs and exponents differ almost always outside, a miss only delays the bailout
+            if zx[3] == sx[3] and zx[5] == sx[5] and zy[3] == sy[3] and zy[5] == sy[5]:
+                if ti.abs(f192_to_f64(sub_f192(zx, sx))) + ti.abs(f192_to_f64(sub_f192(zy, sy))) < eps:
+                    iterations = iter_depth
+            steps += 1
+            if steps == power:
+                sx = zx
+                sy = zy
+                power *= 2
+                steps = 0
+        img[i, j] = iterations/iter_depth
+
+def render_tiles(x0, y0, x1, y1, m, n, iter_depth, path, tile=256):
+    """
+    The window in f192 tile by tile into the .npy file path, returns it as a
+    read-only memmap (m x n, f32).
+    """
+    x0, y0, x1, y1 = (to_f192(v) for v in (x0, y0, x1, y1))
+    with mp.workprec(192):
+        eps = float(min(abs(to_mpf(x1) - to_mpf(x0))/n, abs(to_mpf(y1) - to_mpf(y0))/m))*2.0**-20
+    out = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=(m, n))
+    for i0 in range(0, m, tile):
+        for j0 in range(0, n, tile):
+            buf = np.zeros((min(tile, m - i0), min(tile, n - j0)), np.float32)
+            compute_tile(x0, y0, x1, y1, i0, j0, m, n, buf, iter_depth, eps)
+            out[i0:i0 + buf.shape[0], j0:j0 + buf.shape[1]] = buf
+            out.flush()
+    del out
+    return np.load(path, mmap_mode='r')
+
+def make_orbit(t, add, sub, mul, sqr, gt, i32_to, to_f64):
+    @ti.kernel
+    def orbit(cx: t, cy: t, Z: ti.types.ndarray(ti.f64, 2)) -> ti.i32:
+        # Z_k = Z_{k-1}**2 + C into Z[k] until it escapes or fills Z, returns the length
+        length = 0
+        for _ in range(1):
+            zx = i32_to(0)
+            zy = i32_to(0)
+            four = i32_to(4)
+            while length < Z.shape[0]:
+                Z[length, 0] = to_f64(zx)
+                Z[length, 1] = to_f64(zy)
+                length += 1
+                if gt(add(sqr(zx), sqr(zy)), four):
+                    break
+                zx, zy = add(sub(sqr(zx), sqr(zy)), cx), add(mul(mul(zx, zy), i32_to(2)), cy)
+        return length
+    return orbit
+
+orbits = {}
+
+def reference_orbit(cx, cy, iter_depth, limbs=None):
+    """The orbit of C = cx + i*cy (mpf) in f192 or float_type(limbs) as f64, shape (length, 2)."""
+    if limbs not in orbits:
+        if limbs is None:
+            orbits[None] = (make_orbit(f192_t, add_f192, sub_f192, mul_f192, sqr_f192, gt_f192, i32_to_f192, f192_to_f64),
+                            lambda v: ti.Vector(list(mpf_to_f192_array([v])[0]), ti.u32))
+        else:
+            T = float_type(limbs)
+            get = lambda fmt: getattr(T, fmt.format(T.name))
+            orbits[limbs] = (make_orbit(get('{}_t'), get('add_{}'), get('sub_{}'), get('mul_{}'), get('sqr_{}'),
+                                        get('gt_{}'), get('i32_to_{}'), get('{}_to_f64')),
+                             lambda v: ti.Vector(list(get('mpf_to_{}_array')([v])[0]), ti.u32))
+    orbit, convert = orbits[limbs]
+    Z = np.zeros((iter_depth + 1, 2))
+    length = orbit(convert(cx), convert(cy), Z)
+    return Z[:length]
+
+def make_deltas(dtype):
+    @ti.kernel
+    def deltas(Z: ti.types.ndarray(ti.f64, 2), dcx0: ti.f64, dcy0: ti.f64, dx: ti.f64, dy: ti.f64,
+               img: ti.types.ndarray(ti.f32, 2), iter_depth: ti.i32) -> ti.i32:
+        # iterates the difference of every pixel from the reference orbit Z,
+        # pixel (i, j) is at dc = (dcx0 + j*dx, dcy0 + i*dy), returns the number of rebases
+        rebases = 0
+        length = Z.shape[0]
+        for i, j in img:
+            dcx = ti.cast(dcx0 + j*dx, dtype)
+            dcy = ti.cast(dcy0 + i*dy, dtype)
+            ddx = ti.cast(0, dtype)
+            ddy = ti.cast(0, dtype)
+            k = 0
+            iterations = 0
+            while iterations < iter_depth:
+                Zx = ti.cast(Z[k, 0], dtype)
+                Zy = ti.cast(Z[k, 1], dtype)
+                zx = Zx + ddx
+                zy = Zy + ddy
+                r2 = zx*zx + zy*zy
+                if r2 >= 4:
+                    break
+                if r2 < ddx*ddx + ddy*ddy or k == length - 1:
+                    # glitch or end of the reference: continue from Z_0 = 0 with d = z
+                    ddx, ddy = zx, zy
+                    Zx, Zy = ti.cast(0, dtype), ti.cast(0, dtype)
+                    k = 0
+                    rebases += 1
+                ddx, ddy = 2*(Zx*ddx - Zy*ddy) + ddx*ddx - ddy*ddy + dcx, 2*(Zx*ddy + Zy*ddx) + 2*ddx*ddy + dcy
+                k += 1
+                iterations += 1
+            img[i, j] = iterations/iter_depth
+        return rebases
+    return deltas
+
+delta_kernels = {}
+
+def perturbation(x0, y0, x1, y1, m, n, iter_depth, img=None, dtype=ti.f64, limbs=None):
+    # render_perturbation, also returns the reference orbit and the number of rebases
+    img = np.zeros((m, n), np.float32) if img is None else img
+    if dtype not in delta_kernels:
+        delta_kernels[dtype] = make_deltas(dtype)
+    with mp.workprec(32*(limbs or 4) + 64):
+        x0, y0, x1, y1 = (to_mpf(v) for v in (x0, y0, x1, y1))
+        cx, cy = (x0 + x1)/2, (y0 + y1)/2
+        Z = reference_orbit(cx, cy, iter_depth, limbs)
+        rebases = delta_kernels[dtype](Z, float(x0 - cx), float(y0 - cy), float((x1 - x0)/n), float((y1 - y0)/m),
+                                       img, iter_depth)
+    return img, Z, rebases
+
+def render_perturbation(x0, y0, x1, y1, m, n, iter_depth, img=None, dtype=ti.f64, limbs=None):
+    """
+    The window with perturbation theory, returns img (m x n, f32).
+    dtype: the type of the pixel deltas (ti.f64 or ti.f32)
+    limbs: the reference orbit in float_type(limbs) instead of f192
+    """
+    return perturbation(x0, y0, x1, y1, m, n, iter_depth, img, dtype, limbs)[0]
+
+
+if __name__ == '__main__':
+    # python -m float192.mandelbrot
+    # the window of mandelbrot_test.py and a deeper one, all-f192 against perturbation
+    import time
+    import tempfile
+    # the names of the package, not the ones of this __main__ module
+    import os
+    from float192 import str_to_f192, render_f192, render_tiles
+    from float192.mandelbrot import perturbation
+
+    ti.init(arch=ti.cpu, offline_cache_file_path=tempfile.mkdtemp())
+    windows = (('-0.17032344376207073', '-1.0402289976592387', '-0.1703234437620603', '-1.0402289976592325', 256, None),
+               # around the Misiurewicz point c = i
+               ('-0.000000000000000000000000000003', '0.999999999999999999999999999998',
+                '0.000000000000000000000000000003', '1.000000000000000000000000000002', 1024, 6))
+    m, n = 200, 300
+    for x0, y0, x1, y1, iter_depth, limbs in windows:
+        x0, y0, x1, y1 = (str_to_f192(v) for v in (x0, y0, x1, y1))
+        print(f'window {to_mpf(x1) - to_mpf(x0)} wide, {iter_depth} iterations')
+        for name, f in (('f192', lambda: (render_f192(x0, y0, x1, y1, m, n, iter_depth), None, None)),
+                        ('perturbation f64', lambda: perturbation(x0, y0, x1, y1, m, n, iter_depth)),
+                        ('perturbation f32', lambda: perturbation(x0, y0, x1, y1, m, n, iter_depth, dtype=ti.f32)),
+                        (f'perturbation f64, {float_type(limbs).name} reference' if limbs else None,
+                         lambda: perturbation(x0, y0, x1, y1, m, n, iter_depth, limbs=limbs))):
+            if name is None:
+                continue
+            f() # compile
+            t = time.perf_counter()
+            img, Z, rebases = f()
+            t = time.perf_counter() - t
+            if Z is None:
+                ref = img
+                print(f'  {name:34s} {t:7.3f} s')
+            else:
+                print(f'  {name:34s} {t:7.3f} s, reference {len(Z)} iterations, {rebases} rebases, '
+                      f'{(img != ref).sum()} pixels differ, {np.abs(img - ref).max()*iter_depth:.0f} iterations at most')
+
+    # tiles: a window with interior and the window of mandelbrot_test.py
+    directory = tempfile.mkdtemp()
+    for x0, y0, x1, y1, iter_depth in (('-1.5', '-1.0', '0.5', '1.0', 1024), windows[0][:5]):
+        x0, y0, x1, y1 = (str_to_f192(v) for v in (x0, y0, x1, y1))
+        print(f'window {to_mpf(x1) - to_mpf(x0)} wide, {iter_depth} iterations')
+        ref = render_f192(x0, y0, x1, y1, m, n, iter_depth)
+        t = time.perf_counter()
+        ref = render_f192(x0, y0, x1, y1, m, n, iter_depth)
+        print(f'  {"f192":34s} {time.perf_counter() - t:7.3f} s')
+        path = os.path.join(directory, 'tiles.npy')
+        render_tiles(x0, y0, x1, y1, m, n, iter_depth, path, 64)
+        t = time.perf_counter()
+        img = render_tiles(x0, y0, x1, y1, m, n, iter_depth, path, 64)
+        print(f'  {"tiles":34s} {time.perf_counter() - t:7.3f} s, {(img != ref).sum()} pixels differ, '
+              f'{(ref == 1).mean()*100:.0f}% interior')
+        t = time.perf_counter()
+        img = render_tiles(x0, y0, x1, y1, 2*m, 2*n, iter_depth, path)
+        print(f'  {"tiles, 400 x 600":34s} {time.perf_counter() - t:7.3f} s, {os.path.getsize(path)/2**20:.1f} MiB')
@@ -6,11 +6,102 @@ Created on Sat Jun 28 20:27:53 2025
 """
 
 import taichi as ti
+from .inlining import layer_func
+
+# ti.real_func or ti.func, see inlining.py, leaf_func is for straight-line
+# functions (no runtime branches or loops)
+func = layer_func('mantissa128', __package__)
+leaf_func = layer_func('mantissa128', __package__, straight_line=True)
 
 vec_6 = ti.types.vector(6, ti.u32)
 vec_8 = ti.types.vector(8, ti.u16)
+vec_8_u32 = ti.types.vector(8, ti.u32) # 256 bit intermediates
+
+# The primitives are branch-free and loop-free (except the long division):
+# the limb shifts are barrel shifters, a select per limb for every power of
+# two limbs, the bit shifts are funnel shifts of two limbs in u32 only (a
+# select covers 0 and 32 bits, where a single u32 shift would be undefined),
+# and the bit counts use the hardware count leading zeros (ti.math.clz, 32
+# for 0), so all lanes of a SIMD vector or a GPU warp run the same
+# instructions.
+
+LIMB_STAGES = {4: (1, 2), 8: (1, 2, 4)} # the barrel shifter stages per number of limbs
+
+@ti.func
+def funnel_down(hi, lo, s):
+    # the low limb of (hi, lo) >> s for s in [0, 32]
+    n = ti.u32(s)
+    ret = (lo >> (n & ti.u32(31))) | (hi << ((ti.u32(32) - n) & ti.u32(31)))
+    return ti.select(n == 0, lo, ti.select(n >= 32, hi, ret))
+
+@ti.func
+def funnel_up(hi, lo, s):
+    # the high limb of (hi, lo) << s for s in [0, 32]
+    n = ti.u32(s)
+    ret = (hi << (n & ti.u32(31))) | (lo >> ((ti.u32(32) - n) & ti.u32(31)))
+    return ti.select(n == 0, hi, ti.select(n >= 32, lo, ret))
+
+@ti.func
+def clz32(x):
+    return ti.i32(ti.math.clz(x))
+
+@ti.func
+def limbs_down(a, n, size: ti.template()):
+    # the limbs [0, size) of a shifted down by the unsigned n limbs, the others are kept
+    ret = a
+    for k in ti.static(LIMB_STAGES[size]):
+        shifted = ret
+        for i in ti.static(range(size)):
+            if ti.static(i + k < size):
+                shifted[i] = ret[i + k]
+            else:
+                shifted[i] = ti.u32(0)
+        for i in ti.static(range(size)):
+            ret[i] = ti.select(n & k, shifted[i], ret[i])
+    for i in ti.static(range(size)):
+        ret[i] = ti.select(n >= size, ti.u32(0), ret[i])
+    return ret
+
+@ti.func
+def limbs_up(a, n, size: ti.template()):
+    # the limbs [0, size) of a shifted up by the unsigned n limbs, the others are kept
+    ret = a
+    for k in ti.static(LIMB_STAGES[size]):
+        shifted = ret
+        for i in ti.static(range(size)):
+            if ti.static(i >= k):
+                shifted[i] = ret[i - k]
+            else:
+                shifted[i] = ti.u32(0)
+        for i in ti.static(range(size)):
+            ret[i] = ti.select(n & k, shifted[i], ret[i])
+    for i in ti.static(range(size)):
+        ret[i] = ti.select(n >= size, ti.u32(0), ret[i])
+    return ret
+
+@ti.func
+def bits_down(a, s, size: ti.template()):
+    # the limbs [0, size) of a shifted down by s in [0, 32] bits
+    ret = a
+    for i in ti.static(range(size)):
+        hi = ti.u32(0)
+        if ti.static(i + 1 < size):
+            hi = a[i + 1]
+        ret[i] = funnel_down(hi, a[i], s)
+    return ret
 
-@ti.real_func 
+@ti.func
+def bits_up(a, s, size: ti.template()):
+    # the limbs [0, size) of a shifted up by s in [0, 32] bits
+    ret = a
+    for i in ti.static(range(size)):
+        lo = ti.u32(0)
+        if ti.static(i > 0):
+            lo = a[i - 1]
+        ret[i] = funnel_up(a[i], lo, s)
+    return ret
+
+@leaf_func
 def add_with_carry(a: ti.u32,
                    b: ti.u32,
                    carry_in: ti.u32) -> [ti.u32, ti.u32]:
@@ -20,15 +111,14 @@ def add_with_carry(a: ti.u32,
     
     return [result, carry_out]
 
-@ti.real_func 
+@leaf_func
 def add_full_u128(a: ti.types.vector(6, ti.u32),
                   b: ti.types.vector(6, ti.u32)) -> [vec_6, ti.u32]:
     
     result = ti.Vector([0]*6, ti.u32)
     
     carry = ti.u32(0)
-    ti.loop_config(serialize=True)
-    for i in range(4):
+    for i in ti.static(range(4)):
         x = a[i]
         y = b[i]
         tmp = add_with_carry(x, y, carry)
@@ -39,58 +129,50 @@ def add_full_u128(a: ti.types.vector(6, ti.u32),
     
     return [result, carry]
 
-@ti.real_func 
+@leaf_func
 def add_u128_hi(a: ti.types.vector(6, ti.u32),
                 b: ti.types.vector(6, ti.u32)) -> [vec_6, ti.i32]:
+    # a + b, on a carry the 129 bit sum shifted down by a bit, the shift is
+    # returned
+    res, carry = add_full_u128(a, b)
     result = ti.Vector([0]*6, ti.u32)
-    overflow = False
-    
-    tmp = add_full_u128(a, b)
-    res = tmp[0]
-    carry = tmp[1]
-    
-    if carry:
-        overflow = True
-        for i in range(3):
-            result[i] = res[i+1]
-        result[3] = carry 
-    else:
-        for i in range(4):
-            result[i] = res[i]
-    
-    return [result, overflow]
+    for i in ti.static(range(4)):
+        up = carry
+        if ti.static(i < 3):
+            up = res[i + 1]
+        result[i] = funnel_down(up, res[i], carry)
+    return [result, ti.i32(carry)]
 
 
-@ti.real_func 
+@leaf_func
 def neg_u128(a: ti.types.vector(6, ti.u32)) -> vec_6:
+    # two's complement, 2**128 - a
     result = ti.Vector([0]*6, ti.u32)
-    
-    for i in range(4):
-        result[i] = ti.u32(0xffffffff)-a[i]
-    # print(result)
-    k = 0
     carry = ti.u32(1)
-    while carry:
-        temp = result[k]
-        # print(temp, carry)
-        temp, carry = add_with_carry(temp, carry, 0)
-        # print(temp, carry)
-        result[k] = temp
-        k += 1
+    for i in ti.static(range(4)):
+        result[i] = (ti.u32(0xffffffff) - a[i]) + carry
+        carry = ti.u32(result[i] < carry)
     return result
 
-@ti.real_func 
+@leaf_func
 def sub_u128(a: ti.types.vector(6, ti.u32),
              b: ti.types.vector(6, ti.u32)) -> vec_6:
-    
-    res, carry  = add_full_u128(a, neg_u128(b))
-    ret = res
-    
-    if not carry:
-        ret = neg_u128(res)
-    return ret
+    # |a - b|: a borrow chain, negated through a mask if it borrowed out
+    result = ti.Vector([0]*6, ti.u32)
+    borrow = ti.u32(0)
+    for i in ti.static(range(4)):
+        tmp = a[i] - b[i]
+        result[i] = tmp - borrow
+        borrow = ti.u32(a[i] < b[i]) | ti.u32(tmp < borrow)
+    
+    mask = ti.u32(0) - borrow
+    carry = borrow
+    for i in ti.static(range(4)):
+        result[i] = (result[i] ^ mask) + carry
+        carry = ti.u32(result[i] < carry)
+    return result
 
-@ti.real_func 
+@func
 def from_u32_to_u16(a: ti.types.vector(6, ti.u32)) -> vec_8:
     ret = ti.Vector([0]*8, ti.u16)
     
@@ -103,7 +185,7 @@ def from_u32_to_u16(a: ti.types.vector(6, ti.u32)) -> vec_8:
     
     return ret
 
-@ti.real_func 
+@func
 def from_u16_to_u32(a: ti.types.vector(8, ti.u16)) -> vec_6:
     ret = ti.Vector([0]*6, ti.u32)
     
@@ -115,227 +197,374 @@ def from_u16_to_u32(a: ti.types.vector(8, ti.u16)) -> vec_6:
     
     return ret
 
-@ti.real_func 
-def mul_u128_u16impl(a: ti.types.vector(8, ti.u16),
-                     b: ti.types.vector(8, ti.u16)) -> (vec_8, vec_8):
-    result = ti.Vector([0]*16, ti.u16)
-    hi = ti.Vector([0]*8, ti.u16)
-    lo = ti.Vector([0]*8, ti.u16)
-    
-    ti.loop_config(serialize=True)
-    for i in range(8):
-        # ti.loop_config(serialize=True)
-        for j in range(8):
-            tmp = ti.u32(ti.u32(a[i])*ti.u32(b[j]))
-            high = tmp >> 16
-            low = tmp & 0xffff
-            
-            temp = ti.u32(result[i+j]) + low
-            carry = temp >> 16
-            temp &= 0xffff
-            result[i+j] = ti.u16(temp)
-            
-            temp = ti.u32(result[i+j+1]) + high + carry
-            carry = temp >> 16
-            temp &= 0xffff
-            result[i+j+1] = ti.u16(temp)
-            
-            k = 2
-            while carry:
-                temp = ti.u32(result[i+j+k]) + carry
-                carry = temp >> 16
-                temp &= 0xffff
-                result[i+j+k] = ti.u16(temp)
-                k += 1
-    
-    for i in range(8):
-        hi[i] = result[i+8]
-        lo[i] = result[i]
-    
-    return hi, lo
-
-@ti.real_func 
+@ti.func
+def mul_u32(a: ti.u32, b: ti.u32) -> [ti.u32, ti.u32]:
+    # full 32x32 -> 64 bit product as [hi, lo] built from 16 bit halves, 
+    # inlined since it sits in the innermost (unrolled) product loop
+    a_lo, a_hi = a & ti.u32(0xffff), a >> 16
+    b_lo, b_hi = b & ti.u32(0xffff), b >> 16
+    
+    ll = a_lo*b_lo
+    lh = a_lo*b_hi
+    hl = a_hi*b_lo
+    hh = a_hi*b_hi
+    
+    mid = (ll >> 16) + (lh & ti.u32(0xffff)) + (hl & ti.u32(0xffff))
+    lo = (mid << 16) | (ll & ti.u32(0xffff))
+    hi = hh + (lh >> 16) + (hl >> 16) + (mid >> 16)
+    return [hi, lo]
+
+@ti.func
+def add_acc(c0: ti.u32, c1: ti.u32, c2: ti.u32, 
+            p_hi: ti.u32, p_lo: ti.u32) -> [ti.u32, ti.u32, ti.u32]:
+    # (c2, c1, c0) += (p_hi, p_lo), p_hi <= 0xfffffffe so adding the carry 
+    # to it can not overflow
+    c0 += p_lo
+    p_hi += ti.u32(c0 < p_lo)
+    c1 += p_hi
+    c2 += ti.u32(c1 < p_hi)
+    return [c0, c1, c2]
+
+@ti.func
+def mul_acc(c0: ti.u32, c1: ti.u32, c2: ti.u32, 
+            a: ti.u32, b: ti.u32) -> [ti.u32, ti.u32, ti.u32]:
+    # (c2, c1, c0) += a*b, the high word of a product is at most 0xfffffffe
+    p_hi, p_lo = mul_u32(a, b)
+    return add_acc(c0, c1, c2, p_hi, p_lo)
+
+@leaf_func
 def mul_full_u128(a: ti.types.vector(6, ti.u32),
                   b: ti.types.vector(6, ti.u32)) -> (vec_6, vec_6):
-    
-    a16 = from_u32_to_u16(a)
-    b16 = from_u32_to_u16(b)
-    
-    hi16, lo16 = mul_u128_u16impl(a16, b16)
-    
-    hi = from_u16_to_u32(hi16)
-    lo = from_u16_to_u32(lo16)
+    # product scanning (column by column) on the 32 bit limbs, a column holds
+    # at most 4 products so the 96 bit accumulator never overflows
+    hi = ti.Vector([0]*6, ti.u32)
+    lo = ti.Vector([0]*6, ti.u32)
+    
+    c0, c1, c2 = ti.u32(0), ti.u32(0), ti.u32(0)
+    for k in ti.static(range(7)):
+        for i in ti.static(range(max(0, k-3), min(k, 3)+1)):
+            c0, c1, c2 = mul_acc(c0, c1, c2, a[i], b[k-i])
+        
+        if ti.static(k < 4):
+            lo[k] = c0
+        else:
+            hi[k-4] = c0
+        c0, c1, c2 = c1, c2, ti.u32(0)
+    hi[3] = c0
     
     return hi, lo
 
-@ti.real_func 
+@leaf_func
 def mul_u128_lo(a: ti.types.vector(6, ti.u32),
                 b: ti.types.vector(6, ti.u32)) -> vec_6:
     
     return mul_full_u128(a, b)[1]
 
-@ti.real_func 
+@leaf_func
 def leading_zero_limbs(a: ti.types.vector(6, ti.u32)) -> ti.i32:
     ret = 0
-    flag = True 
-    
-    ti.loop_config(serialize=True)
-    for j in range(4):
-        i = 3-j
-        if a[i] == 0 and flag:
-            ret += 1
-        else:
-            flag = False
+    zero = 1
+    for j in ti.static(range(4)):
+        zero &= ti.i32(a[3 - j] == 0)
+        ret += zero
     return ret
 
-@ti.real_func
+@leaf_func
 def log2_u32(x: ti.u32) -> ti.i32:
-    low = 0
-    high = 31
+    # index of the top bit, -1 for 0
+    return 31 - clz32(x)
+
+@leaf_func
+def clz_u128(a: ti.types.vector(6, ti.u32)) -> ti.i32:
+    # leading zero bits of the mantissa, 128 for 0
+    n = leading_zero_limbs(a)
+    top = limbs_up(a, ti.u32(n), 4)[3]
+    return 32*n + ti.select(top == 0, 0, clz32(top))
+
+@leaf_func
+def normalize_u256(hi: ti.types.vector(6, ti.u32),
+                   lo: ti.types.vector(6, ti.u32)) -> [vec_6, ti.i32]:
+    # top 128 significant bits of the 256 bit number (hi, lo) and the shift 
+    # that maps them back: (hi, lo) ~ ret*2**shift
+    x = join_u256(hi, lo)
+    n = 0
+    zero = 1
+    for j in ti.static(range(8)):
+        zero &= ti.i32(x[7 - j] == 0)
+        n += zero
+    x = limbs_up(x, ti.u32(n), 8)
+    bits = ti.select(x[7] == 0, 0, clz32(x[7]))
     
-    while low <= high:
-        mid = (low + high) // 2
-        if x >> mid == 0:
-            high = mid - 1
-        else:
-            low = mid + 1
-    return high
+    ret = ti.Vector([0]*6, ti.u32)
+    for i in ti.static(range(4)):
+        ret[i] = funnel_up(x[i + 4], x[i + 3], bits)
+    return [ret, 128 - n*32 - bits]
 
-@ti.real_func 
+@leaf_func
 def mul_u128_hi(a: ti.types.vector(6, ti.u32),
                 b: ti.types.vector(6, ti.u32)) -> [vec_6, ti.i32]:
     hi, lo = mul_full_u128(a, b)
-    # print(hi, lo)
-    shift_limb = leading_zero_limbs(hi)
-    shift_bit = 0
+    ret, shift = normalize_u256(hi, lo)
+    return [ret, shift]
+
+@leaf_func
+def mul_trunc_u128(a: ti.types.vector(6, ti.u32),
+                   b: ti.types.vector(6, ti.u32)) -> (vec_6, vec_6):
+    # mul_full_u128 without the 6 partial products of the columns 0-2, only 
+    # lo[3] of the low half is returned (without the carries from below).
+    # The skipped products sum to less than 2**130, so the result is at most
+    # 4 units of the lowest limb of hi below the exact product
+    hi = ti.Vector([0]*6, ti.u32)
+    lo = ti.Vector([0]*6, ti.u32)
+    
+    c0, c1, c2 = ti.u32(0), ti.u32(0), ti.u32(0)
+    for k in ti.static(range(3, 7)):
+        for i in ti.static(range(k-3, 4)):
+            c0, c1, c2 = mul_acc(c0, c1, c2, a[i], b[k-i])
+        
+        if ti.static(k == 3):
+            lo[3] = c0
+        else:
+            hi[k-4] = c0
+        c0, c1, c2 = c1, c2, ti.u32(0)
+    hi[3] = c0
     
-    if shift_limb < 4:
-        shift_bit = 31-log2_u32(hi[3-shift_limb])
-        # print(shift_limb, shift_bit)
+    return hi, lo
+
+@leaf_func
+def mul_u128_hi_trunc(a: ti.types.vector(6, ti.u32),
+                      b: ti.types.vector(6, ti.u32)) -> [vec_6, ti.i32]:
+    # for normalized a and b the result is at most 8 units in its last place
+    # below the exact (truncated) product, i.e. the relative error is < 2**-124
+    hi, lo = mul_trunc_u128(a, b)
+    ret, shift = normalize_u256(hi, lo)
+    return [ret, shift]
+
+@leaf_func
+def sqr_full_u128(a: ti.types.vector(6, ti.u32)) -> (vec_6, vec_6):
+    # mul_full_u128(a, a), the products a[i]*a[j] and a[j]*a[i] are only 
+    # computed once (10 instead of 16 partial products)
+    hi = ti.Vector([0]*6, ti.u32)
+    lo = ti.Vector([0]*6, ti.u32)
+    
+    c0, c1, c2 = ti.u32(0), ti.u32(0), ti.u32(0)
+    for k in ti.static(range(7)):
+        for i in ti.static(range(max(0, k-3), (k+1)//2)):
+            p_hi, p_lo = mul_u32(a[i], a[k-i])
+            c0, c1, c2 = add_acc(c0, c1, c2, p_hi, p_lo)
+            c0, c1, c2 = add_acc(c0, c1, c2, p_hi, p_lo)
+        if ti.static(k % 2 == 0):
+            c0, c1, c2 = mul_acc(c0, c1, c2, a[k//2], a[k//2])
         
-        # print(hi)
-        hi = bit_shift_up_simple(hi, shift_bit)
-        # print(hi)
-        hi[0] |= lo[3] >> (32-shift_bit)
-        # lo = bit_shift_up_simple(lo, shift_bit)
+        if ti.static(k < 4):
+            lo[k] = c0
+        else:
+            hi[k-4] = c0
+        c0, c1, c2 = c1, c2, ti.u32(0)
+    hi[3] = c0
+    
+    return hi, lo
+
+@leaf_func
+def sqr_u128_hi(a: ti.types.vector(6, ti.u32)) -> [vec_6, ti.i32]:
+    hi, lo = sqr_full_u128(a)
+    ret, shift = normalize_u256(hi, lo)
+    return [ret, shift]
+
+@leaf_func
+def mul_u128_u32_hi(a: ti.types.vector(6, ti.u32), b: ti.u32) -> [vec_6, ti.i32]:
+    # top 128 bits of the 160 bit product a*b: a*b ~ ret*2**shift
+    lo = ti.Vector([0]*6, ti.u32)
+    
+    carry = ti.u32(0)
+    for i in ti.static(range(4)):
+        p_hi, p_lo = mul_u32(a[i], b)
+        lo[i] = p_lo + carry
+        carry = p_hi + ti.u32(lo[i] < p_lo)
+    
+    shift = ti.select(carry == 0, 0, 32 - clz32(carry))
+    ret = ti.Vector([0]*6, ti.u32)
+    for i in ti.static(range(4)):
+        hi = carry
+        if ti.static(i < 3):
+            hi = lo[i + 1]
+        ret[i] = funnel_down(hi, lo[i], shift)
+    return [ret, shift]
+
+@leaf_func
+def join_u256(hi: ti.types.vector(6, ti.u32), lo: ti.types.vector(6, ti.u32)) -> vec_8_u32:
+    return ti.Vector([lo[0], lo[1], lo[2], lo[3], hi[0], hi[1], hi[2], hi[3]], ti.u32)
+
+@leaf_func
+def split_u256(a: ti.types.vector(8, ti.u32)) -> (vec_6, vec_6):
+    hi = ti.Vector([a[4], a[5], a[6], a[7], 0, 0], ti.u32)
+    lo = ti.Vector([a[0], a[1], a[2], a[3], 0, 0], ti.u32)
+    return hi, lo
+
+@leaf_func
+def bit_shift_down_u256(a: ti.types.vector(8, ti.u32), shift: ti.i32) -> vec_8_u32:
+    s = ti.u32(shift)
+    return bits_down(limbs_down(a, s >> 5, 8), s & 31, 8)
+
+@leaf_func
+def add_full_u256(a: ti.types.vector(8, ti.u32),
+                  b: ti.types.vector(8, ti.u32)) -> [vec_8_u32, ti.u32]:
+    result = ti.Vector([0]*8, ti.u32)
+    carry = ti.u32(0)
+    for i in ti.static(range(8)):
+        tmp = a[i] + b[i]
+        result[i] = tmp + carry
+        carry = ti.u32(tmp < a[i]) | ti.u32(result[i] < tmp)
+    return [result, carry]
+
+@leaf_func
+def sub_u256(a: ti.types.vector(8, ti.u32),
+             b: ti.types.vector(8, ti.u32)) -> vec_8_u32:
+    # a - b for a >= b
+    result = ti.Vector([0]*8, ti.u32)
+    borrow = ti.u32(0)
+    for i in ti.static(range(8)):
+        tmp = a[i] - b[i]
+        result[i] = tmp - borrow
+        borrow = ti.u32(a[i] < b[i]) | ti.u32(tmp < borrow)
+    return result
+
+@leaf_func
+def lt_u256(a: ti.types.vector(8, ti.u32), b: ti.types.vector(8, ti.u32)) -> ti.i32:
+    # the highest differing limb decides
+    ret = 0
+    for i in ti.static(range(8)):
+        ret = ti.select(a[i] != b[i], ti.i32(a[i] < b[i]), ret)
+    return ret
+
+def make_mul_u128_hi_top(n):
+    # mul_u128_hi that only uses the top n limbs of a and b, for computations
+    # that need less than the full 128 bits (e.g. early Newton steps)
+    @leaf_func
+    def mul_u128_hi_top(a: ti.types.vector(6, ti.u32),
+                        b: ti.types.vector(6, ti.u32)) -> [vec_6, ti.i32]:
+        hi = ti.Vector([0]*6, ti.u32)
+        lo = ti.Vector([0]*6, ti.u32)
         
-        hi = limb_shift_up(hi, shift_limb)
-        # print(hi)
-        for i in range(shift_limb):
-            hi[i] = lo[4-shift_limb+i]
-    else:
-        shift_limb -= 4
-        shift_bit = 31-log2_u32(hi[3-shift_limb])
+        c0, c1, c2 = ti.u32(0), ti.u32(0), ti.u32(0)
+        for k in ti.static(range(2*(4-n), 7)):
+            for i in ti.static(range(max(4-n, k-3), min(k-(4-n), 3)+1)):
+                c0, c1, c2 = mul_acc(c0, c1, c2, a[i], b[k-i])
+            
+            if ti.static(k < 4):
+                lo[k] = c0
+            else:
+                hi[k-4] = c0
+            c0, c1, c2 = c1, c2, ti.u32(0)
+        hi[3] = c0
         
-        hi = bit_shift_up_simple(lo, shift_bit)
-        hi = limb_shift_up(hi, shift_limb)
+        ret, shift = normalize_u256(hi, lo)
+        return [ret, shift]
+    return mul_u128_hi_top
+
+# indexed by the number of limbs used
+mul_u128_hi_top = [None] + [make_mul_u128_hi_top(n) for n in range(1, 4)] + [mul_u128_hi]
+
+@func
+def div_u128_hi(a: ti.types.vector(6, ti.u32),
+                b: ti.types.vector(6, ti.u32)) -> [vec_6, ti.i32]:
+    # restoring long division of the normalized a by the normalized b: 
+    # a/b ~ ret*2**shift, where ret holds the first 128 (exact) quotient bits
+    q = u128()
+    neg_b = neg_u128(b)
+    
+    # a < b: the first quotient bit comes from 2*a
+    small = ti.u32(lt_u128(a, b))
+    carry = (a[3] >> 31) & small
+    r = bit_shift_up_simple(a, small)
+    shift = -127 - ti.i32(small)
     
-    return [hi, 128-shift_limb*32-shift_bit]
+    ti.loop_config(serialize=True)
+    for i in range(128):
+        bit = ti.u32(carry != 0 or not lt_u128(r, b))
+        d = add_full_u128(r, neg_b)[0]
+        for j in ti.static(range(4)):
+            r[j] = ti.select(bit, d[j], r[j])
+        
+        q = bit_shift_up_simple(q, 1)
+        q[0] |= bit
+        carry = r[3] >> 31
+        r = bit_shift_up_simple(r, 1)
+    
+    return [q, shift]
 
-@ti.real_func 
+@leaf_func
 def bit_shift_up_simple(a: ti.types.vector(6, ti.u32), shift: ti.u32) -> vec_6:
-    result = ti.Vector([0]*6, ti.u32)
-    if shift > 0:
-        result = ti.Vector([0]*6, ti.u32)
-        high, low = ti.u32(0), ti.u32(0)
-        
-        ti.loop_config(serialize=True)
-        for i in range(4):
-            low = (a[i] << shift) | high
-            high = a[i] >> (32-shift)
-            result[i] = low
-    else:
-        result = ti.Vector([a[i] for i in range(6)], ti.u32)
+    # shift in [0, 32), limbs 4 and 5 are kept for 0
+    result = bits_up(a, shift, 4)
+    for i in ti.static(range(4, 6)):
+        result[i] = ti.select(shift == 0, a[i], ti.u32(0))
     return result
 
-@ti.real_func 
+@leaf_func
 def limb_shift_up(a: ti.types.vector(6, ti.u32), n: ti.int32) -> vec_6:
-    result = ti.Vector([0]*6, ti.u32)
-    for i in range(4-n):
-        result[i+n] = a[i]
+    result = limbs_up(a, ti.u32(n), 4)
+    result[4] = ti.u32(0)
+    result[5] = ti.u32(0)
     return result
 
-@ti.real_func
+@leaf_func
 def bit_shift_up_u128(a: ti.types.vector(6, ti.u32), shift: ti.int32) -> vec_6:
-    n = shift//32 
-    shift %= 32 
-    result = ti.Vector([a[i] for i in range(4)])
-    if shift:
-        result = bit_shift_up_simple(a, shift)
-    
-    if n:
-        result = limb_shift_up(result, n)
-    
-    return  result
+    # limbs 4 and 5 are kept for 0
+    s = ti.u32(shift)
+    result = bits_up(limbs_up(a, s >> 5, 4), s & 31, 4)
+    for i in ti.static(range(4, 6)):
+        result[i] = ti.select(s == 0, a[i], ti.u32(0))
+    return result
 
 
-@ti.real_func 
+@leaf_func
 def bit_shift_down_simple(a: ti.types.vector(6, ti.u32), shift: ti.int32) -> vec_6:
-    result = ti.Vector([0]*6, ti.u32)
-    high, low = ti.u32(0), ti.u32(0)
-    
-    ti.loop_config(serialize=True)
-    for j in range(4):
-        i = 3-j
-        
-        low = (a[i] >> shift) | high
-        high = a[i] << (32-shift)
-        
-        result[i] = low
+    # shift in [0, 32]
+    result = bits_down(a, ti.u32(shift), 4)
+    result[4] = ti.u32(0)
+    result[5] = ti.u32(0)
     return result
 
-@ti.real_func 
+@leaf_func
 def limb_shift_down(a: ti.types.vector(6, ti.u32), n: ti.int32) -> vec_6:
-    result = ti.Vector([0]*6, ti.u32)
-    for j in range(4-n):
-        i = 3-j
-        
-        result[i-n] = a[i]
+    result = limbs_down(a, ti.u32(n), 4)
+    result[4] = ti.u32(0)
+    result[5] = ti.u32(0)
     return result
 
-@ti.real_func
+@leaf_func
 def bit_shift_down_u128(a: ti.types.vector(6, ti.u32), shift0: ti.i32) -> vec_6:
-    n = shift0//32 
-    shift = shift0%32 
-    
-    result = ti.Vector([a[i] for i in range(6)])
-    if shift:
-        result = bit_shift_down_simple(a, shift)
-    
-    if n:
-        result = limb_shift_down(result, n)
-    
-    return  result
+    # limbs 4 and 5 are kept for 0, 128 bits or more give 0
+    s = ti.u32(shift0)
+    result = bits_down(limbs_down(a, s >> 5, 4), s & 31, 4)
+    for i in ti.static(range(4, 6)):
+        result[i] = ti.select(s == 0, a[i], ti.u32(0))
+    return result
 
-@ti.real_func
+@leaf_func
 def cmp_u128(a: ti.types.vector(6, ti.u32), b: ti.types.vector(6, ti.u32)) -> ti.i32:
+    # the highest differing limb decides
     ret = 0
-    
-    ti.loop_config(serialize=True)
-    for j in range(4):
-        i = 3-j
-        if not ret:
-            if a[i] < b[i]:
-                ret = -1
-            elif a[i] > b[i]:
-                ret = 1
+    for i in ti.static(range(4)):
+        ret = ti.select(a[i] != b[i], ti.select(a[i] < b[i], -1, 1), ret)
     return ret
 
-@ti.real_func
+@leaf_func
 def lt_u128(a: ti.types.vector(6, ti.u32), b: ti.types.vector(6, ti.u32)) -> ti.i32:
     return cmp_u128(a, b) == -1
-@ti.real_func
+@leaf_func
 def gt_u128(a: ti.types.vector(6, ti.u32), b: ti.types.vector(6, ti.u32)) -> ti.i32:
     return cmp_u128(a, b) == 1
-@ti.real_func
+@leaf_func
 def eq_u128(a: ti.types.vector(6, ti.u32), b: ti.types.vector(6, ti.u32)) -> ti.i32:
     return cmp_u128(a, b) == 0
 
-@ti.real_func 
+@leaf_func
 def u128() -> vec_6:
     return ti.Vector([0]*6, ti.u32)
 
-@ti.real_func 
+@func
 def leading_zero_limbs_u16impl(a: ti.types.vector(10, ti.u16)) -> ti.i32:
     ret = 0
     flag = True 
@@ -348,7 +577,7 @@ def leading_zero_limbs_u16impl(a: ti.types.vector(10, ti.u16)) -> ti.i32:
             flag = False
     return ret
 
-@ti.real_func 
+@func
 def bit_shift_up_simple_u16impl(a: ti.types.vector(10, ti.u16), shift: ti.i32) -> ti.types.vector(10, ti.u16):
     result = ti.Vector([0]*10, ti.u16)
     high, low = ti.u16(0), ti.u16(0)
@@ -360,7 +589,7 @@ def bit_shift_up_simple_u16impl(a: ti.types.vector(10, ti.u16), shift: ti.i32) -
         result[i] = low
     return result
 
-@ti.real_func 
+@func
 def bit_shift_down_simple_u16impl(a: ti.types.vector(10, ti.u16), shift: ti.i32) -> ti.types.vector(10, ti.u16):
     result = ti.Vector([0]*10, ti.u16)
     high, low = ti.u16(0), ti.u16(0)
@@ -375,7 +604,7 @@ def bit_shift_down_simple_u16impl(a: ti.types.vector(10, ti.u16), shift: ti.i32)
         result[i] = low
     return result
 
-@ti.real_func
+@func
 def cmp_u128_u16impl(a: ti.types.vector(10, ti.u16), b: ti.types.vector(10, ti.u16)) -> ti.i32:
     ret = 0
     
@@ -389,7 +618,7 @@ def cmp_u128_u16impl(a: ti.types.vector(10, ti.u16), b: ti.types.vector(10, ti.u
                 ret = 1
     return ret
 
-@ti.real_func 
+@func
 def mul_u128_u16impl_82(a: ti.types.vector(10, ti.u16),
                         b: ti.types.vector(10, ti.u16)) -> ti.types.vector(10, ti.u16):
     result = ti.Vector([0]*10, ti.u16)
@@ -414,7 +643,7 @@ def mul_u128_u16impl_82(a: ti.types.vector(10, ti.u16),
     
     return result
 
-@ti.real_func 
+@func
 def extend_by_digit(q: ti.types.vector(10, ti.u16),
                     q_hat: ti.types.vector(10, ti.u16)) -> ti.types.vector(10, ti.u16):
     ret = ti.Vector([0]*10, ti.u16)
@@ -432,7 +661,7 @@ def extend_by_digit(q: ti.types.vector(10, ti.u16),
     
     return ret
 
-@ti.real_func 
+@func
 def sub_u128_u16impl(a: ti.types.vector(10, ti.u16), b: ti.types.vector(10, ti.u16)) -> ti.types.vector(10, ti.u16):
     ret = ti.Vector([0]*10, ti.u16)
     
@@ -450,7 +679,7 @@ def sub_u128_u16impl(a: ti.types.vector(10, ti.u16), b: ti.types.vector(10, ti.u
     
     return ret
 
-@ti.real_func
+@func
 def divmod_u128(a: ti.types.vector(6, ti.u32), 
                 b: ti.types.vector(6, ti.u32)) -> (vec_6, vec_6, ti.i32):
     zero_devision = True
@@ -546,4 +775,3 @@ def divmod_u128(a: ti.types.vector(6, ti.u32),
         r_retu32 = ti.Vector([0xffffffff]*6, ti.u32)
 
     return q_retu32, r_retu32, zero_devision
-
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import taichi as ti
+from taichi.lang.matrix import MatrixField
+from .float192 import f192_t
+from .codec import ZERO_EXP
+
+# Packed 160 bit storage of f192 numbers.
+#
+# f192_t spends a whole word (limb 4) on the sign and the error flags. The
+# mantissa is normalized, so the top bit of limb 3 is always set except for
+# zero, and the packed format stores the sign in that bit instead:
+#
+#   limbs 0-2: mantissa bits 0-95
+#   limb 3:    mantissa bits 96-126, sign in bit 31
+#   limb 4:    exponent (bias 0x80000000), 0 for zero
+#
+# Packing drops the flags and turns numbers with the exponent word 0 (below
+# 2**-2147483520, never reached in practice) into zero, every other f192
+# survives the round trip. Arrays get 20 instead of 24 bytes per element.
+#
+# Kernels load with unpack_f192 and store with pack_f192, supports_f192 does
+# that by itself for ndarray(f192p_t) arguments and global packed fields
+# (f192p_field). pack_f192_array/unpack_f192_array are the host side
+# versions, optionally keeping the flags in a side array of one byte per
+# element.
+
+f192p_t = ti.types.vector(5, ti.u32)
+
+@ti.func
+def pack_f192(a: f192_t) -> f192p_t:
+    zero = a[3] == 0
+    return ti.Vector([a[0], a[1], a[2], (a[3] & ti.u32(0x7fffffff)) | (a[4] << 31),
+                      ti.select(zero, ti.u32(0), a[5])], ti.u32)
+
+@ti.func
+def unpack_f192(p: f192p_t) -> f192_t:
+    zero = p[4] == 0
+    return ti.Vector([p[0], p[1], p[2], ti.select(zero, ti.u32(0), p[3] | ti.u32(0x80000000)),
+                      ti.select(zero, ti.u32(0), p[3] >> 31), ti.select(zero, ti.u32(ZERO_EXP), p[4])], ti.u32)
+
+def f192p_field(shape, **kwargs):
+    """A field of packed f192 numbers (kwargs go to ti.Vector.field)."""
+    return ti.Vector.field(5, ti.u32, shape=shape, **kwargs)
+
+def is_f192p_field(obj):
+    return isinstance(obj, MatrixField) and obj.n == 5 and obj.m == 1 and obj.dtype == ti.u32
+
+def pack_f192_array(a, keep_flags=False):
+    """f192 array (..., 6) -> packed array (..., 5), and the flags as np.uint8 if keep_flags."""
+    a = np.asarray(a, dtype=np.uint32)
+    zero = a[..., 3] == 0
+    ret = np.empty(a.shape[:-1] + (5,), dtype=np.uint32)
+    ret[..., :3] = a[..., :3]
+    ret[..., 3] = (a[..., 3] & np.uint32(0x7fffffff)) | ((a[..., 4] & np.uint32(1)) << np.uint32(31))
+    ret[..., 4] = np.where(zero, 0, a[..., 5])
+    if keep_flags:
+        return ret, (a[..., 4] >> np.uint32(1)).astype(np.uint8)
+    return ret
+
+def unpack_f192_array(p, flags=None):
+    """Packed array (..., 5) -> f192 array (..., 6), flags from pack_f192_array(..., keep_flags=True)."""
+    p = np.asarray(p, dtype=np.uint32)
+    zero = p[..., 4] == 0
+    ret = np.empty(p.shape[:-1] + (6,), dtype=np.uint32)
+    ret[..., :3] = np.where(zero[..., None], 0, p[..., :3])
+    ret[..., 3] = np.where(zero, 0, p[..., 3] | np.uint32(0x80000000))
+    ret[..., 4] = np.where(zero, 0, p[..., 3] >> np.uint32(31))
+    if flags is not None:
+        ret[..., 4] |= np.asarray(flags, dtype=np.uint32) << np.uint32(1)
+    ret[..., 5] = np.where(zero, ZERO_EXP, p[..., 4])
+    return ret
+
+
+if __name__ == '__main__':
+    # python -m float192.packed
+    # round trips and a memory bound kernel on ndarray(f192_t) vs ndarray(f192p_t)
+    import time
+    # the names of the package, not the ones of this __main__ module
+    from float192 import supports_f192, f192_t, f64_to_f192_array, f192_array_to_f64, i32_to_f192
+    from float192 import f192p_t, pack_f192_array, unpack_f192_array
+
+    ti.init(arch=ti.cpu)
+    n = 8_000_000
+    rng = np.random.default_rng(0)
+    x = rng.uniform(-1, 1, n)
+    x[:1000] = 0
+    a = f64_to_f192_array(x)
+    a[1000:2000, 4] |= 1 << 2
+    p, flags = pack_f192_array(a, keep_flags=True)
+    assert (unpack_f192_array(p, flags)[1000:] == a[1000:]).all()
+    assert (f192_array_to_f64(unpack_f192_array(p)) == x).all()
+
+    @ti.kernel
+    @supports_f192(globals())
+    def halve(a: ti.types.ndarray(f192_t, 1)):
+        for i in a:
+            a[i] = a[i]/i32_to_f192(2)
+
+    @ti.kernel
+    @supports_f192(globals())
+    def halve_packed(a: ti.types.ndarray(f192p_t, 1)):
+        for i in a:
+            a[i] = a[i]/i32_to_f192(2)
+
+    @ti.kernel
+    @supports_f192(globals())
+    def roundtrip(a: ti.types.ndarray(f192_t, 1), p: ti.types.ndarray(f192p_t, 1)):
+        for i in a:
+            p[i] = a[i]
+            a[i] = p[i]
+
+    b = a.copy()
+    roundtrip(b, np.zeros((n, 5), np.uint32))
+    b[:, 4] &= 1
+    assert (b[1000:] == (a[1000:] & np.array([0xffffffff]*4 + [1, 0xffffffff], np.uint32))).all()
+
+    for name, kernel, arr in (('ndarray(f192_t)', halve, a), ('ndarray(f192p_t)', halve_packed, p)):
+        kernel(arr[:1].copy())
+        t = time.perf_counter()
+        for _ in range(4):
+            kernel(arr)
+        ti.sync()
+        t = (time.perf_counter() - t)/4
+        res = f192_array_to_f64(arr if name == 'ndarray(f192_t)' else unpack_f192_array(arr))
+        print(f'{name:18s} {arr.nbytes/2**20:6.1f} MiB, {n/t/1e6:6.1f} M elements/s (error {np.abs(res - x/16).max():.1e})')
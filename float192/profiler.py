@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+import linecache
+import numpy as np
+import taichi as ti
+
+# Per line call counts of the f192 operations for supports_f192(...,
+# profile=True).
+#
+# After the operators are replaced (and the expressions hoisted and shared
+# by the Optimizer), every call of an f192 operation, comparison or
+# conversion in the generated code is wrapped as
+# tally(call, function name, line, operation name): a ti.func that
+# atomically adds 1 to the counter of its site and returns the value. A site
+# is a (function, line, operation) triple, its counter index is assigned
+# with ti.static while the kernel compiles, so the generated code (and the
+# on-disk cache) only contains the line relative to the function, the
+# report adds the first line of the function in its file. Hoisted and shared
+# expressions count where they are executed, under the line they came from.
+#
+# The counters cost an atomic add per operation (contended when the threads
+# count the same sites), so a profiled kernel runs slower, the counts do not
+# depend on it. print_op_profile() also prints the kernel profiler of Taichi
+# (the time per kernel) when ti.init(kernel_profiler=True) is on.
+
+CATEGORIES = {'add': ('add_f192',), 'sub': ('sub_f192',), 'mul': ('mul_f192', 'mul_f192_trunc', 'sqr_f192', 'mul_f192_u32', 'mul_f192_pow2'),
+              'fma': ('fma_f192',), 'div': ('div_f192', 'div_f192_f64', 'div_f192_long'),
+              'compare': ('gt_f192', 'lt_f192', 'eq_f192', 'ge_f192', 'le_f192'),
+              'convert': ('i32_to_f192', 'f32_to_f192', 'f64_to_f192', 'f192_to_f32', 'f192_to_f64'),
+              'other': ('neg_f192', 'sqrt_f192', 'rsqrt_f192', 'hypot_f192')}
+OPERATIONS = {op: category for category, ops in CATEGORIES.items() for op in ops}
+MAX_SITES = 4096
+
+calls = None # ti.field(ti.i64, MAX_SITES) once allocated
+sites = {} # (function name, line relative to the function, operation) -> index in calls
+functions = {} # function name -> (source file, first line)
+
+def register(name, path, first_line):
+    # allocates the counters before any profiled kernel compiles
+    global calls
+    if calls is None:
+        calls = ti.field(ti.i64, MAX_SITES)
+    functions[name] = (path, first_line)
+
+def site(name, line, op):
+    if (name, line, op) not in sites:
+        assert len(sites) < MAX_SITES, f'more than {MAX_SITES} profiled f192 operations'
+        sites[name, line, op] = len(sites)
+    return sites[name, line, op]
+
+@ti.func
+def tally(ret, name: ti.template(), line: ti.template(), op: ti.template()):
+    ti.atomic_add(calls[ti.static(site(name, line, op))], 1)
+    return ret
+
+def op_counts(name=None):
+    """
+    The executed f192 operations since the last reset as {function name:
+    {absolute line: {operation: count}}}, or the {line: {operation: count}}
+    of one function.
+    """
+    table = calls.to_numpy() if calls is not None else np.zeros(0, np.int64)
+    ret = {}
+    for (fn, line, op), i in sites.items():
+        if table[i]:
+            first_line = functions.get(fn, (None, 1))[1]
+            ret.setdefault(fn, {}).setdefault(first_line + line - 1, {})[op] = int(table[i])
+    if name is not None:
+        return ret.get(name, {})
+    return ret
+
+def reset_op_counts():
+    """Sets all operation counters to zero."""
+    if calls is not None:
+        calls.fill(0)
+
+def print_op_profile(top=20):
+    """
+    Per function: the share of each operation category, then the top lines
+    by the number of f192 operations with their source. Followed by the
+    kernel profiler of Taichi if it is on.
+    """
+    for fn, lines in sorted(op_counts().items(), key=lambda kv: -sum(sum(ops.values()) for ops in kv[1].values())):
+        path = functions.get(fn, ('?', 1))[0]
+        total = sum(sum(ops.values()) for ops in lines.values())
+        per_category = {}
+        for ops in lines.values():
+            for op, n in ops.items():
+                per_category[OPERATIONS.get(op, 'other')] = per_category.get(OPERATIONS.get(op, 'other'), 0) + n
+        shares = ', '.join(f'{c} {n/total:.0%}' for c, n in sorted(per_category.items(), key=lambda kv: -kv[1]))
+        print(f'{fn} ({path}): {total:.3g} f192 operations, {shares}')
+        print(f'{"line":>6s} {"calls":>9s} {"share":>6s}  {"operations":44s} source')
+        for line, ops in sorted(lines.items(), key=lambda kv: -sum(kv[1].values()))[:top]:
+            n = sum(ops.values())
+            detail = ', '.join(f'{op} {k:.3g}' for op, k in sorted(ops.items(), key=lambda kv: -kv[1]))
+            print(f'{line:6d} {n:9.3g} {n/total:6.1%}  {detail:44s} {linecache.getline(path, line).strip()}')
+        print()
+    if ti.lang.impl.current_cfg().kernel_profiler:
+        ti.profiler.print_kernel_profiler_info()
+
+
+if __name__ == '__main__':
+    # python -m float192.profiler
+    # the report of a small Mandelbrot kernel and the cost of profile=True
+    import time
+    # the names of the package, not the ones of this __main__ module
+    from float192 import supports_f192, f192_t, str_to_f192, i32_to_f192, print_op_profile, reset_op_counts
+    
+    ti.init(arch=ti.cpu, kernel_profiler=True)
+    
+    def kernel(profile):
+        @ti.kernel
+        @supports_f192(globals(), profile=profile)
+        def mandelbrot(x0: f192_t, y0: f192_t, x1: f192_t, y1: f192_t, img: ti.types.ndarray(ti.f32, 2), iter_depth: ti.i32):
+            m, n = img.shape
+            for i, j in ti.ndrange(m, n):
+                cx = x0 + i32_to_f192(j)/i32_to_f192(n)*(x1 - x0)
+                cy = y0 + i32_to_f192(i)/i32_to_f192(m)*(y1 - y0)
+                zx = i32_to_f192(0)
+                zy = i32_to_f192(0)
+                k = 0
+                while zx*zx + zy*zy < i32_to_f192(4) and k < iter_depth:
+                    t = zx*zx - zy*zy + cx
+                    zy = i32_to_f192(2)*zx*zy + cy
+                    zx = t
+                    k += 1
+                img[i, j] = k/iter_depth
+        return mandelbrot
+    
+    window = [str_to_f192(s) for s in ('-0.17032344376207073', '-1.0402289976592387', '-0.1703234437620603', '-1.0402289976592325')]
+    img = np.zeros((80, 120), dtype=np.float32)
+    for profile in (False, True):
+        mandelbrot = kernel(profile)
+        mandelbrot(*window, img, 256)
+        reset_op_counts()
+        t = time.perf_counter()
+        mandelbrot(*window, img, 256)
+        print(f'profile={profile!s:5s} {time.perf_counter() - t:.3f} s')
+    ti.profiler.clear_kernel_profiler_info()
+    reset_op_counts()
+    mandelbrot(*window, img, 256)
+    print()
+    print_op_profile()
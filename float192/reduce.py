@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import taichi as ti
+from mpmath import mp, mpf
+from .float192 import f192_t, add_f192, mul_f192, sqr_f192
+from .codec import f192_array_to_mpf, mpf_to_f192_array, EXP_BIAS
+
+# Parallel reductions over f192 arrays: sum, dot product, norm, min and max.
+#
+# There is no atomic add for f192_t, so the reductions are trees with a
+# fixed shape: every block of BLOCK consecutive elements is reduced by a
+# static binary tree (one block per thread, blocks in parallel), then the
+# block results are combined pairwise, (0, 1), (2, 3), ..., in passes that
+# halve the array until one value is left. The pairing only depends on the
+# index, so the result is the same for any number of threads and backends,
+# and the rounding error grows with log2(n) instead of n.
+#
+# exact=True (sum, dot and norm) accumulates into a fixed-point
+# superaccumulator instead: every block adds the 32 bit pieces of its
+# mantissas into a u32 word and a carry word per limb of a window of
+# EXACT_BITS bits below the largest exponent (only 32-bit integers, like
+# mantissa128.py), the limbs of all blocks are summed as integers and the
+# exact total is rounded once to f192 on the host. Integer sums do not
+# depend on the order, elements more than EXACT_BITS - 160 bits below the
+# largest one lose the bits below the window. dot and norm round the
+# products to f192 before the exact sum.
+#
+# The functions take a 1D Taichi ndarray of f192_t or a numpy f192 array of
+# any shape (see codec.py) and return the result as an f192 array of shape
+# (6,).
+
+BLOCK = 16 # elements of the block-local trees
+EXACT_BLOCK = 1 << 16 # elements per superaccumulator
+EXACT_BITS = 2048
+
+@ti.func
+def tree(load: ti.template(), combine: ti.template(), a: ti.template(), b: ti.template(), start, n, size: ti.template()):
+    # reduction of a[start:start + size], the result and whether any element was in range
+    if ti.static(size == 1):
+        return load(a, b, ti.min(start, n - 1)), start < n
+    else:
+        x, vx = tree(load, combine, a, b, start, n, size//2)
+        y, vy = tree(load, combine, a, b, start + size//2, n, size//2)
+        ret = x
+        if vx and vy:
+            ret = combine(x, y)
+        return ret, vx
+
+def make_reduction(load, combine):
+    # kernels of a reduction: blocks(a, b, out) reduces the blocks of a (and
+    # b) to out, halve(p, m, q) combines the pairs of p[:m] to q
+    @ti.kernel
+    def blocks(a: ti.types.ndarray(f192_t, 1), b: ti.types.ndarray(f192_t, 1), out: ti.types.ndarray(f192_t, 1)):
+        n = a.shape[0]
+        for k in range(out.shape[0]):
+            ret, _ = tree(load, combine, a, b, k*BLOCK, n, BLOCK)
+            out[k] = ret
+
+    @ti.kernel
+    def halve(p: ti.types.ndarray(f192_t, 1), m: ti.i32, q: ti.types.ndarray(f192_t, 1)):
+        for i in range((m + 1)//2):
+            if 2*i + 1 < m:
+                q[i] = combine(p[2*i], p[2*i + 1])
+            else:
+                q[i] = p[2*i]
+    return blocks, halve
+
+@ti.func
+def load_value(a: ti.template(), b: ti.template(), i):
+    return a[i]
+
+@ti.func
+def load_product(a: ti.template(), b: ti.template(), i):
+    return mul_f192(a[i], b[i])
+
+@ti.func
+def load_square(a: ti.template(), b: ti.template(), i):
+    return sqr_f192(a[i])
+
+@ti.func
+def order(x, y):
+    # -1, 0 or 1 by the sign, the exponent and the mantissa limbs, zeros of
+    # any sign are equal. Like cmp_f192, but min and max only rely on the
+    # normalized layout, not on the comparisons of float192.py
+    zx = (x[0] | x[1] | x[2] | x[3]) == 0
+    zy = (y[0] | y[1] | y[2] | y[3]) == 0
+    mag = 0
+    for i in ti.static(range(4)):
+        mag = ti.select(x[i] != y[i], ti.select(x[i] > y[i], 1, -1), mag)
+    mag = ti.select(x[5] != y[5], ti.select(x[5] > y[5], 1, -1), mag)
+    mag = ti.select(zx, ti.select(zy, 0, -1), ti.select(zy, 1, mag))
+    neg_x = (x[4] & 1) == 1 and not zx
+    neg_y = (y[4] & 1) == 1 and not zy
+    return ti.select(neg_x != neg_y, ti.select(neg_x, -1, 1), ti.select(neg_x, -mag, mag))
+
+@ti.func
+def smaller(x, y):
+    return ti.select(order(y, x) < 0, y, x)
+
+@ti.func
+def larger(x, y):
+    return ti.select(order(y, x) > 0, y, x)
+
+reductions = {}
+
+def reduction(name):
+    if name not in reductions:
+        load, combine = {'sum': (load_value, add_f192), 'dot': (load_product, add_f192), 'norm': (load_square, add_f192),
+                         'min': (load_value, smaller), 'max': (load_value, larger)}[name]
+        reductions[name] = make_reduction(load, combine)
+    return reductions[name]
+
+def as_f192_array(a):
+    # Taichi ndarrays stay on the device, numpy arrays are flattened
+    if isinstance(a, ti.Ndarray):
+        assert len(a.shape) == 1, 'Taichi ndarrays must be 1D'
+        return a
+    a = np.ascontiguousarray(a, dtype=np.uint32).reshape(-1, 6)
+    assert len(a) > 0, 'empty array'
+    return a
+
+def reduce(name, a, b=None):
+    a = as_f192_array(a)
+    b = a if b is None else as_f192_array(b)
+    assert a.shape == b.shape, 'the arrays must have the same shape'
+    blocks, halve = reduction(name)
+    m = -(-a.shape[0]//BLOCK)
+    p = ti.ndarray(f192_t, m)
+    q = ti.ndarray(f192_t, (m + 1)//2)
+    blocks(a, b, p)
+    while m > 1:
+        halve(p, m, q)
+        m = (m + 1)//2
+        p, q = q, p
+    return p.to_numpy()[0]
+
+def make_accumulate(load):
+    @ti.kernel
+    def max_exponent(a: ti.types.ndarray(f192_t, 1), b: ti.types.ndarray(f192_t, 1)) -> ti.u32:
+        # of the nonzero elements, 0 if there is none
+        ret = ti.u32(0)
+        for i in a:
+            x = load(a, b, i)
+            if x[3] != 0:
+                ti.atomic_max(ret, x[5])
+        return ret
+
+    @ti.kernel
+    def accumulate(a: ti.types.ndarray(f192_t, 1), b: ti.types.ndarray(f192_t, 1), top: ti.u32,
+                   acc: ti.types.ndarray(ti.u32, 3)):
+        # acc[k, j] = sum of the signed 32 bit pieces of block k at 2**(32*j) of the window,
+        # as the word acc[k, j, 0] and the carry word acc[k, j, 1] (carries minus borrows)
+        n = a.shape[0]
+        limbs = acc.shape[1]
+        for k in range(acc.shape[0]):
+            for j in range(limbs):
+                acc[k, j, 0] = ti.u32(0)
+                acc[k, j, 1] = ti.u32(0)
+            for i in range(k*EXACT_BLOCK, ti.min(n, (k + 1)*EXACT_BLOCK)):
+                x = load(a, b, i)
+                gap = top - x[5]
+                if x[3] != 0 and gap <= ti.u32(limbs*32):
+                    # x = mant*2**offset in units of the window
+                    offset = limbs*32 - 160 - ti.i32(gap)
+                    base = offset >> 5
+                    s = ti.u32(offset & 31)
+                    for c in ti.static(range(5)):
+                        lo = ti.u32(0)
+                        hi = ti.u32(0)
+                        if ti.static(c < 4):
+                            lo = x[c] << s
+                        if ti.static(c > 0):
+                            hi = ti.select(s == 0, ti.u32(0), x[c - 1] >> ((ti.u32(32) - s) & ti.u32(31)))
+                        piece = lo | hi
+                        if base + c >= 0:
+                            w = acc[k, base + c, 0]
+                            if x[4] & 1:
+                                acc[k, base + c, 0] = w - piece
+                                acc[k, base + c, 1] -= ti.u32(w < piece)
+                            else:
+                                acc[k, base + c, 0] = w + piece
+                                acc[k, base + c, 1] += ti.u32(w + piece < w)
+
+    @ti.kernel
+    def total(acc: ti.types.ndarray(ti.u32, 3), out: ti.types.ndarray(ti.u32, 2)):
+        for j in range(acc.shape[1]):
+            w = ti.u32(0)
+            carry = ti.u32(0)
+            for k in range(acc.shape[0]):
+                x = acc[k, j, 0]
+                w += x
+                carry += acc[k, j, 1] + ti.u32(w < x)
+            out[j, 0] = w
+            out[j, 1] = carry
+    return max_exponent, accumulate, total
+
+accumulators = {}
+
+def exact_reduce(name, a, b=None):
+    a = as_f192_array(a)
+    b = a if b is None else as_f192_array(b)
+    assert a.shape == b.shape, 'the arrays must have the same shape'
+    load = {'sum': load_value, 'dot': load_product, 'norm': load_square}[name]
+    if name not in accumulators:
+        accumulators[name] = make_accumulate(load)
+    max_exponent, accumulate, total = accumulators[name]
+
+    top = max_exponent(a, b)
+    limbs = EXACT_BITS//32
+    acc = ti.ndarray(ti.u32, (-(-a.shape[0]//EXACT_BLOCK), limbs, 2))
+    accumulate(a, b, top, acc)
+    out = np.zeros((limbs, 2), np.uint32)
+    total(acc, out)
+
+    with mp.workprec(EXACT_BITS + 64):
+        # the carry words are signed, at most n in magnitude
+        s = sum((int(w) + (int(c) << 32)) << (32*j) for j, (w, c) in enumerate(zip(out[:, 0], out[:, 1].view(np.int32))))
+        # the element with the exponent top sits at bit limbs*32 - 160
+        value = mpf(s)*mpf(2)**(int(top) - EXP_BIAS - (limbs*32 - 160))
+        return mpf_to_f192_array([value])[0]
+
+def sum_f192(a, exact=False):
+    """Sum of the elements of an f192 array."""
+    return exact_reduce('sum', a) if exact else reduce('sum', a)
+
+def dot_f192(a, b, exact=False):
+    """Sum of a*b of two f192 arrays of the same shape."""
+    return exact_reduce('dot', a, b) if exact else reduce('dot', a, b)
+
+def norm_f192(a, exact=False):
+    """Euclidean norm of an f192 array, the square root is taken on the host."""
+    s = exact_reduce('norm', a) if exact else reduce('norm', a)
+    return mpf_to_f192_array([mp.sqrt(f192_array_to_mpf(s[None])[0])])[0]
+
+def min_f192(a):
+    """Smallest element of an f192 array."""
+    return reduce('min', a)
+
+def max_f192(a):
+    """Largest element of an f192 array."""
+    return reduce('max', a)
+
+
+if __name__ == '__main__':
+    # python -m float192.reduce [n]
+    # throughput of the reductions and their error against the exact sum
+    import sys
+    import time
+    # the names of the package, not the ones of this __main__ module
+    from float192 import f64_to_f192_array, sum_f192, dot_f192, norm_f192, min_f192, max_f192
+
+    ti.init(arch=ti.cpu)
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000
+    rng = np.random.default_rng(0)
+    a = ti.ndarray(f192_t, n)
+    b = ti.ndarray(f192_t, n)
+    a.from_numpy(f64_to_f192_array(rng.uniform(0.5, 1, n)*2.0**rng.integers(-30, 30, n)))
+    b.from_numpy(f64_to_f192_array(rng.uniform(0.5, 1, n)))
+
+    with mp.workprec(300):
+        for name, f in (('sum', lambda e: sum_f192(a, exact=e)), ('dot', lambda e: dot_f192(a, b, exact=e)),
+                        ('norm', lambda e: norm_f192(a, exact=e))):
+            values = []
+            for e in (False, True):
+                f(e) # compile
+                t = time.perf_counter()
+                values.append(f192_array_to_mpf(f(e)[None])[0])
+                t = time.perf_counter() - t
+                print(f'{name:4s} {"exact" if e else "tree ":5s} {n/t/1e6:7.2f} M elements/s')
+            print(f'     tree - exact: {float(abs(values[0] - values[1])/abs(values[1])):.1e} relative')
+        for name, f in (('min', min_f192), ('max', max_f192)):
+            f(a)
+            t = time.perf_counter()
+            f(a)
+            print(f'{name:4s}       {n/(time.perf_counter() - t)/1e6:7.2f} M elements/s')
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import taichi as ti
+from taichi.lang.matrix import MatrixField
+
+# Struct-of-arrays storage of f192 numbers.
+#
+# An ndarray(f192_t) or an f192 vector field stores the 6 limbs of an element
+# next to each other (array of structs), so every access moves all 24 bytes.
+# The containers here keep each limb in its own plane instead: a loop over
+# the elements reads 6 contiguous streams that vectorize well, and code that
+# only needs some limbs (the sign and exponent for a zero test or a maximum
+# exponent) only touches those planes.
+#
+# f192_field: a ti.Vector.field with ti.Layout.SOA. Its elements are still
+#   f192_t vectors, so it works everywhere an f192 field does. supports_f192
+#   recognizes global f192 fields and template arguments annotated with
+#   f192_field_t.
+# f192_soa_ndarray: a u32 ndarray with the limb as the first axis, shape
+#   (6, *shape). For kernel arguments annotated with soa_ndarray(ndim)
+#   supports_f192 turns x[I] into the f192_t of the 6 planes, x[I] = v into
+#   6 stores, x.shape into the shape without the limb axis and a struct-for
+#   over x into a loop over that shape.
+
+f192_field_t = ti.template() # annotation of f192 fields passed to kernels
+
+
+class SoA:
+    # the type TypeAnnotator gives to arguments annotated with soa_ndarray
+    def __init__(self, ndim):
+        self.ndim = ndim
+
+
+def f192_field(shape, soa=True, **kwargs):
+    """An f192 field, one plane per limb if soa (kwargs go to ti.Vector.field)."""
+    return ti.Vector.field(6, ti.u32, shape=shape, layout=ti.Layout.SOA if soa else ti.Layout.AOS, **kwargs)
+
+def is_f192_field(obj):
+    return isinstance(obj, MatrixField) and obj.n == 6 and obj.m == 1 and obj.dtype == ti.u32
+
+def soa_ndarray(ndim):
+    """Kernel argument annotation of an f192 SoA ndarray with ndim element axes."""
+    ret = ti.types.ndarray(ti.u32, ndim + 1)
+    ret.f192_soa_ndim = ndim
+    return ret
+
+def f192_soa_ndarray(shape):
+    """A Taichi ndarray for f192 numbers with one plane per limb."""
+    shape = (shape,) if isinstance(shape, int) else tuple(shape)
+    return ti.ndarray(ti.u32, (6, *shape))
+
+def to_soa(a):
+    """f192 array of shape (..., 6) (see codec.py) -> numpy array of shape (6, ...)."""
+    return np.ascontiguousarray(np.moveaxis(np.asarray(a, dtype=np.uint32), -1, 0))
+
+def from_soa(a):
+    """Numpy array (or Taichi ndarray) of shape (6, ...) -> f192 array of shape (..., 6)."""
+    a = a.to_numpy() if hasattr(a, 'to_numpy') else np.asarray(a, dtype=np.uint32)
+    return np.ascontiguousarray(np.moveaxis(a, 0, -1))
+
+
+if __name__ == '__main__':
+    # python -m float192.soa
+    # the same kernels on an ndarray(f192_t), an AoS field, an SoA field and
+    # an SoA ndarray
+    import time
+    # the names of the package, not the ones of this __main__ module
+    from float192 import supports_f192, f192_t, f64_to_f192_array, f192_array_to_f64
+    from float192 import f192_field, f192_field_t, soa_ndarray, to_soa, from_soa
+
+    ti.init(arch=ti.cpu)
+    n = 4_000_000
+    rng = np.random.default_rng(0)
+    a_np = f64_to_f192_array(rng.uniform(-1, 1, n))
+    b_np = f64_to_f192_array(rng.uniform(-1, 1, n))
+
+    aos = {'a': f192_field(n, soa=False), 'b': f192_field(n, soa=False)}
+    soa = {'a': f192_field(n), 'b': f192_field(n)}
+    for fields in (aos, soa):
+        fields['a'].from_numpy(a_np)
+        fields['b'].from_numpy(b_np)
+
+    @ti.kernel
+    @supports_f192(globals())
+    def add_nd(a: ti.types.ndarray(f192_t, 1), b: ti.types.ndarray(f192_t, 1)):
+        for i in a:
+            a[i] = a[i] + b[i]
+
+    @ti.kernel
+    @supports_f192(globals())
+    def add_field(a: f192_field_t, b: f192_field_t):
+        for i in a:
+            a[i] = a[i] + b[i]
+
+    @ti.kernel
+    @supports_f192(globals())
+    def add_soa(a: soa_ndarray(1), b: soa_ndarray(1)):
+        for i in a:
+            a[i] = a[i] + b[i]
+
+    # only the sign and the exponent
+    @ti.kernel
+    def max_exp_nd(a: ti.types.ndarray(f192_t, 1)) -> ti.u32:
+        ret = ti.u32(0)
+        for i in a:
+            if a[i][4] & 1 == 0:
+                ti.atomic_max(ret, a[i][5])
+        return ret
+
+    @ti.kernel
+    def max_exp_field(a: f192_field_t) -> ti.u32:
+        ret = ti.u32(0)
+        for i in a:
+            if a[i][4] & 1 == 0:
+                ti.atomic_max(ret, a[i][5])
+        return ret
+
+    @ti.kernel
+    def max_exp_soa(a: soa_ndarray(1)) -> ti.u32:
+        ret = ti.u32(0)
+        for i in range(a.shape[1]):
+            if a[4, i] & 1 == 0:
+                ti.atomic_max(ret, a[5, i])
+        return ret
+
+    a_soa, b_soa = to_soa(a_np), to_soa(b_np)
+    cases = {'ndarray(f192_t)': (add_nd, max_exp_nd, (a_np.copy(), b_np)),
+             'AoS field': (add_field, max_exp_field, (aos['a'], aos['b'])),
+             'SoA field': (add_field, max_exp_field, (soa['a'], soa['b'])),
+             'SoA ndarray': (add_soa, max_exp_soa, (a_soa, b_soa))}
+    ref = f192_array_to_f64(a_np) + f192_array_to_f64(b_np)
+
+    for name, (add, max_exp, args) in cases.items():
+        add(*args) # compile
+        max_exp(args[0])
+        t = time.perf_counter()
+        exp = max_exp(args[0])
+        t_exp = time.perf_counter() - t
+        t = time.perf_counter()
+        add(*args)
+        ti.sync()
+        t_add = time.perf_counter() - t
+
+        res = args[0]
+        res = from_soa(res) if name == 'SoA ndarray' else res if isinstance(res, np.ndarray) else res.to_numpy()
+        err = np.abs(f192_array_to_f64(res) - (ref + f192_array_to_f64(b_np))).max()
+        print(f'{name:16s} add {n/t_add/1e6:6.2f} M/s, max exponent {n/t_exp/1e6:8.1f} M/s (error {err:.1e}, {exp:#x})')